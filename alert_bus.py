@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from groq_api import fetch_disaster_alerts
+from alert_store import TRACKING_FIELDS
+from quota import quota_priority, PRIORITY_BACKGROUND
+
+# Subscribers are grouped into cells of this size (degrees) so each area is polled once
+CELL_SIZE = 0.05
+POLL_INTERVAL = 30  # seconds
+SUBSCRIBER_TIMEOUT = 600  # drop sessions that stopped draining their queue
+MAX_PENDING = 100  # per-session queue bound
+# Fields that differ between polls of an unchanged alert: the store's tracking
+# fields, and the timestamp, which sources without an event time stamp at poll time
+POLL_FIELDS = TRACKING_FIELDS + ('timestamp',)
+
+def location_cell(location, cell_size=CELL_SIZE):
+    """Snap a location to its grid cell"""
+    return (round(location['lat'] / cell_size), round(location['lng'] / cell_size))
+
+def cell_center(cell, cell_size=CELL_SIZE):
+    """Center coordinates of a grid cell"""
+    return {'lat': cell[0] * cell_size, 'lng': cell[1] * cell_size}
+
+def alert_key(alert):
+    """Identity of an alert across polls"""
+    return alert.id
+
+def alert_signature(alert):
+    """An alert's content without its poll fields, for change detection"""
+    return tuple(getattr(alert, name) for name in alert.__slots__ if name not in POLL_FIELDS)
+
+class AlertBus:
+    """
+    Server-side alert bus shared by all sessions
+    A background thread polls the alert sources once per subscribed cell, diffs
+    each poll against the previous one and pushes only new or changed alerts
+    to the queues of the sessions subscribed to that cell
+    """
+
+    def __init__(self, poll=fetch_disaster_alerts, poll_interval=POLL_INTERVAL):
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self._subscribers = {}
+        self._cell_state = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self.stats = {'polls': 0, 'poll_errors': 0, 'pushed': 0, 'listener_errors': 0}
+
+    def add_listener(self, listener):
+        """Call listener(cell, alerts, changed) after every poll of a cell"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def subscribe(self, session_id, location):
+        """Subscribe a session to alerts around its location (idempotent, also keeps it alive)"""
+        cell = location_cell(location)
+        with self._lock:
+            subscriber = self._subscribers.get(session_id)
+            if subscriber is None:
+                subscriber = {'queue': deque(maxlen=MAX_PENDING)}
+                self._subscribers[session_id] = subscriber
+            subscriber['cell'] = cell
+            subscriber['last_seen'] = time.time()
+        self._ensure_running()
+
+    def unsubscribe(self, session_id):
+        """Remove a session from the bus"""
+        with self._lock:
+            self._subscribers.pop(session_id, None)
+
+    def drain(self, session_id):
+        """Return and clear the alerts pushed to a session since its last drain"""
+        with self._lock:
+            subscriber = self._subscribers.get(session_id)
+            if subscriber is None:
+                return []
+            subscriber['last_seen'] = time.time()
+            pending = list(subscriber['queue'])
+            subscriber['queue'].clear()
+        return pending
+
+    def publish(self, cell, alerts):
+        """
+        Diff a new poll of a cell against its last state and push the difference
+        Returns the list of new or changed alerts
+        """
+        current = {alert_key(alert): alert for alert in alerts}
+        with self._lock:
+            previous = self._cell_state.get(cell)
+            self._cell_state[cell] = current
+            # The first poll of a cell only seeds its state; sessions already render those alerts
+            if previous is None:
+                return []
+            # Poll fields move on every poll; only new alerts or changed content are pushed
+            changed = [alert for key, alert in current.items()
+                       if key not in previous or alert_signature(previous[key]) != alert_signature(alert)]
+            if changed:
+                for subscriber in self._subscribers.values():
+                    if subscriber['cell'] == cell:
+                        subscriber['queue'].extend(changed)
+                        self.stats['pushed'] += len(changed)
+        return changed
+
+    def poll_once(self):
+        """Poll every subscribed cell once"""
+        now = time.time()
+        with self._lock:
+            for session_id, subscriber in list(self._subscribers.items()):
+                if now - subscriber['last_seen'] > SUBSCRIBER_TIMEOUT:
+                    del self._subscribers[session_id]
+            cells = {subscriber['cell'] for subscriber in self._subscribers.values()}
+            # Forget state of cells nobody listens to anymore
+            for cell in list(self._cell_state):
+                if cell not in cells:
+                    del self._cell_state[cell]
+
+        for cell in cells:
+            try:
+                alerts = self.poll(cell_center(cell))
+                self.stats['polls'] += 1
+            except Exception:
+                self.stats['poll_errors'] += 1
+                continue
+            changed = self.publish(cell, alerts or [])
+            for listener in self._listeners:
+                try:
+                    listener(cell, alerts or [], changed)
+                except Exception:
+                    self.stats['listener_errors'] += 1
+
+    def _run(self):
+        while True:
+            # Polling is a background refresh and gives way to user requests
+            with quota_priority(PRIORITY_BACKGROUND):
+                self.poll_once()
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            time.sleep(self.poll_interval)
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-bus", daemon=True)
+                self._thread.start()
+
+_bus = None
+_bus_lock = threading.Lock()
+
+def get_alert_bus():
+    """Process-wide alert bus"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = AlertBus()
+        return _bus
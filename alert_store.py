@@ -0,0 +1,95 @@
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime
+
+# How long (seconds) an alert stays active after the last poll that reported it
+ALERT_TTL = {
+    'weather': 3600,
+    'air_quality': 3600,
+    'earthquake': 24 * 3600,
+    'traffic': 1800,
+}
+DEFAULT_TTL = 3600
+
+# Fields the store maintains itself; they change on every poll and are not part of an alert's content
+TRACKING_FIELDS = ('first_seen', 'last_seen', 'expires_at')
+
+def make_alert_id(source, *parts):
+    """Stable alert id derived from the source event, e.g. make_alert_id('usgs', feature['id'])"""
+    return ':'.join([source] + [str(part) for part in parts])
+
+def alert_content(alert):
+    """An alert's fields without its tracking fields, for change detection"""
+    return tuple(getattr(alert, name) for name in alert.__slots__ if name not in TRACKING_FIELDS)
+
+class AlertStore:
+    """
+    Process-wide store of alerts keyed by their stable id
+    Every alert keeps the time it was first seen across polls and sessions, the
+    time it was last reported and when it expires. An alert that is reported
+    again after it expired counts as new.
+    """
+
+    def __init__(self, ttl=ALERT_TTL):
+        self.ttl = ttl
+        self._alerts = {}
+        self._lock = threading.Lock()
+
+    def observe(self, alerts, now=None):
+        """
+        Record a poll of Alert records and return them with their timestamps
+        Alerts need a stable id (see make_alert_id); alerts that already carry an
+        expires_at use it instead of their type's TTL. Returned alerts get
+        first_seen/last_seen/expires_at in epoch seconds, and a timestamp of when the
+        event happened (their own if they brought one, otherwise first_seen).
+        """
+        now = time.time() if now is None else now
+        observed = []
+        with self._lock:
+            self._prune(now)
+            for alert in alerts:
+                known = self._alerts.get(alert.id)
+                first_seen = known.first_seen if known else now
+                record = replace(
+                    alert,
+                    first_seen=first_seen,
+                    last_seen=now,
+                    expires_at=alert.expires_at or now + self.ttl.get(alert.type, DEFAULT_TTL),
+                    timestamp=alert.timestamp or datetime.fromtimestamp(first_seen).isoformat()
+                )
+                # Records are never mutated, so the stored one can be handed out as is
+                self._alerts[alert.id] = record
+                observed.append(record)
+        return observed
+
+    def _prune(self, now):
+        for alert_id in [alert_id for alert_id, alert in self._alerts.items() if alert.expires_at <= now]:
+            del self._alerts[alert_id]
+
+    def get(self, alert_id):
+        """Current record of an alert, or None if it is unknown or expired"""
+        with self._lock:
+            self._prune(time.time())
+            return self._alerts.get(alert_id)
+
+    def active(self):
+        """All alerts that have not expired, newest first"""
+        with self._lock:
+            self._prune(time.time())
+            return sorted(self._alerts.values(), key=lambda alert: alert.first_seen, reverse=True)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alerts)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_alert_store():
+    """Process-wide alert store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AlertStore()
+        return _store
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from groq_api import fetch_disaster_alerts, risk_level_at
+from maps import fetch_support_locations, fetch_route
+from clients import registry
+from quota import quota_manager, QuotaExceeded
+from resilience import breaker_states, SourceUnavailable
+from records import Place
+from shared_cache import get_shared_cache
+
+WORKERS = 16  # threads computing responses
+MAX_QUEUE = 256  # requests waiting for a worker before new ones get 503
+REQUEST_TIMEOUT = 15  # seconds before a request is answered with 504
+QUOTA_RETRY_AFTER = 30  # seconds clients are asked to wait after the quota refused a call
+
+# Endpoints use the st.*-free fetchers, which raise instead of reporting errors in the UI:
+# QuotaExceeded is answered with 503 and Retry-After, SourceUnavailable with 502
+
+class BadRequest(Exception):
+    """Raised for missing or malformed query parameters"""
+
+def _float_param(params, name):
+    try:
+        return float(params[name][0])
+    except (KeyError, IndexError, ValueError):
+        raise BadRequest(f"query parameter '{name}' must be a number")
+
+def _location(params):
+    lat, lng = _float_param(params, 'lat'), _float_param(params, 'lng')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise BadRequest("lat/lng out of range")
+    return {'lat': lat, 'lng': lng, 'timestamp': time.time()}
+
+def _require_google():
+    # Without a key the Maps client reports the problem with st.error and is None
+    if not os.getenv('GOOGLE_MAPS_API_KEY'):
+        raise SourceUnavailable("Google Maps API key is not configured")
+
+def alerts_endpoint(params):
+    """GET /alerts?lat=&lng= - active disaster alerts around a location"""
+    return {'alerts': [alert.to_dict() for alert in fetch_disaster_alerts(_location(params))]}
+
+def risk_endpoint(params):
+    """GET /risk?lat=&lng= - risk level at a location and the alerts behind it"""
+    location = _location(params)
+    alerts = fetch_disaster_alerts(location)
+    return {
+        'risk_level': risk_level_at(location, alerts),
+        'alerts': [alert.to_dict() for alert in alerts]
+    }
+
+def support_locations_endpoint(params):
+    """GET /support-locations?lat=&lng= - nearby hospitals, police, fire stations and shelters"""
+    location = _location(params)
+    _require_google()
+    places = fetch_support_locations(location)
+    return {'support_locations': [place.to_dict() for place in places]}
+
+def route_endpoint(params):
+    """GET /route?lat=&lng=&place_id=&dest_lat=&dest_lng= - route to a support location"""
+    origin = _location(params)
+    place_id = params.get('place_id', [None])[0]
+    if not place_id:
+        raise BadRequest("query parameter 'place_id' is required")
+    destination = Place(place_id, params.get('name', [''])[0], params.get('type', [''])[0],
+                        _float_param(params, 'dest_lat'), _float_param(params, 'dest_lng'))
+    _require_google()
+    # Anonymous API calls run at the default interactive priority; emergency is kept for the app's explicit action
+    route = fetch_route(origin, destination)
+    return {'route': route.to_dict() if route else None}
+
+def health_endpoint(params):
+    """GET /health - client, quota, circuit breaker and shared cache state"""
+    shared = get_shared_cache()
+    return {
+        'clients': registry.health(),
+        'quota': quota_manager.stats(),
+        'breakers': breaker_states(),
+        'shared_cache': dict(shared.stats) if shared is not None else None,
+        'api': dict(api_stats)
+    }
+
+ENDPOINTS = {
+    '/alerts': alerts_endpoint,
+    '/risk': risk_endpoint,
+    '/support-locations': support_locations_endpoint,
+    '/route': route_endpoint,
+    '/health': health_endpoint,
+}
+
+api_stats = {'requests': 0, 'errors': 0, 'timeouts': 0, 'rejected': 0, 'quota_refused': 0, 'upstream_errors': 0}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        api_stats[name] += 1
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    server_version = "SafeSphereAPI/1.0"
+    protocol_version = "HTTP/1.1"
+    timeout = 30  # idle keep-alive connections are closed after this many seconds
+    # Headers and body are written separately; without this Nagle's algorithm adds ~40 ms per response
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        _count('requests')
+        url = urlparse(self.path)
+        endpoint = ENDPOINTS.get(url.path.rstrip('/') or '/health')
+        if endpoint is None:
+            self._send_json(404, {'error': f"unknown endpoint {url.path}"})
+            return
+
+        future = self.server.workers.submit(endpoint, parse_qs(url.query))
+        try:
+            self._send_json(200, future.result(timeout=self.server.request_timeout))
+        except BadRequest as e:
+            self._send_json(400, {'error': str(e)})
+        except QuotaExceeded as e:
+            _count('quota_refused')
+            self._send_json(503, {'error': str(e)}, headers={'Retry-After': str(QUOTA_RETRY_AFTER)})
+        except SourceUnavailable as e:
+            _count('upstream_errors')
+            self._send_json(502, {'error': str(e)})
+        except (FutureTimeout, TimeoutError) as e:
+            # The worker keeps running and its result still warms the shared caches
+            _count('timeouts')
+            self._send_json(504, {'error': str(e) or "request timed out"})
+        except Exception as e:
+            _count('errors')
+            self._send_json(500, {'error': f"Error handling request: {str(e)}"})
+
+    def log_message(self, format, *args):
+        pass
+
+class APIServer(HTTPServer):
+    """
+    HTTP server handing connections to a bounded thread pool
+    Responses are computed on a second pool so every request gets a timeout, and
+    connections beyond MAX_QUEUE are refused with 503 instead of piling up
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=WORKERS, max_queue=MAX_QUEUE, request_timeout=REQUEST_TIMEOUT):
+        super().__init__(address, APIRequestHandler)
+        self.request_timeout = request_timeout
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+        self._connections = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="api-conn")
+        self._slots = threading.BoundedSemaphore(workers * 2 + max_queue)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            _count('rejected')
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            self.shutdown_request(request)
+            return
+        self._connections.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._connections.shutdown(wait=False)
+        self.workers.shutdown(wait=False)
+
+def serve(host='0.0.0.0', port=8502, workers=WORKERS):
+    """Run the API until interrupted"""
+    load_dotenv()
+    server = APIServer((host, port), workers=workers)
+    print(f"SafeSphere API listening on http://{host}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafeSphere headless JSON API")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -7,12 +7,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-import folium
-from folium import plugins
-from folium.plugins import HeatMap
-from streamlit_folium import folium_static
+from startup import lazy_import
+# Mapping libraries are heavy to import, so they load on first use
+folium = lazy_import('folium')
+plugins = lazy_import('folium.plugins')
+streamlit_folium = lazy_import('streamlit_folium')
 from datetime import datetime, time
-import pandas as pd
 from groq_api import get_disaster_alerts, analyze_risk_level, get_risk_insights, get_weather_alerts, get_traffic_incidents, get_seismic_activity, get_current_weather
 from maps import (
     get_nearby_support_locations, 
@@ -24,13 +24,34 @@ from maps import (
     calculate_movement_metrics
 )
 from utils import generate_heatmap_data
+from risk_surface import RiskSurface, haversine_m
+from location_cache import initialize_product_cache
+from data_graph import build_safety_graph, add_route_product
+from panels import panel, auto_refresh
+from alert_bus import get_alert_bus
+from risk_tiles import get_risk_tile_service, store_alert_incidents
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
 from dotenv import load_dotenv
 import os
 import requests
 import time as time_module
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim
+from clients import registry, get_geolocator, get_http_session
+from quota import quota_manager, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_EMERGENCY
+from resilience import data_age, breaker_states, location_key
+from alert_store import make_alert_id
+from records import Incident, Place, Route
+from dataclasses import replace
+from session_memory import account_session, memory_report
+from trajectory import Trajectory
+from geofence import get_geofence_engine, add_alert_hazards
+from notifications import get_dispatcher, get_in_app_sink
+from shared_cache import get_shared_cache
+from prefetch import get_prefetcher
+from weather import weather_stats
+from region_pack import find_pack, build_pack
+from codec import encode, decode
+from tile_cache import ensure_tile_server, tile_url, ATTRIBUTION as TILE_ATTRIBUTION
 import shelve
 from datetime import datetime, timedelta
 import os.path
@@ -100,11 +121,14 @@ if 'selected_destination' not in st.session_state:
 if 'route_info' not in st.session_state:
     st.session_state.route_info = None
 if 'location_history' not in st.session_state:
-    st.session_state.location_history = []
+    st.session_state.location_history = Trajectory()
 if 'last_location_check' not in st.session_state:
     st.session_state.last_location_check = 0
 if 'location_update_interval' not in st.session_state:
     st.session_state.location_update_interval = 30  # seconds
+if 'lazy_tabs' not in st.session_state:
+    st.session_state.lazy_tabs = True
+initialize_product_cache()
 
 def initialize_offline_storage():
     """Initialize offline storage directory and files"""
@@ -129,7 +153,7 @@ def initialize_offline_storage():
 def get_location():
     """Get user location using IP-based geolocation"""
     try:
-        response = requests.get('https://ipapi.co/json/')
+        response = get_http_session().get('https://ipapi.co/json/', timeout=10)
         if response.status_code == 200:
             data = response.json()
             return {
@@ -147,10 +171,20 @@ def send_notification(message):
     """Simplified notification function using Streamlit toast"""
     st.toast(message)
 
+def create_base_map(location, zoom_start=13):
+    """
+    Folium map whose base tiles come from the local MBTiles cache when offline
+    (or always, read-through, with TILE_CACHE_ONLINE=1), otherwise from OpenStreetMap
+    """
+    offline = st.session_state.get('offline_mode', False)
+    if (offline or os.getenv('TILE_CACHE_ONLINE') == '1') and ensure_tile_server():
+        return folium.Map(location=location, zoom_start=zoom_start, tiles=tile_url(offline), attr=TILE_ATTRIBUTION)
+    return folium.Map(location=location, zoom_start=zoom_start)
+
 def create_risk_heatmap(location, risk_data):
     """Create a heatmap layer for risk visualization"""
     try:
-        m = folium.Map(
+        m = create_base_map(
             location=[location['lat'], location['lng']],
             zoom_start=13
         )
@@ -165,11 +199,11 @@ def create_risk_heatmap(location, risk_data):
         return m
     except Exception as e:
         st.error(f"Error creating heatmap: {str(e)}")
-        return folium.Map(location=[location['lat'], location['lng']], zoom_start=13)
+        return create_base_map(location=[location['lat'], location['lng']], zoom_start=13)
 
-def create_route_map(user_location, destination, route_info):
-    """Create a map with route visualization"""
-    m = folium.Map(
+def create_route_map(user_location, destination, route_info, corridor=None):
+    """Create a map with route visualization and, if given, the weather of each corridor segment"""
+    m = create_base_map(
         location=[user_location['lat'], user_location['lng']],
         zoom_start=13
     )
@@ -183,22 +217,22 @@ def create_route_map(user_location, destination, route_info):
     
     # Add destination marker
     folium.Marker(
-        [destination['lat'], destination['lng']],
-        popup=f"Destination: {destination['name']}",
+        [destination.lat, destination.lng],
+        popup=f"Destination: {destination.name}",
         icon=folium.Icon(color='green', icon='flag', prefix='fa')
     ).add_to(m)
     
     # Add route polyline if coordinates are provided
-    if route_info and 'coordinates' in route_info:
+    if route_info:
         folium.PolyLine(
-            route_info['coordinates'],
+            route_info.coordinates,
             weight=3,
             color='blue',
             opacity=0.8
         ).add_to(m)
         
         # Add risk zones along route
-        risk_zones = get_risk_zones(route_info['coordinates'])
+        risk_zones = get_risk_zones(route_info.coordinates)
         for zone in risk_zones:
             color = 'red' if zone['risk_level'] == 'high' else 'orange'
             folium.Circle(
@@ -208,12 +242,21 @@ def create_route_map(user_location, destination, route_info):
                 fill=True,
                 popup=f"Risk Zone: {zone['description']}"
             ).add_to(m)
+
+    for segment in corridor or []:
+        if segment['weather']:
+            folium.Marker(
+                segment['start'],
+                popup=f"{segment['weather']['description'].title()}, {segment['weather']['temperature']}°C",
+                icon=folium.Icon(color='lightblue', icon='cloud', prefix='fa')
+            ).add_to(m)
     
     return m
 
-def display_risk_insights(location):
+def display_risk_insights(location, insights=None):
     """Display detailed risk insights"""
-    insights = get_risk_insights(location)
+    if insights is None:
+        insights = get_risk_insights(location)
     
     st.subheader("🔍 Risk Insights")
     
@@ -264,17 +307,26 @@ def update_location():
         if new_location:
             st.session_state.user_location = new_location
             st.session_state.last_location_check = time_module.time()
-    
+
+    if st.session_state.user_location:
+        st.session_state.location_history.append_location(st.session_state.user_location)
+        # Count each session once per cell it enters, so the warmer learns where users are
+        if st.session_state.get('prefetch_cell') != location_key(st.session_state.user_location):
+            st.session_state.prefetch_cell = get_prefetcher().record(st.session_state.user_location)
     return st.session_state.user_location
 
-def create_dynamic_heatmap(heatmap_data, current_location):
-    """Create an interactive heatmap with tooltips and legend"""
+def create_dynamic_heatmap(heatmap_data, current_location, risk_surface=None):
+    """
+    Create an interactive heatmap with tooltips and legend
+    When a risk surface is given, its raster cells form the heat layer and
+    heatmap_data only provides the clickable incident points
+    """
     try:
         # Create base map centered on current location
         center_lat = current_location['lat']
         center_lng = current_location['lng']
         
-        m = folium.Map(location=[center_lat, center_lng], zoom_start=13)
+        m = create_base_map(location=[center_lat, center_lng], zoom_start=13)
         
         # Add current location marker with pulsing effect
         plugins.LocateControl().add_to(m)
@@ -309,11 +361,14 @@ def create_dynamic_heatmap(heatmap_data, current_location):
         }
         
         # Prepare heatmap data
-        heat_data = [[point['lat'], point['lng'], point['intensity']] for point in heatmap_data]
+        if risk_surface is not None:
+            heat_data = risk_surface.heatmap_points()
+        else:
+            heat_data = [[point['lat'], point['lng'], point['intensity']] for point in heatmap_data]
         
         # Add heatmap layer
         if heat_data:  # Only add heatmap if there's data
-            HeatMap(
+            plugins.HeatMap(
                 data=heat_data,
                 radius=25,
                 gradient=gradient,
@@ -381,7 +436,7 @@ def create_dynamic_heatmap(heatmap_data, current_location):
         return m
     except Exception as e:
         st.error(f"Error creating heatmap: {str(e)}")
-        return folium.Map(location=[40.7128, -74.0060], zoom_start=10)  # Return default map on error
+        return create_base_map(location=[40.7128, -74.0060], zoom_start=10)  # Return default map on error
 
 def get_risk_level(intensity):
     """Convert intensity value to risk level description"""
@@ -402,14 +457,87 @@ def notify_user(message):
     """
     st.warning(message)  # Example notification
 
+def display_service_health():
+    """
+    Show usage and health counters of the shared clients in the sidebar
+    Also accounts this session's state and compacts it when it is over its memory budget
+    """
+    with st.sidebar.expander("🩺 Service Health"):
+        for name, stats in registry.health().items():
+            status = "🟢" if stats['healthy'] else "🔴" if stats['created'] else "⚪"
+            st.markdown(f"{status} **{name}**: {stats['acquisitions']} uses, {stats['errors']} errors")
+
+        st.markdown("**Google API quota (today)**")
+        for api, counters in quota_manager.stats().items():
+            denied = counters['denied_rate'] + counters['denied_budget']
+            st.markdown(f"- {api}: {counters['used_today']}/{counters['daily_budget']} used, "
+                        f"{counters['queued']} queued, {denied} refused")
+
+        breakers = breaker_states()
+        if breakers:
+            st.markdown("**Data sources**")
+            for source, breaker in breakers.items():
+                status = "🟢" if breaker['state'] == 'closed' else "🟡" if breaker['state'] == 'half_open' else "🔴"
+                st.markdown(f"{status} {source}: {breaker['state']}, {breaker['failures']} failures")
+
+        shared = get_shared_cache()
+        if shared is not None:
+            st.markdown(f"**Shared cache**: {shared.stats['hits']} hits, {shared.stats['misses']} misses, "
+                        f"{shared.stats['lease_waits']} waits on other workers, {shared.stats['errors']} errors")
+
+        st.markdown(f"**Weather**: {weather_stats['views']} views served by "
+                    f"{weather_stats['fetches']} OpenWeather requests")
+
+        prefetcher = get_prefetcher()
+        st.markdown(f"**Cache warmer**: {len(prefetcher.hot_cells())} hot cells, "
+                    f"{prefetcher.stats['warmed']} warmed, {prefetcher.stats['route_cells']} route cells, "
+                    f"{prefetcher.stats['errors']} errors")
+
+        geofence = get_geofence_engine()
+        counts = geofence.counts()
+        st.markdown(f"**Geofences**: {counts['users']} users, {counts['hazards']} hazards, "
+                    f"{geofence.stats['matches']} matches, last check {geofence.stats['last_eval_ms']:.1f} ms")
+
+        dispatcher = get_dispatcher()
+        st.markdown(f"**Notifications**: {dispatcher.stats['delivered']} delivered in "
+                    f"{dispatcher.stats['batches']} batches, {dispatcher.pending_users()} pending, "
+                    f"{dispatcher.stats['shed']} shed, {dispatcher.stats['sink_errors']} sink errors")
+
+        session = account_session()
+        if session:
+            process = memory_report()
+            st.markdown("**Session memory**")
+            st.markdown(f"- This session: {session['total'] / 1024:.0f} KiB of {session['budget'] / 1024:.0f} KiB, "
+                        f"{session['compactions']} compactions")
+            st.markdown(f"- All {process['sessions']} sessions: {process['total'] / 2 ** 20:.1f} MiB")
+            for key, size in process['largest_entries']:
+                st.markdown(f"  - {key}: {size / 1024:.0f} KiB")
+
+def render_data_age(location, sources, fresh_seconds=120):
+    """
+    Mark panels that are showing stale data from an unavailable or revalidating source
+    sources are source names keyed by the location, or explicit (source, key) pairs
+    """
+    if not location:
+        return
+    entries = [source if isinstance(source, tuple) else (source, location_key(location))
+               for source in sources]
+    age = data_age(entries)
+    if age is not None and age > fresh_seconds:
+        st.caption(f"⏱ Data is {int(age // 60)} minutes old")
+
 def save_offline_data(location, support_locs, route_info):
     """Save current map data for offline use"""
     try:
         with shelve.open("offline_data/map_data") as storage:
-            storage['last_location'] = location
-            storage['support_locations'] = support_locs
-            storage['routes'] = route_info
-            storage['last_update'] = datetime.now().isoformat()
+            # Records are stored as plain dicts so saved data survives changes to the record types,
+            # compactly encoded as one snapshot instead of pickled
+            storage['snapshot'] = encode({
+                'location': location,
+                'support_locations': [place.to_dict() for place in support_locs or []],
+                'routes': route_info.to_dict() if route_info else None,
+                'last_update': datetime.now().isoformat()
+            })
         return True
     except Exception as e:
         st.error(f"Error saving offline data: {str(e)}")
@@ -419,12 +547,22 @@ def get_offline_data():
     """Retrieve saved offline data"""
     try:
         with shelve.open("offline_data/map_data") as storage:
-            return {
-                'location': storage.get('last_location'),
-                'support_locations': storage.get('support_locations', []),
-                'routes': storage.get('routes', []),
-                'last_update': storage.get('last_update')
-            }
+            if 'snapshot' in storage:
+                data = decode(storage['snapshot'])
+            else:
+                # Saved by an older version, one pickled key per field
+                data = {
+                    'location': storage.get('last_location'),
+                    'support_locations': storage.get('support_locations'),
+                    'routes': storage.get('routes'),
+                    'last_update': storage.get('last_update')
+                }
+        return {
+            'location': data['location'],
+            'support_locations': [Place.coerce(place) for place in data['support_locations'] or []],
+            'routes': Route.coerce(data['routes'] or None),
+            'last_update': data['last_update']
+        }
     except Exception as e:
         st.error(f"Error retrieving offline data: {str(e)}")
         return None
@@ -445,13 +583,30 @@ def add_offline_controls():
         help="Switch to offline mode to use saved map data without internet"
     )
     
-    # Update session state if changed
+    # Update session state if changed; the toggle itself already triggered this rerun
     if offline_mode != st.session_state.offline_mode:
         st.session_state.offline_mode = offline_mode
-        st.rerun()
     
+    # Region packs cover a whole city for offline use; building one takes a few minutes of API calls
+    location = st.session_state.get('user_location')
+    if location and not offline_mode:
+        if st.sidebar.button("Download Region Pack", help="Save support locations, routes and risk tiles for about 10 km around you"):
+            try:
+                with st.spinner("Building region pack..."):
+                    status = st.sidebar.empty()
+                    path = build_pack(f"region_{location['lat']:.2f}_{location['lng']:.2f}", location,
+                                      progress=status.caption)
+                status.caption(f"Saved {os.path.basename(path)}")
+            except Exception as e:
+                st.sidebar.error(f"Error building region pack: {str(e)}")
+
     # Show offline status and last update
     if offline_mode:
+        region = find_pack(location)
+        if region:
+            st.sidebar.caption(f"📦 Region pack '{region.name}': {len(region.places)} support locations, "
+                               f"{len(region.routes)} routes, built "
+                               f"{datetime.fromtimestamp(region.created_at).strftime('%Y-%m-%d %H:%M')}")
         offline_data = get_offline_data()
         if offline_data and offline_data['last_update']:
             last_update = datetime.fromisoformat(offline_data['last_update'])
@@ -472,20 +627,29 @@ def add_offline_controls():
 def create_map_display(current_location, support_locations, offline_mode=False):
     """Create and display the safety map with offline support"""
     try:
+        region = None
+        route_info = None
         if offline_mode:
-            offline_data = get_offline_data()
-            if not offline_data or not offline_data['location']:
-                st.warning("No offline map data available. Please connect to internet first.")
-                return
-            
-            current_location = offline_data['location']
-            support_locations = offline_data['support_locations']
-            route_info = offline_data['routes']  # Get routes from offline data
-            
-            st.info("⚠️ Viewing offline map data. Some features may be limited.")
+            # A region pack covering the user serves the whole city; the last snapshot is the fallback
+            region = find_pack(current_location)
+            if region:
+                support_locations = region.support_locations(current_location)
+                route_info = region.route_from(current_location)
+                st.info(f"⚠️ Viewing offline region pack '{region.name}'. Some features may be limited.")
+            else:
+                offline_data = get_offline_data()
+                if not offline_data or not offline_data['location']:
+                    st.warning("No offline map data available. Please connect to internet first.")
+                    return
+
+                current_location = offline_data['location']
+                support_locations = offline_data['support_locations']
+                route_info = offline_data['routes']  # Get routes from offline data
+
+                st.info("⚠️ Viewing offline map data. Some features may be limited.")
         
         # Create the map
-        safety_map = folium.Map(
+        safety_map = create_base_map(
             location=[current_location['lat'], current_location['lng']],
             zoom_start=13
         )
@@ -538,31 +702,41 @@ def create_map_display(current_location, support_locations, offline_mode=False):
                     'Police Station': 'blue',
                     'Fire Station': 'orange',
                     'Shelter': 'green'
-                }.get(location['type'], 'green')
+                }.get(location.type, 'green')
                 
                 folium.Marker(
-                    [location['lat'], location['lng']],
+                    [location.lat, location.lng],
                     popup=folium.Popup(
                         f"""
                         <div style='width: 200px'>
-                            <h4>{location['name']}</h4>
-                            <p><strong>Type:</strong> {location['type']}</p>
-                            <p><strong>Distance:</strong> {location.get('distance', 'N/A')} meters</p>
-                            <p><strong>Status:</strong> {location.get('status', 'Open')}</p>
+                            <h4>{location.name}</h4>
+                            <p><strong>Type:</strong> {location.type}</p>
+                            <p><strong>Distance:</strong> {location.distance or 'N/A'} meters</p>
+                            <p><strong>Status:</strong> {location.status or 'Open'}</p>
                         </div>
                         """,
                         max_width=300
                     ),
                     icon=folium.Icon(color=icon_color, icon='info-sign'),
-                    tooltip=f"{location['name']} ({location['type']})"
+                    tooltip=f"{location.name} ({location.type})"
                 ).add_to(safety_map)
         
+        if route_info:
+            folium.PolyLine(route_info.coordinates, weight=3, color='blue', opacity=0.8,
+                            tooltip=f"Route to nearest support: {route_info.distance}, {route_info.duration}").add_to(safety_map)
+
+        # Overlay the shared, precomputed risk tiles of this region
+        if not offline_mode:
+            get_risk_tile_service().add_layer(safety_map, current_location)
+        elif region:
+            region.add_risk_layer(safety_map, current_location)
+
         # Add map layers control
         folium.LayerControl().add_to(safety_map)
         
         # Save data for offline use if online
         if not offline_mode:
-            route_info = {}  # Initialize empty route info if not in offline mode
+            route_info = None  # No route is saved with the map
             save_offline_data(current_location, support_locations, route_info)
         
         return safety_map
@@ -570,6 +744,363 @@ def create_map_display(current_location, support_locations, offline_mode=False):
         st.error(f"Error creating map display: {str(e)}")
         return None
 
+@panel('weather', run_every=600)
+def render_weather_panel(graph, current_location):
+    """Sidebar weather report and weather alerts"""
+    weather = graph.get('weather')
+    if weather:
+        st.markdown("---")
+        st.markdown("🌤️ **Weather Report**")
+
+        # Create a styled container for weather info
+        st.markdown(
+            f"""
+            <div style='background-color: #1e1e1e; padding: 15px; border-radius: 10px; margin: 10px 0;'>
+                <div style='color: #00ff00; font-size: 24px; margin-bottom: 10px;'>
+                    {weather['temperature']}°C
+                </div>
+                <div style='color: white; margin-bottom: 5px;'>
+                    {weather['description'].title()}
+                </div>
+                <hr style='border-color: #333333; margin: 10px 0;'>
+                <div style='color: #cccccc;'>
+                    💧 Humidity: {weather['humidity']}%<br>
+                    💨 Wind Speed: {weather['wind_speed']} m/s
+                </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+        # Add weather alerts if any
+        weather_alerts = graph.get('weather_alerts')
+        if weather_alerts:
+            st.markdown("⚠️ **Weather Alerts**")
+            for alert in weather_alerts:
+                st.markdown(
+                    f"""
+                    <div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0; color: white;'>
+                        {alert.message}
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+
+        render_data_age(current_location, ['openweather'])
+
+@panel('support_map')
+def render_support_map_panel(graph, current_location):
+    """Safety map panel with destination selection and route directions"""
+    st.header("🗺 Safety Map")
+
+    # Get support locations with error handling
+    support_locations = graph.get('support_locations')
+
+    # Create and display the safety map first
+    if current_location:
+        safety_map = create_map_display(
+            current_location,
+            support_locations,
+            offline_mode=st.session_state.offline_mode
+        )
+
+        if safety_map:
+            streamlit_folium.folium_static(safety_map)
+
+        # Show offline mode limitations if active
+        if st.session_state.offline_mode:
+            st.markdown("""
+                <div style='background-color: #1e1e1e; padding: 10px; border-radius: 5px; margin: 10px 0;'>
+                    <h4 style='color: #ffa500; margin: 0;'>Offline Mode Limitations</h4>
+                    <ul style='color: #cccccc; margin: 10px 0;'>
+                        <li>Live alerts are not available</li>
+                        <li>Weather updates are not available</li>
+                        <li>New routes cannot be calculated</li>
+                        <li>Support location status may be outdated</li>
+                    </ul>
+                </div>
+            """, unsafe_allow_html=True)
+
+    # Rest of the destination selection and route display
+    if support_locations and len(support_locations) > 0:
+        # Add location selector
+        st.markdown("### 🎯 Select Destination")
+        destination_options = [f"{loc.name} ({loc.type})" for loc in support_locations]
+        selected_index = st.selectbox(
+            "Choose a destination",
+            range(len(destination_options)),
+            format_func=lambda x: destination_options[x]
+        )
+
+        selected_location = support_locations[selected_index]
+        # Only an explicit emergency request outranks the other Google API calls
+        emergency = st.button("🆘 Emergency Route", help="Get directions ahead of all other requests")
+        add_route_product(graph, current_location, selected_location,
+                          priority=PRIORITY_EMERGENCY if emergency else PRIORITY_INTERACTIVE)
+        route_info = graph.get('route')
+
+        if route_info and route_info.steps:
+            st.markdown("### 🚗 Route Information")
+            st.markdown(f"**Distance:** {route_info.distance}")
+            st.markdown(f"**Duration:** {route_info.duration}")
+
+            route_weather = graph.get('route_weather')
+            if route_weather:
+                st.markdown("### 🌦️ Weather Along Route")
+                for segment in route_weather:
+                    span = f"{segment['start_m'] / 1000:.1f}–{segment['end_m'] / 1000:.1f} km"
+                    if segment['weather']:
+                        st.markdown(f"**{span}:** {segment['weather']['description'].title()}, "
+                                    f"{segment['weather']['temperature']}°C, wind {segment['weather']['wind_speed']} m/s")
+                    else:
+                        st.markdown(f"**{span}:** Weather unavailable")
+
+            st.markdown("### 🚶 Step-by-Step Directions")
+            for i, step in enumerate(route_info.steps):
+                st.markdown(f"""
+                    <div style='background-color: #1e1e1e; padding: 10px; border-radius: 5px; margin: 5px 0;'>
+                        <strong>Step {i+1}:</strong> {step.instruction}
+                        <br><small>Distance: {step.distance}</small>
+                    </div>
+                """, unsafe_allow_html=True)
+
+                # Add progress indicators between steps, but not after the last step
+                if i < len(route_info.steps) - 1:
+                    st.markdown("""
+                        <div class="progress-indicator">
+                            ↓
+                        </div>
+                    """, unsafe_allow_html=True)
+
+            # Add arrival indicator only once at the end
+            st.markdown("""
+                <div class="arrival-indicator" style='background-color: #4CAF50; padding: 10px; border-radius: 5px; margin: 10px 0; text-align: center; color: white;'>
+                    🏁 Arrival at Destination
+                </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.warning("No support locations found in your area. Please try a different location or refresh the page.")
+
+@panel('alerts', run_every=300)
+def render_alerts_panel(graph, current_location):
+    """Live alerts panel, refreshed from the alert sources every 5 minutes"""
+    st.header("🚨 Live Alerts")
+    alerts = graph.get('alerts')
+    render_data_age(current_location, ['openweather', ('usgs', '2.5_day')])
+
+    if alerts:
+        # Group alerts by type
+        alert_types = {
+            'weather': '🌦️',
+            'air_quality': '💨',
+            'earthquake': '🌋',
+            'traffic': '🚗'
+        }
+
+    for alert in alerts:
+        alert_icon = alert_types.get(alert.type, '⚠️')
+
+        if alert.severity == 'high':
+            st.markdown(f"""
+                <div style='background-color: #ff4b4b; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
+                    <strong>{alert_icon} {alert.type.upper()}</strong><br>
+                    {alert.message}
+                </div>
+            """, unsafe_allow_html=True)
+        elif alert.severity == 'medium':
+            st.markdown(f"""
+                <div style='background-color: #ffa500; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
+                    <strong>{alert_icon} {alert.type.upper()}</strong><br>
+                    {alert.message}
+                </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown(f"""
+                <div style='background-color: #4CAF50; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
+                    <strong>{alert_icon} {alert.type.upper()}</strong><br>
+                    {alert.message}
+                </div>
+            """, unsafe_allow_html=True)
+
+        # Add auto-refresh functionality
+        st.markdown("""
+            <div style='text-align: center; color: #666; font-size: 12px; margin-top: 20px;'>
+                Alerts auto-refresh every 5 minutes
+            </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.success("No active alerts in your area at this time.")
+
+@panel('heatmap', refresh_label="Refresh Data")
+def render_heatmap_panel(graph, current_location):
+    """Weather status, incident heatmap and nearby incidents"""
+    # Fetch live data
+    current_weather = graph.get('current_weather')
+    weather_alerts = graph.get('weather_alerts') or []
+    traffic_incidents = graph.get('traffic_incidents')
+    seismic_activity = graph.get('seismic_activity')
+    render_data_age(current_location, ['openweather', ('usgs', 'all_day')])
+
+    # Check if it is currently raining
+    if current_weather and 'weather' in current_weather:
+        is_raining = any(condition['main'].lower() == 'rain' for condition in current_weather['weather'])
+        rain_status = "It is currently raining." if is_raining else "It is not raining."
+        st.markdown(f"<div style='background-color: #4CAF50; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
+                    f"<strong>Weather Status:</strong> {rain_status}</div>", unsafe_allow_html=True)
+
+    # Prepare data for heatmap and filter incidents
+    incidents = []
+    nearby_incidents = []
+    radius = 5000  # 5 km radius for filtering incidents
+
+    # Process weather alerts for rain
+    rain_alerts = [alert for alert in weather_alerts if 'rain' in (alert.event or '').lower()]
+
+    if rain_alerts:
+        for alert in rain_alerts:
+            st.markdown(f"<div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
+                        f"<strong>Weather Alert:</strong> {alert.message}</div>", unsafe_allow_html=True)
+
+    # Collect traffic incidents and earthquakes as risk surface incidents
+    for incident in (traffic_incidents or [])[:4]:  # Limit to first 4 incidents
+        incidents.append(Incident(
+            lat=incident['geometry']['location']['lat'],
+            lng=incident['geometry']['location']['lng'],
+            id=make_alert_id('places', incident['place_id']),
+            type='traffic',
+            severity='medium',
+            label='Traffic Incident',
+            description=incident['name'],
+            precautions="Avoid the area if possible and follow detour signs."
+        ))
+
+    for quake in seismic_activity or []:
+        magnitude = quake['properties']['mag'] or 0
+        incidents.append(Incident(
+            lat=quake['geometry']['coordinates'][1],
+            lng=quake['geometry']['coordinates'][0],
+            id=make_alert_id('usgs', quake['id']),
+            type='earthquake',
+            severity='high' if magnitude >= 4.0 else 'medium',
+            timestamp=quake['properties'].get('time'),
+            label='Earthquake',
+            description=f"Magnitude {quake['properties']['mag']} at {quake['properties']['place']}",
+            precautions="Drop, Cover, and Hold On. Stay away from windows."
+        ))
+
+    # Filter all incidents by distance in one vectorized pass
+    if incidents:
+        distances = haversine_m(
+            current_location['lat'], current_location['lng'],
+            [incident.lat for incident in incidents],
+            [incident.lng for incident in incidents]
+        )
+        for incident, distance in zip(incidents, distances):
+            if distance <= radius:
+                nearby_incidents.append(replace(incident, distance=float(distance)))
+
+    # Share the incidents near the user with the risk tile job, not the worldwide feed
+    get_risk_tile_service().store.add(nearby_incidents)
+
+    # Rasterise nearby incidents into the risk surface behind the heatmap
+    surface = RiskSurface(current_location, radius_m=radius)
+    surface.add_incidents(nearby_incidents)
+    heatmap_data = [
+        {
+            'lat': incident.lat,
+            'lng': incident.lng,
+            'intensity': min(surface.query_point(incident.lat, incident.lng), 1.0),
+            'type': incident.label,
+            'description': incident.description
+        }
+        for incident in nearby_incidents
+    ]
+
+    # Create heatmap
+    heatmap = create_dynamic_heatmap(heatmap_data, current_location, risk_surface=surface)
+    streamlit_folium.folium_static(heatmap)
+
+    # Display nearby incidents with descriptions and precautions
+    if nearby_incidents:
+        st.subheader("⚠️ Nearby Incidents")
+        for incident in nearby_incidents:
+            st.markdown(f"<div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
+                        f"<strong>{incident.label}</strong>: {incident.description}<br>"
+                        f"Distance: {incident.distance:.2f} meters<br>"
+                        f"<em>Precautions: {incident.precautions}</em></div>", unsafe_allow_html=True)
+    else:
+        st.success("No nearby incidents at this time.")
+
+@auto_refresh(run_every=5)
+def render_alert_stream(current_location):
+    """Show alerts pushed by the server-side alert bus since the last check"""
+    if not current_location or st.session_state.offline_mode:
+        return
+
+    bus = get_alert_bus()
+    bus.add_listener(store_alert_incidents)
+    bus.add_listener(add_alert_hazards)
+    session_id = get_script_run_ctx().session_id
+    bus.subscribe(session_id, current_location)
+    geofence = get_geofence_engine()
+    geofence.add_listener(get_dispatcher().submit)
+    geofence.update_user(session_id, current_location)
+
+    for alert in bus.drain(session_id):
+        # An alert that changed replaces its earlier version instead of being listed twice
+        st.session_state.alerts = [known for known in st.session_state.alerts if known.id != alert.id]
+        st.session_state.alerts.insert(0, alert)
+    del st.session_state.alerts[20:]
+
+    # Notifications for the hazards this user is inside, de-duplicated and coalesced by the dispatcher
+    for notification in get_in_app_sink().drain(session_id):
+        send_notification(f"🚨 {notification.title}: {notification.message}")
+
+    if st.session_state.alerts:
+        st.markdown("#### 📡 Live Alert Stream")
+        for alert in st.session_state.alerts[:5]:
+            st.markdown(f"- **{alert.type.upper()}**: {alert.message}")
+
+def render_live_map_tab(graph, current_location):
+    """Render the Live Map tab: safety map, routes and live alerts"""
+    col1, col2 = st.columns([3, 1])
+
+    with col1:
+        render_support_map_panel(graph, current_location)
+
+    with col2:
+        render_alerts_panel(graph, current_location)
+        render_alert_stream(current_location)
+
+def render_risk_analysis_tab(graph, current_location):
+    """Render the Risk Analysis tab: weather status, incident heatmap and nearby incidents"""
+    st.header("📊 Risk Analysis")
+
+    # Add explanation of the heatmap
+    st.markdown("""
+        <div style='background-color: #1e1e1e; padding: 15px; border-radius: 10px; margin: 10px 0;'>
+            <h4 style='color: #00ff00; margin: 0;'>How to Read the Risk Heatmap</h4>
+            <ul style='color: white; margin: 10px 0;'>
+                <li>Colors indicate risk levels from green (low) to red (high)</li>
+                <li>Hover over colored areas to see detailed risk information</li>
+                <li>Click on points for additional details about specific risks</li>
+                <li>Consider avoiding red zones during your journey</li>
+            </ul>
+        </div>
+    """, unsafe_allow_html=True)
+
+    render_heatmap_panel(graph, current_location)
+
+# Tab bodies and the data products each of them needs
+TAB_RENDERERS = {
+    "📍 Live Map": render_live_map_tab,
+    "📊 Risk Analysis": render_risk_analysis_tab,
+}
+TAB_PRODUCTS = {
+    "📍 Live Map": ['support_locations', 'alerts'],
+    "📊 Risk Analysis": ['current_weather', 'weather_alerts', 'traffic_incidents', 'seismic_activity'],
+}
+
 def main():
     try:
         # Initialize offline storage
@@ -581,6 +1112,22 @@ def main():
         # Sidebar
         st.sidebar.title("🚨 Safety Dashboard")
         current_location = update_location()
+
+        st.sidebar.toggle(
+            "Lazy Tab Loading",
+            key='lazy_tabs',
+            help="Only build the tab you are viewing and load the other one in the background"
+        )
+
+        # Declare this rerun's data products and start fetching independent branches in parallel
+        graph = build_safety_graph(current_location)
+        if current_location and not st.session_state.offline_mode:
+            if st.session_state.lazy_tabs:
+                active_tab = st.session_state.get('active_tab', next(iter(TAB_PRODUCTS)))
+                graph.prefetch(['weather', 'weather_alerts'] + TAB_PRODUCTS[active_tab])
+            else:
+                graph.prefetch(['weather'] + [product for products in TAB_PRODUCTS.values()
+                                              for product in products])
         
         if current_location:
             st.sidebar.markdown(f"📍 **Current Location:**")
@@ -615,44 +1162,8 @@ def main():
             """, unsafe_allow_html=True)
 
             # Display weather information in sidebar
-            weather = get_weather(current_location)
-            if weather:
-                st.sidebar.markdown("---")
-                st.sidebar.markdown("🌤️ **Weather Report**")
-                
-                # Create a styled container for weather info
-                st.sidebar.markdown(
-                    f"""
-                    <div style='background-color: #1e1e1e; padding: 15px; border-radius: 10px; margin: 10px 0;'>
-                        <div style='color: #00ff00; font-size: 24px; margin-bottom: 10px;'>
-                            {weather['temperature']}°C
-                        </div>
-                        <div style='color: white; margin-bottom: 5px;'>
-                            {weather['description'].title()}
-                        </div>
-                        <hr style='border-color: #333333; margin: 10px 0;'>
-                        <div style='color: #cccccc;'>
-                            💧 Humidity: {weather['humidity']}%<br>
-                            💨 Wind Speed: {weather['wind_speed']} m/s
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-
-                # Add weather alerts if any
-                weather_alerts = get_weather_alerts(current_location)
-                if weather_alerts:
-                    st.sidebar.markdown("⚠️ **Weather Alerts**")
-                    for alert in weather_alerts:
-                        st.sidebar.markdown(
-                            f"""
-                            <div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0; color: white;'>
-                                {alert['description']}
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
+            with st.sidebar:
+                render_weather_panel(graph, current_location)
 
         # Manual location override
         with st.sidebar.expander("Manual Location Override"):
@@ -674,7 +1185,7 @@ def main():
                 if st.button("Update Location"):
                     try:
                         # Use geopy to get location details
-                        geolocator = Nominatim(user_agent="my_safety_app")
+                        geolocator = get_geolocator()
                         location = geolocator.reverse(f"{new_lat}, {new_lng}", language='en')
                         
                         if location and location.raw:
@@ -700,236 +1211,24 @@ def main():
             except Exception as e:
                 st.error(f"Error in location input: {str(e)}")
 
-        # Main content area with tabs
-        tab1, tab2 = st.tabs(["📍 Live Map", "📊 Risk Analysis"])
-        
-        with tab1:
-            col1, col2 = st.columns([3, 1])
-            
-            with col1:
-                st.header("🗺 Safety Map")
-                
-                # Get support locations with error handling
-                support_locations = get_nearby_support_locations(current_location)
-                
-                # Create and display the safety map first
-                if current_location:
-                    safety_map = create_map_display(
-                        current_location,
-                        support_locations,
-                        offline_mode=st.session_state.offline_mode
-                    )
-                    
-                    if safety_map:
-                        folium_static(safety_map)
-                    
-                    # Show offline mode limitations if active
-                    if st.session_state.offline_mode:
-                        st.markdown("""
-                            <div style='background-color: #1e1e1e; padding: 10px; border-radius: 5px; margin: 10px 0;'>
-                                <h4 style='color: #ffa500; margin: 0;'>Offline Mode Limitations</h4>
-                                <ul style='color: #cccccc; margin: 10px 0;'>
-                                    <li>Live alerts are not available</li>
-                                    <li>Weather updates are not available</li>
-                                    <li>New routes cannot be calculated</li>
-                                    <li>Support location status may be outdated</li>
-                                </ul>
-                            </div>
-                        """, unsafe_allow_html=True)
-                
-                # Rest of the destination selection and route display
-                if support_locations and len(support_locations) > 0:
-                    # Add location selector
-                    st.markdown("### 🎯 Select Destination")
-                    destination_options = [f"{loc['name']} ({loc['type']})" for loc in support_locations]
-                    selected_index = st.selectbox(
-                        "Choose a destination",
-                        range(len(destination_options)),
-                        format_func=lambda x: destination_options[x]
-                    )
-                    
-                    selected_location = support_locations[selected_index]
-                    route_info = get_route_to_location(current_location, selected_location)
-                    
-                    if route_info and 'steps' in route_info:
-                        st.markdown("### 🚗 Route Information")
-                        st.markdown(f"**Distance:** {route_info['distance']}")
-                        st.markdown(f"**Duration:** {route_info['duration']}")
-                        
-                        st.markdown("### 🚶 Step-by-Step Directions")
-                        for i, step in enumerate(route_info['steps']):
-                            st.markdown(f"""
-                                <div style='background-color: #1e1e1e; padding: 10px; border-radius: 5px; margin: 5px 0;'>
-                                    <strong>Step {i+1}:</strong> {step['instruction']}
-                                    <br><small>Distance: {step['distance']}</small>
-                                </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # Add progress indicators between steps, but not after the last step
-                            if i < len(route_info['steps']) - 1:
-                                st.markdown("""
-                                    <div class="progress-indicator">
-                                        ↓
-                                    </div>
-                                """, unsafe_allow_html=True)
-                        
-                        # Add arrival indicator only once at the end
-                        st.markdown("""
-                            <div class="arrival-indicator" style='background-color: #4CAF50; padding: 10px; border-radius: 5px; margin: 10px 0; text-align: center; color: white;'>
-                                🏁 Arrival at Destination
-                            </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.warning("No support locations found in your area. Please try a different location or refresh the page.")
-            
-            with col2:
-                st.header("🚨 Live Alerts")
-                alerts = get_disaster_alerts(current_location)
-                
-                if alerts:
-                    # Group alerts by type
-                    alert_types = {
-                        'weather': '🌦️',
-                        'air_quality': '💨',
-                        'earthquake': '🌋',
-                        'traffic': '🚗'
-                    }
-                
-                for alert in alerts:
-                    alert_icon = alert_types.get(alert['type'], '⚠️')
-                    
-                    if alert['severity'] == 'high':
-                        st.markdown(f"""
-                            <div style='background-color: #ff4b4b; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
-                                <strong>{alert_icon} {alert['type'].upper()}</strong><br>
-                                {alert['message']}
-                            </div>
-                        """, unsafe_allow_html=True)
-                    elif alert['severity'] == 'medium':
-                        st.markdown(f"""
-                            <div style='background-color: #ffa500; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
-                                <strong>{alert_icon} {alert['type'].upper()}</strong><br>
-                                {alert['message']}
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                            <div style='background-color: #4CAF50; padding: 15px; border-radius: 10px; margin: 10px 0; color: white;'>
-                                <strong>{alert_icon} {alert['type'].upper()}</strong><br>
-                                {alert['message']}
-                            </div>
-                        """, unsafe_allow_html=True)
-                    
-                    # Add auto-refresh functionality
-                    st.markdown("""
-                        <div style='text-align: center; color: #666; font-size: 12px; margin-top: 20px;'>
-                            Alerts auto-refresh every 5 minutes
-                        </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.success("No active alerts in your area at this time.")
-
-        with tab2:
-            st.header("📊 Risk Analysis")
-            
-            # Add explanation of the heatmap
-            st.markdown("""
-                <div style='background-color: #1e1e1e; padding: 15px; border-radius: 10px; margin: 10px 0;'>
-                    <h4 style='color: #00ff00; margin: 0;'>How to Read the Risk Heatmap</h4>
-                    <ul style='color: white; margin: 10px 0;'>
-                        <li>Colors indicate risk levels from green (low) to red (high)</li>
-                        <li>Hover over colored areas to see detailed risk information</li>
-                        <li>Click on points for additional details about specific risks</li>
-                        <li>Consider avoiding red zones during your journey</li>
-                    </ul>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            # Fetch live data
-            current_weather = get_current_weather(current_location)  # Fetch current weather
-            weather_alerts = get_weather_alerts(current_location)
-            traffic_incidents = get_traffic_incidents(current_location)
-            seismic_activity = get_seismic_activity()
-
-            # Check if it is currently raining
-            if current_weather and 'weather' in current_weather:
-                is_raining = any(condition['main'].lower() == 'rain' for condition in current_weather['weather'])
-                rain_status = "It is currently raining." if is_raining else "It is not raining."
-                st.markdown(f"<div style='background-color: #4CAF50; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
-                            f"<strong>Weather Status:</strong> {rain_status}</div>", unsafe_allow_html=True)
-
-            # Define a function to calculate distance
-            def calculate_distance(lat1, lon1, lat2, lon2):
-                return geodesic((lat1, lon1), (lat2, lon2)).meters
-
-            # Prepare data for heatmap and filter incidents
-            heatmap_data = []
-            nearby_incidents = []
-            radius = 5000  # 5 km radius for filtering incidents
-
-            # Process weather alerts for rain
-            rain_alerts = [alert for alert in weather_alerts if 'rain' in alert['event'].lower()]
-
-            if rain_alerts:
-                for alert in rain_alerts:
-                    st.markdown(f"<div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
-                                f"<strong>Weather Alert:</strong> {alert['description']}</div>", unsafe_allow_html=True)
-
-            # Process traffic incidents
-            if traffic_incidents:
-                for incident in traffic_incidents[:4]:  # Limit to first 4 incidents
-                    incident_lat = incident['geometry']['location']['lat']
-                    incident_lng = incident['geometry']['location']['lng']
-                    distance = calculate_distance(current_location['lat'], current_location['lng'], incident_lat, incident_lng)
-                    if distance <= radius:
-                        nearby_incidents.append({
-                            'type': 'Traffic Incident',
-                            'description': incident['name'],
-                            'distance': distance,
-                            'precautions': "Avoid the area if possible and follow detour signs."
-                        })
-                        heatmap_data.append({
-                            'lat': incident_lat,
-                            'lng': incident_lng,
-                            'intensity': 1  # Example intensity
-                        })
-
-            if seismic_activity:
-                for quake in seismic_activity:
-                    quake_lat = quake['geometry']['coordinates'][1]
-                    quake_lng = quake['geometry']['coordinates'][0]
-                    distance = calculate_distance(current_location['lat'], current_location['lng'], quake_lat, quake_lng)
-                    if distance <= radius:
-                        nearby_incidents.append({
-                            'type': 'Earthquake',
-                            'description': f"Magnitude {quake['properties']['mag']} at {quake['properties']['place']}",
-                            'distance': distance,
-                            'precautions': "Drop, Cover, and Hold On. Stay away from windows."
-                        })
-                        heatmap_data.append({
-                            'lat': quake_lat,
-                            'lng': quake_lng,
-                            'intensity': 1  # Example intensity
-                        })
-
-            # Create heatmap
-            heatmap = create_dynamic_heatmap(heatmap_data, current_location)
-            folium_static(heatmap)
-
-            # Display nearby incidents with descriptions and precautions
-            if nearby_incidents:
-                st.subheader("⚠️ Nearby Incidents")
-                for incident in nearby_incidents:
-                    st.markdown(f"<div style='background-color: #ff4b4b; padding: 10px; border-radius: 5px; margin: 5px 0;'>"
-                                f"<strong>{incident['type']}</strong>: {incident['description']}<br>"
-                                f"Distance: {incident['distance']:.2f} meters<br>"
-                                f"<em>Precautions: {incident['precautions']}</em></div>", unsafe_allow_html=True)
-            else:
-                st.success("No nearby incidents at this time.")
+        display_service_health()
 
-            # Refresh button for live data
-            if st.button("Refresh Data"):
-                st.rerun()
+        # Main content area with tabs
+        if st.session_state.lazy_tabs:
+            # Only the active tab is built; the other tab's data is fetched in the background
+            active_tab = st.radio("View", list(TAB_RENDERERS), horizontal=True,
+                                  key='active_tab', label_visibility='collapsed')
+            TAB_RENDERERS[active_tab](graph, current_location)
+            if current_location and not st.session_state.offline_mode:
+                graph.prefetch([product for tab, products in TAB_PRODUCTS.items()
+                                if tab != active_tab for product in products],
+                               priority=PRIORITY_BACKGROUND)
+        else:
+            tab1, tab2 = st.tabs(list(TAB_RENDERERS))
+            with tab1:
+                render_live_map_tab(graph, current_location)
+            with tab2:
+                render_risk_analysis_tab(graph, current_location)
 
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
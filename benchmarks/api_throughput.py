@@ -0,0 +1,174 @@
+"""
+Throughput and latency of the headless JSON API under concurrent keep-alive clients
+
+Usage: python benchmarks/api_throughput.py [--url URL] [--clients N] [--seconds S] [--path PATH]
+                                           [--stub-upstream MS] [--locations N]
+Without --url an in-process server is started on a free port.
+
+Without API keys the endpoints fail fast with 502, which measures no real
+work. --stub-upstream replaces the HTTP session and Google Maps client
+of the in-process server with stubs answering canned payloads after MS
+milliseconds, so requests go through the source caches, shared cache, quota and
+circuit breakers as they do in production. --locations spreads the requests
+over N distinct ~100 m cells, so some of them miss the caches.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from itertools import cycle
+from urllib.parse import urlparse, urlencode, parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payload_codec import openweather, usgs, places, directions
+
+DEFAULT_PATH = '/risk?lat=17.537348&lng=78.384515'
+
+class StubResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+class StubSession:
+    """HTTP session answering OpenWeather and USGS URLs with canned payloads after a delay"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get(self, url, timeout=None, **kwargs):
+        time.sleep(self.delay)
+        if 'air_pollution' in url:
+            return StubResponse({'list': [{'main': {'aqi': 2}}]})
+        if 'openweathermap' in url:
+            return StubResponse(openweather())
+        return StubResponse(usgs())
+
+class StubGmaps:
+    """Google Maps client answering nearby search, place details and directions after a delay"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def places_nearby(self, **kwargs):
+        time.sleep(self.delay)
+        return places(5)
+
+    def place(self, place_id, fields=None):
+        time.sleep(self.delay)
+        return {'result': {'formatted_address': f"Address of {place_id}", 'rating': 4.1}}
+
+    def directions(self, **kwargs):
+        time.sleep(self.delay)
+        return directions()
+
+def stub_upstream(delay):
+    """Route every upstream call of this process to the stubs; call before the API is imported"""
+    os.environ.setdefault('OPENWEATHER_API_KEY', 'stub')
+    os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'stub')
+    # Keep the benchmark's entries out of the real shared cache
+    os.environ['SAFESPHERE_SHARED_CACHE'] = os.path.join(tempfile.mkdtemp(), 'shared_cache.sqlite3')
+    from clients import registry
+
+    registry.register('http', lambda: StubSession(delay))
+    registry.register('gmaps', lambda: StubGmaps(delay))
+
+def spread_paths(path, locations):
+    """Copies of a path moved to `locations` distinct ~100 m cells"""
+    url = urlparse(path)
+    params = dict(parse_qsl(url.query))
+    if locations <= 1 or 'lat' not in params:
+        return [path]
+    paths = []
+    for index in range(locations):
+        moved = dict(params, lat=f"{float(params['lat']) + index * 0.001:.6f}")
+        paths.append(f"{url.path}?{urlencode(moved)}")
+    return paths
+
+def client(host, port, paths, deadline, latencies, statuses):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    for path in cycle(paths):
+        if time.perf_counter() >= deadline:
+            break
+        start = time.perf_counter()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+    connection.close()
+
+def run(host, port, paths, clients, seconds):
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + seconds
+    # Clients start at different paths so they do not move through the cells in lockstep
+    threads = [threading.Thread(target=client, args=(host, port, paths[index:] + paths[:index],
+                                                     deadline, latencies, statuses))
+               for index in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--stub-upstream', type=float, metavar='MS',
+                        help="serve upstream calls from stubs that answer after MS milliseconds")
+    parser.add_argument('--locations', type=int, default=1)
+    args = parser.parse_args()
+
+    server = None
+    if args.stub_upstream is not None:
+        if args.url:
+            parser.error("--stub-upstream only applies to the in-process server")
+        stub_upstream(args.stub_upstream / 1000)
+    paths = spread_paths(args.path, args.locations)
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        from api import APIServer
+        server = APIServer(('127.0.0.1', 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+    # Warm the shared caches and clients before measuring
+    run(host, port, paths[:1], 1, 1)
+    latencies, statuses, elapsed = run(host, port, paths, args.clients, args.seconds)
+    if server:
+        server.shutdown()
+        server.server_close()
+
+    latencies.sort()
+    upstream = f"stubbed upstream ({args.stub_upstream:g} ms)" if args.stub_upstream is not None else "real upstream"
+    print(f"{args.path} over {len(paths)} cells with {args.clients} clients for {elapsed:.1f}s, {upstream}")
+    print(f"requests:   {len(latencies)} ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"statuses:   {statuses}")
+    print(f"latency ms: p50 {statistics.median(latencies) * 1000:.1f}, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}, max {latencies[-1] * 1000:.1f}")
+    if args.stub_upstream is not None:
+        from weather import weather_stats
+        from quota import quota_manager
+
+        granted = sum(counters['granted'] for counters in quota_manager.stats().values())
+        print(f"upstream:   {weather_stats['fetches']} weather fetches, {granted} Google calls granted by the quota")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Size and encode/decode time of cached source payloads as pickle, JSON and
+JSON+zlib versus codec.encode of the projected payload
+
+The payloads mimic the shape and size of real OpenWeather, USGS, Places and
+Directions responses, including the fields SafeSphere never reads.
+
+Usage: python benchmarks/payload_codec.py [repeats]
+"""
+import json
+import os
+import pickle
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+from codec import project, encode, decode
+
+def openweather():
+    return {
+        'coord': {'lon': 78.4867, 'lat': 17.385},
+        'weather': [{'id': 802, 'main': 'Clouds', 'description': 'scattered clouds', 'icon': '03d'}],
+        'base': 'stations',
+        'main': {'temp': 31.2, 'feels_like': 33.9, 'temp_min': 30.1, 'temp_max': 32.4, 'pressure': 1008,
+                 'humidity': 58, 'sea_level': 1008, 'grnd_level': 955},
+        'visibility': 6000,
+        'wind': {'speed': 4.12, 'deg': 270, 'gust': 6.3},
+        'clouds': {'all': 40},
+        'dt': 1718000000,
+        'sys': {'type': 1, 'id': 9214, 'country': 'IN', 'sunrise': 1717977000, 'sunset': 1718024000},
+        'timezone': 19800,
+        'id': 1269843,
+        'name': 'Hyderabad',
+        'cod': 200,
+    }
+
+def usgs(features=150):
+    return {
+        'type': 'FeatureCollection',
+        'metadata': {'generated': 1718000000000, 'url': 'https://earthquake.usgs.gov/...', 'title': 'USGS All Earthquakes',
+                     'status': 200, 'api': '1.10.3', 'count': features},
+        'features': [
+            {
+                'type': 'Feature',
+                'properties': {
+                    'mag': 1.2 + i % 40 / 10, 'place': f"{i} km NNE of Ridgecrest, CA", 'time': 1718000000000 - i * 60000,
+                    'updated': 1718000100000, 'tz': None, 'url': f"https://earthquake.usgs.gov/earthquakes/eventpage/ci{i}",
+                    'detail': f"https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/ci{i}.geojson",
+                    'felt': None, 'cdi': None, 'mmi': None, 'alert': None, 'status': 'automatic', 'tsunami': 0,
+                    'sig': 22, 'net': 'ci', 'code': f"{40000000 + i}", 'ids': f",ci{40000000 + i},",
+                    'sources': ',ci,', 'types': ',nearby-cities,origin,phase-data,scitech-link,',
+                    'nst': 17, 'dmin': 0.05, 'rms': 0.15, 'gap': 78, 'magType': 'ml', 'type': 'earthquake',
+                    'title': f"M 1.5 - {i} km NNE of Ridgecrest, CA",
+                },
+                'geometry': {'type': 'Point', 'coordinates': [-117.6 + i * 1e-3, 35.6 + i * 1e-3, 7.9]},
+                'id': f"ci{40000000 + i}",
+            }
+            for i in range(features)
+        ],
+        'bbox': [-179.9, -60.1, -2.1, 179.9, 71.4, 620.5],
+    }
+
+def places(results=20):
+    return {
+        'html_attributions': [],
+        'next_page_token': 'AUc7tXX' + 'x' * 300,
+        'results': [
+            {
+                'business_status': 'OPERATIONAL',
+                'geometry': {
+                    'location': {'lat': 17.38 + i * 1e-3, 'lng': 78.48 + i * 1e-3},
+                    'viewport': {'northeast': {'lat': 17.39 + i * 1e-3, 'lng': 78.49 + i * 1e-3},
+                                 'southwest': {'lat': 17.37 + i * 1e-3, 'lng': 78.47 + i * 1e-3}},
+                },
+                'icon': 'https://maps.gstatic.com/mapfiles/place_api/icons/v1/png_71/doctor-71.png',
+                'icon_background_color': '#F88181',
+                'icon_mask_base_uri': 'https://maps.gstatic.com/mapfiles/place_api/icons/v2/hospital-H_pinlet',
+                'name': f"Care Hospital {i}",
+                'opening_hours': {'open_now': True},
+                'photos': [{'height': 3000, 'width': 4000,
+                            'html_attributions': ['<a href="https://maps.google.com/maps/contrib/1">A user</a>'],
+                            'photo_reference': 'AUc7tXV' + 'p' * 200}],
+                'place_id': f"ChIJ{i:04d}abcdefghijklmno",
+                'plus_code': {'compound_code': '9FQ8+X7 Hyderabad, Telangana', 'global_code': '7J9W9FQ8+X7'},
+                'rating': 4.1,
+                'reference': f"ChIJ{i:04d}abcdefghijklmno",
+                'scope': 'GOOGLE',
+                'types': ['hospital', 'health', 'point_of_interest', 'establishment'],
+                'user_ratings_total': 1520 + i,
+                'vicinity': f"{i} Road No. 1, Banjara Hills, Hyderabad",
+            }
+            for i in range(results)
+        ],
+        'status': 'OK',
+    }
+
+def directions(steps=25):
+    step = lambda i: {
+        'distance': {'text': '350 m', 'value': 350},
+        'duration': {'text': '1 min', 'value': 61},
+        'end_location': {'lat': 17.38 + (i + 1) * 1e-3, 'lng': 78.48 + (i + 1) * 1e-3},
+        'html_instructions': f"Turn <b>left</b> onto <b>Road No. {i}</b>",
+        'maneuver': 'turn-left',
+        'polyline': {'points': 'ohqfBcbu|M' + 'a' * 60},
+        'start_location': {'lat': 17.38 + i * 1e-3, 'lng': 78.48 + i * 1e-3},
+        'travel_mode': 'DRIVING',
+    }
+    return [{
+        'bounds': {'northeast': {'lat': 17.41, 'lng': 78.51}, 'southwest': {'lat': 17.38, 'lng': 78.48}},
+        'copyrights': 'Map data ©2024 Google',
+        'legs': [{
+            'distance': {'text': '8.8 km', 'value': 8750},
+            'duration': {'text': '25 mins', 'value': 1525},
+            'end_address': 'Care Hospital, Road No. 1, Banjara Hills, Hyderabad, Telangana 500034, India',
+            'end_location': {'lat': 17.41, 'lng': 78.51},
+            'start_address': 'Abids, Hyderabad, Telangana, India',
+            'start_location': {'lat': 17.38, 'lng': 78.48},
+            'steps': [step(i) for i in range(steps)],
+            'traffic_speed_entry': [],
+            'via_waypoint': [],
+        }],
+        'overview_polyline': {'points': 'ohqfBcbu|M' + 'b' * 400},
+        'summary': 'Road No. 1',
+        'warnings': [],
+        'waypoint_order': [],
+    }]
+
+PAYLOADS = [
+    ('openweather', openweather()),
+    ('usgs', usgs()),
+    ('google_places', places()),
+    ('google_directions', directions()),
+]
+
+def timed(fn, repeats):
+    """Mean microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+def formats(source):
+    """(name, encode, decode) of every format compared"""
+    return [
+        ('pickle', lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+        ('json', lambda value: json.dumps(value).encode('utf-8'), json.loads),
+        ('json+zlib', lambda value: zlib.compress(json.dumps(value).encode('utf-8')),
+         lambda data: json.loads(zlib.decompress(data))),
+        ('codec', encode, decode),
+        ('project+codec', lambda value: encode(project(source, value)), decode),
+    ]
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    body = 'msgpack' if codec.msgpack is not None else 'json'
+    compression = 'zstd' if codec.zstandard is not None else 'zlib'
+    print(f"codec: {body} + {compression}, {repeats} repeats")
+    print(f"{'payload':<18} {'format':<14} {'bytes':>8} {'vs pickle':>10} {'encode us':>10} {'decode us':>10}")
+    totals = {}
+    for source, payload in PAYLOADS:
+        baseline = None
+        for name, dump, load in formats(source):
+            data = dump(payload)
+            encode_us = timed(lambda: dump(payload), repeats)
+            decode_us = timed(lambda: load(data), repeats)
+            baseline = baseline or len(data)
+            totals[name] = totals.get(name, 0) + len(data)
+            print(f"{source:<18} {name:<14} {len(data):>8} {len(data) / baseline:>9.0%} {encode_us:>10.1f} {decode_us:>10.1f}")
+    print()
+    for name, total in totals.items():
+        print(f"{'all payloads':<18} {name:<14} {total:>8} {total / totals['pickle']:>9.0%}")
+
+if __name__ == "__main__":
+    main()
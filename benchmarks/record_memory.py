@@ -0,0 +1,89 @@
+"""
+Per-session memory footprint of alerts, places, routes, incidents and location
+snapshots as plain dicts versus slotted records
+
+Usage: python benchmarks/record_memory.py [sessions]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Alert, Place, Route, RouteStep, Incident, LocationSnapshot
+
+# Typical contents of one session
+ALERTS = 20
+PLACES = 12
+ROUTE_STEPS = 25
+INCIDENTS = 50
+SNAPSHOTS = 100
+
+def build_session(index):
+    """One session's worth of records"""
+    now = time.time()
+    lat, lng = 17.5 + index * 1e-4, 78.4 + index * 1e-4
+    return {
+        'alerts': [
+            Alert(id=f"usgs:us{index}x{i}", type='earthquake', severity='medium',
+                  message=f"Earthquake detected: Magnitude 3.{i} at {i} km N of Town",
+                  lat=lat + i * 1e-3, lng=lng, timestamp='2024-01-01T00:00:00',
+                  first_seen=now, last_seen=now, expires_at=now + 3600)
+            for i in range(ALERTS)
+        ],
+        'support_locations': [
+            Place(place_id=f"ChIJ{index}x{i}", name=f"City Hospital {i}", type='hospital',
+                  lat=lat + i * 1e-3, lng=lng - i * 1e-3, address=f"{i} Main Road, Hyderabad", rating=4.1)
+            for i in range(PLACES)
+        ],
+        'route': Route(
+            distance='4.2 km', duration='12 mins',
+            coordinates=[(lat + i * 1e-4, lng + i * 1e-4) for i in range(ROUTE_STEPS + 1)],
+            steps=[RouteStep(f"Turn <b>left</b> onto Road {i}", '350 m', '1 min') for i in range(ROUTE_STEPS)]
+        ),
+        'incidents': [
+            Incident(lat=lat + i * 1e-3, lng=lng, type='traffic', severity='medium', id=f"places:{index}x{i}",
+                     label='Traffic Incident', description=f"Junction {i}",
+                     precautions="Avoid the area if possible and follow detour signs.")
+            for i in range(INCIDENTS)
+        ],
+        'location_history': [
+            LocationSnapshot(lat + i * 1e-5, lng, now - i, 20.0) for i in range(SNAPSHOTS)
+        ],
+    }
+
+def as_dicts(session):
+    """The same session in the dict representation used before the record types"""
+    return {
+        'alerts': [alert.to_dict() for alert in session['alerts']],
+        'support_locations': [place.to_dict() for place in session['support_locations']],
+        'route': session['route'].to_dict(),
+        'incidents': [incident.to_dict() for incident in session['incidents']],
+        'location_history': [snapshot.to_dict() for snapshot in session['location_history']],
+    }
+
+def measure(build, sessions):
+    """Bytes allocated by build() for every session, keeping all of them alive"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(index) for index in range(sessions)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # The dict variant converts freshly built records, so both hold the same strings and numbers
+    dict_bytes = measure(lambda index: as_dicts(build_session(index)), sessions)
+    record_bytes = measure(build_session, sessions)
+
+    print(f"{sessions} sessions")
+    print(f"{'representation':<16} {'per session (KiB)':>18} {'total (MiB)':>12}")
+    for name, total in (('dicts', dict_bytes), ('records', record_bytes)):
+        print(f"{name:<16} {total / sessions / 1024:>18.1f} {total / 2 ** 20:>12.2f}")
+    print(f"saved: {(1 - record_bytes / dict_bytes) * 100:.0f}%")
+
+if __name__ == "__main__":
+    main()
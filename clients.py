@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import streamlit as st
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from startup import record_startup_cost
+
+# Connection pool size of every HTTP client; shared by all sessions of the process
+POOL_SIZE = 20
+
+class ClientRegistry:
+    """
+    Thread-safe registry owning one instance of every external client per process
+    Clients are built on first use, shared by all sessions and modules, and
+    their usage and health is counted for diagnostics
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Declare how a client is built"""
+        with self._lock:
+            self._factories[name] = factory
+            self._stats.setdefault(name, {
+                'created': False,
+                'construct_seconds': None,
+                'acquisitions': 0,
+                'errors': 0,
+                'last_error': None
+            })
+
+    def get(self, name):
+        """Return the shared client, building it once even when several threads ask at the same time"""
+        with self._lock:
+            stats = self._stats[name]
+            stats['acquisitions'] += 1
+            if name in self._clients:
+                return self._clients[name]
+
+            start = time.perf_counter()
+            client = self._factories[name]()
+            elapsed = time.perf_counter() - start
+            self._clients[name] = client
+            stats['created'] = True
+            stats['construct_seconds'] = elapsed
+        record_startup_cost(f"client {name}", elapsed)
+        return client
+
+    def record_error(self, name, error):
+        """Count a failed call made with a client"""
+        with self._lock:
+            stats = self._stats[name]
+            stats['errors'] += 1
+            stats['last_error'] = str(error)
+
+    def health(self):
+        """Per-client usage counters and whether the client is available"""
+        with self._lock:
+            return {
+                name: dict(stats, healthy=stats['created'] and self._clients.get(name) is not None)
+                for name, stats in self._stats.items()
+            }
+
+    def close(self):
+        """Close the connection pools of all clients"""
+        with self._lock:
+            for client in self._clients.values():
+                close = getattr(client, 'close', None)
+                if callable(close):
+                    close()
+            self._clients.clear()
+
+def create_requests_session():
+    """Create a requests session with retry logic and a connection pool"""
+    session = requests.Session()
+    # Keep retries short: failing sources are handled by circuit breakers and stale data
+    # in resilience, and a 404 will not go away by asking again
+    retry_strategy = Retry(
+        total=2,  # number of retries
+        backoff_factor=0.3,  # wait 0.3, 0.6 seconds between retries
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["HEAD", "GET", "POST", "OPTIONS"]
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _create_gmaps():
+    import googlemaps
+
+    google_maps_key = os.getenv('GOOGLE_MAPS_API_KEY')
+    if not google_maps_key:
+        st.error("Google Maps API key is missing. Please check your .env file.")
+        return None
+    try:
+        gmaps = googlemaps.Client(key=google_maps_key)
+        # googlemaps keeps its own requests session; size its pool for concurrent sessions
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        gmaps.session.mount("https://", adapter)
+        return gmaps
+    except Exception as e:
+        st.error(f"Error initializing Google Maps client: {str(e)}")
+        return None
+
+def _create_groq():
+    import httpx
+    from groq import Groq
+
+    groq_api_key = os.getenv('GROQ_API_KEY')
+    if not groq_api_key:
+        st.error("Groq API key is missing. Please check your .env file.")
+    try:
+        http_client = httpx.Client(limits=httpx.Limits(max_connections=POOL_SIZE))
+        return Groq(api_key=groq_api_key, http_client=http_client)
+    except Exception as e:
+        st.error(f"Error initializing Groq client: {str(e)}")
+        return None
+
+def _create_geolocator():
+    from geopy.geocoders import Nominatim
+
+    return Nominatim(user_agent="urban_safety_app")
+
+def _create_sentiment_analyzer():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+    # Loads the VADER lexicon from disk
+    return SentimentIntensityAnalyzer()
+
+registry = ClientRegistry()
+registry.register('http', create_requests_session)
+registry.register('gmaps', _create_gmaps)
+registry.register('groq', _create_groq)
+registry.register('geolocator', _create_geolocator)
+registry.register('sentiment_analyzer', _create_sentiment_analyzer)
+
+def get_http_session():
+    """Shared pooled HTTP session for OpenWeather, USGS and other REST sources"""
+    return registry.get('http')
+
+def get_gmaps():
+    """Shared Google Maps client (None if the API key is missing)"""
+    return registry.get('gmaps')
+
+def get_groq_client():
+    """Shared Groq client (None if it could not be created)"""
+    return registry.get('groq')
+
+def get_geolocator():
+    """Shared Nominatim geocoder"""
+    return registry.get('geolocator')
+
+def get_sentiment_analyzer():
+    """Shared VADER sentiment analyzer"""
+    return registry.get('sentiment_analyzer')
@@ -0,0 +1,115 @@
+import json
+import zlib
+
+# Optional accelerators: msgpack for the body and zstd for compression; JSON and zlib otherwise
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'\xa5S'
+JSON, MSGPACK = 0, 1
+NONE, ZLIB, ZSTD = 0, 1, 2
+COMPRESS_ABOVE = 256  # bytes; smaller bodies are stored as they are
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Fields of each source's payloads SafeSphere reads; everything else is dropped before
+# a payload is cached. A dict keeps the listed keys, True keeps a value whole, and
+# lists have the spec applied to every item.
+PLACE_FIELDS = {'place_id': True, 'name': True, 'vicinity': True, 'rating': True, 'geometry': {'location': True}}
+DISTANCE_TEXT = {'text': True}
+PROJECTIONS = {
+    'openweather': {
+        'coord': True,
+        'name': True,
+        'dt': True,
+        'visibility': True,
+        'main': {'temp': True, 'feels_like': True, 'humidity': True, 'pressure': True},
+        'weather': {'main': True, 'description': True},
+        'wind': {'speed': True},
+        'alerts': {'event': True, 'start': True, 'end': True, 'description': True},
+    },
+    'openweather_air': {'list': {'main': {'aqi': True}}},
+    'usgs': {
+        'features': {
+            'id': True,
+            'geometry': {'coordinates': True},
+            'properties': {'mag': True, 'place': True, 'time': True},
+        },
+    },
+    'google_places': {
+        'status': True,
+        'results': PLACE_FIELDS,
+        'result': {'formatted_address': True, 'name': True, 'rating': True, 'geometry': {'location': True}},
+    },
+    'google_directions': {
+        'legs': {
+            'distance': DISTANCE_TEXT,
+            'duration': DISTANCE_TEXT,
+            'steps': {
+                'html_instructions': True,
+                'distance': DISTANCE_TEXT,
+                'duration': DISTANCE_TEXT,
+                'start_location': True,
+                'end_location': True,
+            },
+        },
+    },
+}
+
+def _apply(value, spec):
+    if spec is True:
+        return value
+    if isinstance(value, list):
+        return [_apply(item, spec) for item in value]
+    if isinstance(value, dict):
+        return {key: _apply(value[key], sub) for key, sub in spec.items() if key in value}
+    return value
+
+def project(source, payload):
+    """Reduce a source's payload to the fields SafeSphere uses (unknown sources are kept whole)"""
+    spec = PROJECTIONS.get(source)
+    return payload if spec is None else _apply(payload, spec)
+
+def encode(value):
+    """
+    Compact bytes of a JSON-like value: msgpack (or JSON) compressed with zstd (or zlib)
+    A two byte magic and a format byte lead the body, so decode() reads data written
+    with any combination. Raises TypeError for values that are not JSON-like.
+    """
+    if msgpack is not None:
+        body, serializer = msgpack.packb(value, use_bin_type=True), MSGPACK
+    else:
+        body, serializer = json.dumps(value, separators=(',', ':'), allow_nan=False).encode('utf-8'), JSON
+    compression = NONE
+    if len(body) > COMPRESS_ABOVE:
+        if zstandard is not None:
+            body, compression = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), ZSTD
+        else:
+            body, compression = zlib.compress(body, ZLIB_LEVEL), ZLIB
+    return MAGIC + bytes([serializer << 4 | compression]) + body
+
+def decode(data):
+    """Value of bytes written by encode(); plain JSON text (older cache rows) is accepted too"""
+    if isinstance(data, str):
+        return json.loads(data)
+    if data[:2] != MAGIC:
+        raise ValueError("not an encoded payload")
+    serializer, compression = data[2] >> 4, data[2] & 0x0f
+    body = data[3:]
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ValueError("payload is zstd compressed but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression == ZLIB:
+        body = zlib.decompress(body)
+    if serializer == MSGPACK:
+        if msgpack is None:
+            raise ValueError("payload is msgpack encoded but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
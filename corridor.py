@@ -0,0 +1,73 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from weather import get_weather_report, conditions
+from risk_surface import METERS_PER_DEGREE
+from trajectory import pairwise_haversine_m
+
+CORRIDOR_CELL = 0.05  # degrees (~5 km); weather is fetched once per cell of this grid
+MAX_SAMPLES = 64  # points sampled along a route, however long it is
+MAX_WORKERS = 6  # cells fetched concurrently
+
+def sample_route(coordinates, cell_size=CORRIDOR_CELL, max_samples=MAX_SAMPLES):
+    """
+    Points along a route polyline with their distance from the start
+    The spacing adapts to the grid and the route: half a cell, so no cell the
+    route crosses is missed, widened on long routes to stay within max_samples
+    Returns: (lats, lngs, distances) arrays
+    """
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return points[:, 0], points[:, 1], np.zeros(len(points))
+    cumulative = np.concatenate(([0.0], np.cumsum(pairwise_haversine_m(points[:, 0], points[:, 1]))))
+    length = cumulative[-1]
+    cell_m = cell_size * METERS_PER_DEGREE * max(math.cos(math.radians(points[0, 0])), 0.01)
+    spacing = max(cell_m / 2, length / (max_samples - 1), 1.0)
+    distances = np.append(np.arange(0, length, spacing), length)
+    return np.interp(distances, cumulative, points[:, 0]), np.interp(distances, cumulative, points[:, 1]), distances
+
+def cell_center(lat, lng, cell_size=CORRIDOR_CELL):
+    """Center of the grid cell containing a point"""
+    return (round((math.floor(lat / cell_size) + 0.5) * cell_size, 3),
+            round((math.floor(lng / cell_size) + 0.5) * cell_size, 3))
+
+def corridor_segments(coordinates, cell_size=CORRIDOR_CELL):
+    """Split a route into segments, one per run of consecutive samples in the same cell"""
+    lats, lngs, distances = sample_route(coordinates, cell_size)
+    segments = []
+    for lat, lng, distance in zip(lats.tolist(), lngs.tolist(), distances.tolist()):
+        cell = cell_center(lat, lng, cell_size)
+        if segments and segments[-1]['cell'] == cell:
+            segments[-1]['end'] = (lat, lng)
+            segments[-1]['end_m'] = distance
+            continue
+        if segments:
+            # Segments meet where the route leaves a cell
+            segments[-1]['end'] = (lat, lng)
+            segments[-1]['end_m'] = distance
+        segments.append({'cell': cell, 'start': (lat, lng), 'end': (lat, lng), 'start_m': distance, 'end_m': distance})
+    return segments
+
+def _cell_weather(cell):
+    try:
+        return conditions(get_weather_report({'lat': cell[0], 'lng': cell[1]})['weather'])
+    except Exception:
+        return None
+
+def corridor_weather(route, cell_size=CORRIDOR_CELL):
+    """
+    Weather along a route, per corridor segment
+    Each unique grid cell the route crosses is fetched once, concurrently and through
+    the source cache, so a 30 km route costs a handful of (mostly cached) lookups
+    Returns: list of segment dicts with 'cell', 'start', 'end', 'start_m', 'end_m'
+    and 'weather' (get_weather's shape, or None where it is unavailable)
+    """
+    if not route or not route.coordinates:
+        return []
+    segments = corridor_segments(route.coordinates, cell_size)
+    cells = list(dict.fromkeys(segment['cell'] for segment in segments))
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(cells))) as executor:
+        weather = dict(zip(cells, executor.map(_cell_weather, cells)))
+    for segment in segments:
+        segment['weather'] = weather[segment['cell']]
+    return segments
@@ -0,0 +1,158 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from groq_api import (
+    get_disaster_alerts,
+    warm_disaster_alerts,
+    get_weather_alerts,
+    get_traffic_incidents,
+    get_seismic_activity,
+    get_current_weather
+)
+from maps import get_nearby_support_locations, fetch_support_locations, get_weather, get_route_to_location
+from weather import get_weather_report, conditions
+from location_cache import get_location_product, is_product_stale
+from quota import quota_priority, PRIORITY_INTERACTIVE
+from prefetch import get_prefetcher
+from corridor import corridor_weather
+
+class DataGraph:
+    """
+    Request-scoped computation graph of data products
+    Every product is computed at most once per rerun, after its dependencies, on
+    the script thread. The upstream fetches of independent products can run ahead
+    in worker threads with prefetch(); workers only return values, all st.* and
+    session_state work stays on the script thread.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._nodes = {}
+        self._results = {}
+        self._locks = {}
+        self._jobs = {}
+        self._futures = {}
+        self._graph_lock = threading.Lock()
+
+    def add(self, name, compute, deps=(), job=None):
+        """
+        Declare a data product
+        Args:
+            name (str): Product name
+            compute (callable): Function receiving the values of deps as positional arguments
+            deps (iterable): Names of the products this one is derived from
+            job (callable): Optional zero-argument fetch prefetch() may run in a worker thread;
+                it must not use st.* or session_state. compute picks up its value with collect()
+        """
+        with self._graph_lock:
+            self._nodes[name] = (compute, tuple(deps))
+            self._locks[name] = threading.Lock()
+            self._results.pop(name, None)
+            if job is None:
+                self._jobs.pop(name, None)
+            else:
+                self._jobs[name] = job
+
+    def get(self, name):
+        """Return a product, computing it and its dependencies on first use"""
+        if name in self._results:
+            return self._results[name]
+
+        compute, deps = self._nodes[name]
+        # Locks are taken in dependency order, so the acyclic graph cannot deadlock
+        with self._locks[name]:
+            if name not in self._results:
+                values = [self.get(dep) for dep in deps]
+                self._results[name] = compute(*values)
+        return self._results[name]
+
+    def forget(self, names):
+        """Drop memoised products, and everything derived from them, so the next get() recomputes them"""
+        for name in names:
+            self._results.pop(name, None)
+            dependents = [node for node, (_, deps) in self._nodes.items() if name in deps]
+            self.forget(dependents)
+
+    def prefetch(self, names, priority=PRIORITY_INTERACTIVE):
+        """
+        Start the jobs of products in background threads and return immediately
+        Each job runs at most once per rerun; Google API calls made by the
+        workers use the given quota priority class
+        """
+        def run(job):
+            try:
+                with quota_priority(priority):
+                    return job()
+            except Exception:
+                # The product's own fetch reports the error on the script thread
+                return None
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        for name in names:
+            if name in self._jobs and name not in self._results and name not in self._futures:
+                self._futures[name] = executor.submit(run, self._jobs[name])
+        executor.shutdown(wait=False)
+
+    def collect(self, name):
+        """Value of a product's prefetched job, waiting for it; None if it was not started or failed"""
+        future = self._futures.pop(name, None)
+        return None if future is None else future.result()
+
+def build_safety_graph(location):
+    """
+    Declare the SafeSphere data products for one rerun
+    location → weather, alerts, support locations → route → weather along the route
+    """
+    graph = DataGraph()
+
+    def product(name, fetch, job=None):
+        """
+        A location-derived product. fetch runs on the script thread and may report
+        errors with st.*; job is its st.*-free counterpart prefetch() runs in a
+        worker, only declared while the session's cached value is stale. A job
+        returning None (failed, or one that only warms the source caches fetch
+        reads) leaves the work to fetch.
+        """
+        # Receives the 'location' product it depends on
+        def compute(location):
+            def fetch_product():
+                value = graph.collect(name)
+                return fetch() if value is None else value
+            return get_location_product(name, location, fetch_product)
+
+        stale = job is not None and (not location or is_product_stale(name, location))
+        graph.add(name, compute, deps=['location'], job=job if stale else None)
+
+    graph.add('location', lambda: location)
+    product('weather', lambda: get_weather(location),
+            job=lambda: conditions(get_weather_report(location)['weather']))
+    # These fetches never call st.*, so they are their own jobs
+    product('current_weather', lambda: get_current_weather(location), job=lambda: get_current_weather(location))
+    product('weather_alerts', lambda: get_weather_alerts(location), job=lambda: get_weather_alerts(location))
+    product('traffic_incidents', lambda: get_traffic_incidents(location), job=lambda: get_traffic_incidents(location))
+    product('seismic_activity', get_seismic_activity, job=get_seismic_activity)
+    # Alerts combine several sources and report each failure, so their job only warms the caches
+    product('alerts', lambda: get_disaster_alerts(location), job=lambda: warm_disaster_alerts(location))
+    # Without a Maps key the client reports the missing key with st.error, so there is no job
+    product('support_locations', lambda: get_nearby_support_locations(location),
+            job=(lambda: fetch_support_locations(location)) if os.getenv('GOOGLE_MAPS_API_KEY') else None)
+    return graph
+
+def add_route_product(graph, location, destination, priority=PRIORITY_INTERACTIVE):
+    """
+    Declare the route to the selected support location
+    Routes computed as the page loads are interactive; only the explicit emergency
+    action passes PRIORITY_EMERGENCY, which gets the whole budget and waits longest
+    """
+    def fetch_route():
+        route = get_route_to_location(location, destination)
+        # Conditions along the way are fetched in the background before the user gets there
+        get_prefetcher().prefetch_route(route)
+        return route
+
+    def route(support_locations):
+        with quota_priority(priority):
+            return get_location_product('route', location, fetch_route, key=destination.place_id)
+
+    graph.add('route', route, deps=['support_locations'])
+    graph.add('route_weather', corridor_weather, deps=['route'])
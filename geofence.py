@@ -0,0 +1,259 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+import numpy as np
+from risk_surface import METERS_PER_DEGREE, haversine_m
+from records import HazardMatch
+
+# Users are indexed in a grid of cells of this size (degrees)
+CELL_SIZE = 0.1
+USER_TIMEOUT = 600  # seconds before a user that stopped reporting leaves the index
+PRUNE_INTERVAL = 30  # seconds between sweeps for stale users and expired hazards
+
+# Radius (meters) of the impact zone of an alert of each type
+IMPACT_RADIUS = {
+    'earthquake': 100000,
+    'weather': 10000,
+    'air_quality': 5000,
+    'traffic': 1000,
+}
+DEFAULT_IMPACT_RADIUS = 5000
+DEFAULT_HAZARD_TTL = 3600
+
+@dataclass(slots=True)
+class Circle:
+    """Circular impact zone"""
+    lat: float
+    lng: float
+    radius_m: float
+
+    def bounds(self):
+        """(south, west, north, east) of the circle"""
+        dlat = self.radius_m / METERS_PER_DEGREE
+        dlng = dlat / max(math.cos(math.radians(self.lat)), 0.01)
+        return self.lat - dlat, self.lng - dlng, self.lat + dlat, self.lng + dlng
+
+    def distances(self, lats, lngs):
+        """Distance in meters of points from the center"""
+        return haversine_m(self.lat, self.lng, lats, lngs)
+
+    def contains(self, lats, lngs):
+        """Boolean mask of the points inside the circle"""
+        return self.distances(lats, lngs) <= self.radius_m
+
+@dataclass(slots=True)
+class Polygon:
+    """Polygonal impact zone given as a sequence of (lat, lng) vertices"""
+    points: tuple
+
+    def bounds(self):
+        lats = [point[0] for point in self.points]
+        lngs = [point[1] for point in self.points]
+        return min(lats), min(lngs), max(lats), max(lngs)
+
+    def distances(self, lats, lngs):
+        return None
+
+    def contains(self, lats, lngs):
+        """Boolean mask of the points inside the polygon (even-odd rule, all points at once)"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        inside = np.zeros(lats.shape, dtype=bool)
+        vertices = np.asarray(self.points, dtype=float)
+        for (lat1, lng1), (lat2, lng2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            crosses = (lat1 > lats) != (lat2 > lats)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lng_at = lng1 + (lats - lat1) * (lng2 - lng1) / (lat2 - lat1)
+            inside ^= crosses & (lngs < lng_at)
+        return inside
+
+def hazard_from_alert(alert):
+    """Circular impact zone of an alert, or None if the alert has no position"""
+    if alert.lat is None or alert.lng is None:
+        return None
+    return Circle(alert.lat, alert.lng, IMPACT_RADIUS.get(alert.type, DEFAULT_IMPACT_RADIUS))
+
+class GeofenceEngine:
+    """
+    Index of active user locations matched against hazard zones
+    Users are bucketed in a grid, so a new hazard is only tested against the users
+    in the cells its bounding box covers, all of them in one vectorized check.
+    A user moving into an active hazard is matched as well. Every (hazard, user)
+    pair is matched once and delivered to the listeners as HazardMatch records.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE, user_timeout=USER_TIMEOUT):
+        self.cell_size = cell_size
+        self.user_timeout = user_timeout
+        # user_id -> (cell, last update); cell -> {user_id: (lat, lng)}
+        self._users = {}
+        self._grid = {}
+        self._next_prune = 0
+        self._hazards = {}
+        self._matched = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.stats = {'evaluations': 0, 'candidates': 0, 'matches': 0, 'listener_errors': 0, 'last_eval_ms': 0.0}
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def add_listener(self, listener):
+        """Call listener(matches) with every batch of new matches"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _emit(self, matches):
+        if not matches:
+            return
+        for listener in self._listeners:
+            try:
+                listener(matches)
+            except Exception:
+                self.stats['listener_errors'] += 1
+
+    def _remove_user(self, user_id):
+        user = self._users.pop(user_id, None)
+        if user is not None:
+            cell = self._grid.get(user[0])
+            if cell is not None:
+                cell.pop(user_id, None)
+                if not cell:
+                    del self._grid[user[0]]
+
+    def update_user(self, user_id, location):
+        """Index or move a user; returns the matches of active hazards the user is now inside"""
+        now = time.time()
+        lat, lng = location['lat'], location['lng']
+        matches = []
+        with self._lock:
+            self._prune(now)
+            self._remove_user(user_id)
+            cell = self._cell(lat, lng)
+            self._users[user_id] = (cell, now)
+            self._grid.setdefault(cell, {})[user_id] = (lat, lng)
+
+            for hazard_id, hazard in self._hazards.items():
+                if (hazard_id, user_id) in self._matched:
+                    continue
+                if hazard['shape'].contains(np.array([lat]), np.array([lng]))[0]:
+                    distances = hazard['shape'].distances(np.array([lat]), np.array([lng]))
+                    matches.append(HazardMatch(
+                        hazard_id, user_id, lat, lng, now,
+                        distance=None if distances is None else float(distances[0]),
+                        hazard=hazard['payload']
+                    ))
+                    self._matched.add((hazard_id, user_id))
+            self.stats['matches'] += len(matches)
+        self._emit(matches)
+        return matches
+
+    def remove_user(self, user_id):
+        """Drop a user from the index"""
+        with self._lock:
+            self._remove_user(user_id)
+
+    def _candidates(self, shape):
+        """Ids and coordinate arrays of the users in the cells covered by a zone's bounding box"""
+        south, west, north, east = shape.bounds()
+        (row0, col0), (row1, col1) = self._cell(south, west), self._cell(north, east)
+        # Walk whichever is smaller: the covered cells or the occupied cells
+        if (row1 - row0 + 1) * (col1 - col0 + 1) <= len(self._grid):
+            cells = [self._grid[(row, col)] for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)
+                     if (row, col) in self._grid]
+        else:
+            cells = [users for (row, col), users in self._grid.items()
+                     if row0 <= row <= row1 and col0 <= col <= col1]
+        ids = []
+        coordinates = []
+        for users in cells:
+            ids.extend(users.keys())
+            coordinates.extend(users.values())
+        coordinates = np.array(coordinates, dtype=float).reshape(-1, 2)
+        return ids, coordinates[:, 0], coordinates[:, 1]
+
+    def add_hazard(self, hazard_id, shape, payload=None, expires_at=None):
+        """
+        Register or update a hazard zone and match it against all indexed users
+        Returns the new matches (users already matched to this hazard are not repeated)
+        """
+        start = time.perf_counter()
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._hazards[hazard_id] = {
+                'shape': shape,
+                'payload': payload,
+                'expires_at': expires_at or now + DEFAULT_HAZARD_TTL
+            }
+            candidates, lats, lngs = self._candidates(shape)
+            matches = []
+            if candidates:
+                inside = np.flatnonzero(shape.contains(lats, lngs))
+                distances = shape.distances(lats[inside], lngs[inside])
+                distances = [None] * len(inside) if distances is None else distances.tolist()
+                for index, lat, lng, distance in zip(inside.tolist(), lats[inside].tolist(),
+                                                     lngs[inside].tolist(), distances):
+                    pair = (hazard_id, candidates[index])
+                    if pair in self._matched:
+                        continue
+                    self._matched.add(pair)
+                    matches.append(HazardMatch(hazard_id, pair[1], lat, lng, now, distance, payload))
+            self.stats['evaluations'] += 1
+            self.stats['candidates'] += len(candidates)
+            self.stats['matches'] += len(matches)
+            self.stats['last_eval_ms'] = (time.perf_counter() - start) * 1000
+        self._emit(matches)
+        return matches
+
+    def remove_hazard(self, hazard_id):
+        """Drop a hazard and forget which users it matched"""
+        with self._lock:
+            self._hazards.pop(hazard_id, None)
+            self._matched = {pair for pair in self._matched if pair[0] != hazard_id}
+
+    def users_in(self, shape):
+        """Ids of the indexed users inside a zone, without recording matches"""
+        with self._lock:
+            candidates, lats, lngs = self._candidates(shape)
+            if not candidates:
+                return []
+            return [candidates[index] for index in np.flatnonzero(shape.contains(lats, lngs))]
+
+    def _prune(self, now):
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        for user_id in [user_id for user_id, user in self._users.items() if now - user[1] > self.user_timeout]:
+            self._remove_user(user_id)
+        expired = [hazard_id for hazard_id, hazard in self._hazards.items() if hazard['expires_at'] <= now]
+        for hazard_id in expired:
+            del self._hazards[hazard_id]
+        if expired or len(self._matched) > 4 * len(self._users) * max(len(self._hazards), 1):
+            self._matched = {pair for pair in self._matched
+                             if pair[0] in self._hazards and pair[1] in self._users}
+
+    def counts(self):
+        """Number of indexed users and active hazards"""
+        with self._lock:
+            return {'users': len(self._users), 'hazards': len(self._hazards), 'cells': len(self._grid)}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_geofence_engine():
+    """Process-wide geofence engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = GeofenceEngine()
+        return _engine
+
+def add_alert_hazards(cell, alerts, changed):
+    """Alert bus listener registering new or changed alerts as hazards"""
+    engine = get_geofence_engine()
+    for alert in changed:
+        shape = hazard_from_alert(alert)
+        if shape is not None:
+            engine.add_hazard(alert.id, shape, payload=alert, expires_at=alert.expires_at)
@@ -1,59 +1,115 @@
 import os
-from groq import Groq
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import numpy as np
 import streamlit as st
-import random
 from datetime import datetime
-import requests
-import googlemaps
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from geopy.distance import geodesic
+from risk_surface import RiskSurface, incidents_from_alerts, haversine_m
+from clients import registry, get_gmaps, get_sentiment_analyzer
+from quota import call_with_quota, QuotaExceeded
+from resilience import fetch_source, fetch_json, location_key
+from alert_store import get_alert_store, make_alert_id
+from records import Alert
+from weather import get_weather_report, threshold_alerts, official_alerts
 
-# Initialize Google Maps client
-try:
-    google_maps_key = os.getenv('GOOGLE_MAPS_API_KEY')
-    if not google_maps_key:
-        st.error("Google Maps API key is missing. Please check your .env file.")
-        gmaps = None
-    else:
-        gmaps = googlemaps.Client(key=google_maps_key)
-except Exception as e:
-    st.error(f"Error initializing Google Maps client: {str(e)}")
-    gmaps = None
+EARTHQUAKE_URL = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/2.5_day.geojson"
+EARTHQUAKE_RADIUS = 100000  # meters around the user within which earthquakes raise an alert
 
-# Initialize Groq client with error handling
-try:
-    groq_api_key = os.getenv('GROQ_API_KEY')
-    if not groq_api_key:
-        st.error("Groq API key is missing. Please check your .env file.")
-    client = Groq(api_key=groq_api_key)
-except Exception as e:
-    st.error(f"Error initializing Groq client: {str(e)}")
-    client = None
+def fetch_recent_earthquakes():
+    """USGS earthquakes of magnitude 2.5+ over the past day (raises like fetch_source)"""
+    return fetch_source('usgs', '2.5_day', lambda: fetch_json(EARTHQUAKE_URL))
 
-analyzer = SentimentIntensityAnalyzer()
+def earthquake_alerts(earthquake_data, location, radius_m=EARTHQUAKE_RADIUS):
+    """Alerts for the USGS features within radius_m of a location, in one vectorized distance pass"""
+    features = earthquake_data['features']
+    if not features:
+        return []
+    coordinates = np.array([feature['geometry']['coordinates'][:2] for feature in features], dtype=float)
+    distances = haversine_m(location['lat'], location['lng'], coordinates[:, 1], coordinates[:, 0])
+    alerts = []
+    for index in np.flatnonzero(distances <= radius_m):
+        feature = features[index]
+        magnitude = feature['properties']['mag']
+        place = feature['properties']['place']
+        alerts.append(Alert(
+            message=f'Earthquake detected: Magnitude {magnitude} at {place}',
+            severity='high' if magnitude >= 4.0 else 'medium',
+            type='earthquake',
+            lat=float(coordinates[index, 1]),
+            lng=float(coordinates[index, 0]),
+            id=make_alert_id('usgs', feature['id']),
+            timestamp=datetime.fromtimestamp(feature['properties']['time'] / 1000).isoformat()
+        ))
+    return alerts
 
-def create_requests_session():
-    """Create a requests session with retry logic"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,  # number of retries
-        backoff_factor=1,  # wait 1, 2, 4 seconds between retries
-        status_forcelist=[500, 502, 503, 504, 404],
-        allowed_methods=["HEAD", "GET", "POST", "OPTIONS"]
+def fetch_traffic_reports(location, gmaps):
+    """Places matching 'traffic incident' within 5 km (raises like fetch_source)"""
+    return fetch_source(
+        'google_places',
+        ('traffic',) + location_key(location),
+        lambda: call_with_quota(
+            'places_nearby',
+            gmaps.places_nearby,
+            location=(location['lat'], location['lng']),
+            radius=5000,
+            keyword='traffic incident'
+        )
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+
+def traffic_alerts(traffic_response):
+    """Alerts for the first three traffic reports of a Places response"""
+    return [
+        Alert(
+            message=f"Traffic incident reported near {incident['name']}",
+            severity='medium',
+            type='traffic',
+            lat=incident['geometry']['location']['lat'],
+            lng=incident['geometry']['location']['lng'],
+            id=make_alert_id('places', incident['place_id'])
+        )
+        for incident in traffic_response.get('results', [])[:3]
+    ]
+
+def fetch_disaster_alerts(location):
+    """
+    Disaster alerts around a location, with their alert store times
+    Free of st.* and raising like fetch_source when the weather or earthquake
+    source fails, for callers off the script thread (API, alert bus). Traffic
+    reports are left out while the quota refuses them.
+    """
+    alerts = threshold_alerts(get_weather_report(location, include_air=True), location)
+    alerts.extend(earthquake_alerts(fetch_recent_earthquakes(), location))
+    if os.getenv('GOOGLE_MAPS_API_KEY'):
+        try:
+            alerts.extend(traffic_alerts(fetch_traffic_reports(location, get_gmaps())))
+        except QuotaExceeded:
+            pass
+    return get_alert_store().observe(alerts)
+
+def warm_disaster_alerts(location):
+    """
+    Fetch the source data get_disaster_alerts reads into the source caches
+    Free of st.*, so it can run off the script thread. Every source is tried;
+    the first failure is raised afterwards. Returns None.
+    """
+    fetches = [
+        lambda: get_weather_report(location, include_air=True),
+        fetch_recent_earthquakes,
+    ]
+    if os.getenv('GOOGLE_MAPS_API_KEY'):
+        fetches.append(lambda: fetch_traffic_reports(location, get_gmaps()))
+    error = None
+    for fetch in fetches:
+        try:
+            fetch()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
 
 def get_disaster_alerts(location):
     """
     Fetch real-time disaster alerts from multiple sources with improved error handling
     """
     alerts = []
-    session = create_requests_session()
     
     try:
         # Weather alerts from OpenWeatherMap
@@ -62,130 +118,45 @@ def get_disaster_alerts(location):
             st.warning("OpenWeather API key is missing")
             return alerts
 
-        # Weather data with retry
+        # Weather and air quality alerts from the location's shared weather report
         try:
-            weather_url = f"http://api.openweathermap.org/data/2.5/weather?lat={location['lat']}&lon={location['lng']}&appid={weather_api_key}&units=metric"
-            weather_response = session.get(weather_url, timeout=10)
-            
-            if weather_response.status_code == 200:
-                weather_data = weather_response.json()
-                
-                if 'main' in weather_data:
-                    temp = weather_data['main']['temp']
-                    humidity = weather_data['main']['humidity']
-                    
-                    # Temperature alerts
-                    if temp > 35:
-                        alerts.append({
-                            'message': f'Extreme heat warning: {temp}°C. Stay hydrated and avoid outdoor activities.',
-                            'severity': 'high',
-                            'type': 'weather',
-                            'timestamp': datetime.now().isoformat()
-                        })
-                    elif temp < 0:
-                        alerts.append({
-                            'message': f'Freezing temperature alert: {temp}°C. Take precautions against cold.',
-                            'severity': 'high',
-                            'type': 'weather',
-                            'timestamp': datetime.now().isoformat()
-                        })
-                    
-                    # Humidity alerts
-                    if humidity > 85:
-                        alerts.append({
-                            'message': f'High humidity warning: {humidity}%. Air quality may be affected.',
-                            'severity': 'medium',
-                            'type': 'weather',
-                            'timestamp': datetime.now().isoformat()
-                        })
+            alerts.extend(threshold_alerts(get_weather_report(location, include_air=True), location))
         except Exception as e:
+            registry.record_error('http', e)
             st.warning(f"Weather data fetch failed: {str(e)}")
 
-        # Air Quality Index with retry
-        try:
-            aqi_url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={location['lat']}&lon={location['lng']}&appid={weather_api_key}"
-            aqi_response = session.get(aqi_url, timeout=10)
-            
-            if aqi_response.status_code == 200:
-                aqi_data = aqi_response.json()
-                if 'list' in aqi_data and len(aqi_data['list']) > 0:
-                    aqi = aqi_data['list'][0]['main']['aqi']
-                    if aqi >= 4:
-                        alerts.append({
-                            'message': 'Poor air quality detected. Sensitive groups should stay indoors.',
-                            'severity': 'high',
-                            'type': 'air_quality',
-                            'timestamp': datetime.now().isoformat()
-                        })
-                    elif aqi == 3:
-                        alerts.append({
-                            'message': 'Moderate air quality. Consider reducing outdoor activities.',
-                            'severity': 'medium',
-                            'type': 'air_quality',
-                            'timestamp': datetime.now().isoformat()
-                        })
-        except Exception as e:
-            st.warning(f"Air quality data fetch failed: {str(e)}")
-
         # Earthquake data with retry
         try:
-            earthquake_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/2.5_day.geojson"
-            earthquake_response = session.get(earthquake_url, timeout=10)
-            
-            if earthquake_response.status_code == 200:
-                earthquake_data = earthquake_response.json()
-                
-                for feature in earthquake_data['features']:
-                    eq_lat = feature['geometry']['coordinates'][1]
-                    eq_lng = feature['geometry']['coordinates'][0]
-                    
-                    # Calculate distance from user's location
-                    distance = geodesic(
-                        (location['lat'], location['lng']),
-                        (eq_lat, eq_lng)
-                    ).kilometers
-                    
-                    # Alert if earthquake is within 100km
-                    if distance <= 100:
-                        magnitude = feature['properties']['mag']
-                        place = feature['properties']['place']
-                        
-                        alerts.append({
-                            'message': f'Earthquake detected: Magnitude {magnitude} at {place}',
-                            'severity': 'high' if magnitude >= 4.0 else 'medium',
-                            'type': 'earthquake',
-                            'timestamp': datetime.now().isoformat()
-                        })
+            # Alert on earthquakes within 100km
+            alerts.extend(earthquake_alerts(fetch_recent_earthquakes(), location))
         except Exception as e:
+            registry.record_error('http', e)
             st.warning(f"Earthquake data fetch failed: {str(e)}")
 
         # Traffic incidents
+        gmaps = get_gmaps()
         if gmaps:
             try:
-                traffic_response = gmaps.places_nearby(
-                    location=(location['lat'], location['lng']),
-                    radius=5000,
-                    keyword='traffic incident'
-                )
-                
-                if 'results' in traffic_response:
-                    for incident in traffic_response['results'][:3]:
-                        alerts.append({
-                            'message': f"Traffic incident reported near {incident['name']}",
-                            'severity': 'medium',
-                            'type': 'traffic',
-                            'timestamp': datetime.now().isoformat()
-                        })
+                alerts.extend(traffic_alerts(fetch_traffic_reports(location, gmaps)))
+            except QuotaExceeded:
+                # Traffic is the least important alert source; skip it until quota is available
+                pass
             except Exception as e:
+                registry.record_error('gmaps', e)
                 st.warning(f"Traffic data fetch failed: {str(e)}")
 
-        return alerts
+        # Give every alert its stable identity and first/last seen times
+        return get_alert_store().observe(alerts)
 
     except Exception as e:
         st.error(f"Error fetching disaster alerts: {str(e)}")
         return []
-    finally:
-        session.close()
+
+def risk_level_at(location, alerts):
+    """Rasterise alerts and read the risk label ('low', 'medium' or 'high') at the location"""
+    surface = RiskSurface(location)
+    surface.add_incidents(incidents_from_alerts(alerts, location))
+    return surface.risk_level(location['lat'], location['lng'])
 
 def analyze_risk_level(location, alerts=None):
     """
@@ -195,31 +166,15 @@ def analyze_risk_level(location, alerts=None):
     try:
         if alerts is None:
             alerts = get_disaster_alerts(location)
-        
-        # Count alerts by severity
-        severity_counts = {
-            'high': 0,
-            'medium': 0,
-            'low': 0
-        }
-        
-        for alert in alerts:
-            severity_counts[alert['severity']] += 1
-        
-        # Calculate risk level
-        if severity_counts['high'] > 0:
-            return 'high'
-        elif severity_counts['medium'] > 0:
-            return 'medium'
-        else:
-            return 'low'
+        return risk_level_at(location, alerts)
     except Exception as e:
         st.error(f"Error analyzing risk level: {str(e)}")
         return 'low'
 
-def get_risk_insights(location):
+def get_risk_insights(location, alerts=None):
     """
     Generate detailed risk insights for a location
+    Pass already fetched alerts to avoid fetching them a second time
     """
     try:
         # Simulate risk insights
@@ -264,7 +219,7 @@ def get_risk_insights(location):
         ]
 
         return {
-            'risk_level': analyze_risk_level(location),
+            'risk_level': analyze_risk_level(location, alerts),
             'risk_factors': risk_factors,
             'recommended_actions': recommended_actions,
             'last_updated': datetime.now().isoformat()
@@ -283,7 +238,7 @@ def analyze_community_update(text):
     Analyze community updates using sentiment analysis
     """
     try:
-        sentiment = analyzer.polarity_scores(text)
+        sentiment = get_sentiment_analyzer().polarity_scores(text)
         return {
             'credible': sentiment['compound'] > -0.5,  # Filter out extremely negative/suspicious posts
             'sentiment': sentiment
@@ -292,28 +247,18 @@ def analyze_community_update(text):
         st.error(f"Error analyzing text: {str(e)}")
         return {'credible': False, 'sentiment': None}
 
-def get_risk_data(location):
+def get_risk_data(location, alerts=None):
     """
-    Generate risk data for heatmap visualization
+    Generate risk data for heatmap visualization from the live alerts
     Returns: List of [lat, lng, weight] for heatmap
     """
     try:
-        # Simulate risk data points around the given location
-        risk_points = []
-        lat, lng = location['lat'], location['lng']
-        
-        # Generate 20 random points around the location
-        for _ in range(20):
-            # Random offset between -0.02 and 0.02 degrees
-            lat_offset = random.uniform(-0.02, 0.02)
-            lng_offset = random.uniform(-0.02, 0.02)
-            
-            # Random weight between 0 and 1
-            weight = random.uniform(0, 1)
-            
-            risk_points.append([lat + lat_offset, lng + lng_offset, weight])
-        
-        return risk_points
+        if alerts is None:
+            alerts = get_disaster_alerts(location)
+
+        surface = RiskSurface(location)
+        surface.add_incidents(incidents_from_alerts(alerts, location))
+        return surface.heatmap_points()
     except Exception as e:
         st.error(f"Error generating risk data: {str(e)}")
         return []
@@ -322,34 +267,26 @@ def get_weather_alerts(location):
     """
     Fetch real-time weather alerts for a given location using OpenWeatherMap API.
     """
-    api_key = os.getenv('OPENWEATHER_API_KEY')
-    lat = location['lat']
-    lon = location['lng']
-    url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}"
-
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('alerts', [])
+        return get_alert_store().observe(official_alerts(get_weather_report(location)['weather']))
     except Exception as e:
+        registry.record_error('http', e)
         return []
 
 def get_traffic_incidents(location):
     """
     Fetch real-time traffic incidents using Google Maps API.
+    Shares the quota-limited traffic reports the disaster alerts are built from.
     """
-    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-    lat = location['lat']
-    lon = location['lng']
-    url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={lat},{lon}&radius=5000&type=traffic&key={api_key}"
+    if not os.getenv('GOOGLE_MAPS_API_KEY'):
+        return []
 
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('results', [])
+        return fetch_traffic_reports(location, get_gmaps()).get('results', [])
+    except QuotaExceeded:
+        return []
     except Exception as e:
+        registry.record_error('http', e)
         return []
 
 def get_seismic_activity():
@@ -359,26 +296,18 @@ def get_seismic_activity():
     url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
 
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data['features']
+        data = fetch_source('usgs', 'all_day', lambda: fetch_json(url))
+        return data['features']
     except Exception as e:
+        registry.record_error('http', e)
         return []
 
 def get_current_weather(location):
     """
     Fetch current weather data for a given location using OpenWeatherMap API.
     """
-    api_key = os.getenv('OPENWEATHER_API_KEY')
-    lat = location['lat']
-    lon = location['lng']
-    url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data  # Return the entire weather data
+        return get_weather_report(location)['weather']  # Return the entire weather data
     except Exception as e:
+        registry.record_error('http', e)
         return None 
\ No newline at end of file
@@ -0,0 +1,105 @@
+import time
+import streamlit as st
+from maps import track_location_changes
+from records import LocationSnapshot
+
+# Spatial validity (meters) and time-to-live (seconds) of every location-derived product.
+# A cached product is reused until the user moves further than its radius or it outlives its TTL.
+PRODUCT_RULES = {
+    'weather': {'radius': 2000, 'ttl': 600},
+    'current_weather': {'radius': 2000, 'ttl': 600},
+    'weather_alerts': {'radius': 2000, 'ttl': 600},
+    'alerts': {'radius': 1000, 'ttl': 300},
+    'traffic_incidents': {'radius': 500, 'ttl': 180},
+    'seismic_activity': {'radius': 5000, 'ttl': 300},
+    'support_locations': {'radius': 500, 'ttl': 3600},
+    'route': {'radius': 50, 'ttl': 300},
+}
+
+# Products that must be recomputed whenever one of their upstream products is
+PRODUCT_DEPENDENCIES = {
+    'route': ['support_locations'],
+}
+
+DEFAULT_RULE = {'radius': 50, 'ttl': 300}
+
+def initialize_product_cache():
+    """Initialize the per-session product cache"""
+    if 'product_cache' not in st.session_state:
+        st.session_state.product_cache = {}
+    if 'product_versions' not in st.session_state:
+        st.session_state.product_versions = {}
+
+def _upstream_versions(name):
+    """Current versions of the products a product depends on"""
+    versions = st.session_state.product_versions
+    return {dep: versions.get(dep, 0) for dep in PRODUCT_DEPENDENCIES.get(name, [])}
+
+def _moved_from(entry, location, radius, max_age_seconds):
+    """Whether the location is beyond radius of the entry's location or the entry is older than max_age_seconds"""
+    return track_location_changes(
+        entry['location'].to_dict(),
+        {'lat': location['lat'], 'lng': location['lng'], 'timestamp': time.time()},
+        threshold_meters=radius,
+        max_age_seconds=max_age_seconds
+    )
+
+def is_product_stale(name, location, key=None):
+    """
+    Check whether a cached product has to be recomputed for the given location
+    Returns True if it was never computed, the user moved beyond its radius,
+    its TTL expired or one of its upstream products changed
+    """
+    initialize_product_cache()
+    entry = st.session_state.product_cache.get((name, key))
+    if entry is None:
+        return True
+
+    rule = PRODUCT_RULES.get(name, DEFAULT_RULE)
+    moved = _moved_from(entry, location, rule['radius'], rule['ttl'])
+    return moved or entry['upstream'] != _upstream_versions(name)
+
+def get_location_product(name, location, fetch, key=None):
+    """
+    Return a location-derived data product, reusing the cached value while it is still valid
+    Args:
+        name (str): Product name, one of PRODUCT_RULES
+        location (dict): Dictionary containing 'lat' and 'lng' keys
+        fetch (callable): Zero-argument function computing the product
+        key: Optional extra cache key (e.g. a destination place_id)
+    Returns:
+        The cached or freshly computed product
+    """
+    if not location:
+        return fetch()
+
+    initialize_product_cache()
+    if not is_product_stale(name, location, key):
+        return st.session_state.product_cache[(name, key)]['value']
+
+    value = fetch()
+    entry = st.session_state.product_cache.get((name, key))
+    # Failed or refused fetches degrade to the last cached value and are retried on the next rerun,
+    # as long as that value was computed within the product's radius (an expired TTL is tolerated)
+    if value is None and entry is not None:
+        rule = PRODUCT_RULES.get(name, DEFAULT_RULE)
+        if not _moved_from(entry, location, rule['radius'], float('inf')):
+            return entry['value']
+        return None
+    if value is not None:
+        st.session_state.product_cache[(name, key)] = {
+            'value': value,
+            'location': LocationSnapshot.from_location(location, time.time()),
+            'upstream': _upstream_versions(name)
+        }
+        versions = st.session_state.product_versions
+        versions[name] = versions.get(name, 0) + 1
+    return value
+
+def invalidate_products(names=None):
+    """Drop cached products so they are refetched on next use (all products if names is None)"""
+    initialize_product_cache()
+    cache = st.session_state.product_cache
+    for cache_key in list(cache):
+        if names is None or cache_key[0] in names:
+            del cache[cache_key]
@@ -1,25 +1,22 @@
-import googlemaps
 import os
-from geopy.geocoders import Nominatim
 import streamlit as st
 import requests
 import json
 from datetime import datetime
 import random
-from geopy.distance import geodesic
 import time
 import streamlit.components.v1 as components
 from streamlit.runtime.scriptrunner import get_script_run_ctx
+from clients import registry, get_gmaps
+from quota import call_with_quota, QuotaExceeded
+from resilience import fetch_source, location_key
+from startup import lazy_import
+from records import Place, Route
+from trajectory import Trajectory
+from weather import get_weather_report, conditions
 
-# Initialize Google Maps client - Add error handling
-try:
-    gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'))
-    if not os.getenv('GOOGLE_MAPS_API_KEY'):
-        st.error("Google Maps API key is missing. Please check your .env file.")
-except Exception as e:
-    st.error(f"Error initializing Google Maps client: {str(e)}")
-    gmaps = None
-geolocator = Nominatim(user_agent="urban_safety_app")
+# geopy imports all of its geocoders on package import, so load it on first use
+geopy_distance = lazy_import('geopy.distance')
 
 def get_default_location():
     """
@@ -51,17 +48,19 @@ def get_precise_location():
     """
     try:
         # First try Google Maps Geolocation API
+        gmaps = get_gmaps()
         if gmaps:
             try:
                 # Basic geolocation request
-                response = gmaps.geolocate()
+                response = call_with_quota('geolocate', gmaps.geolocate)
                 
                 if response and 'location' in response:
                     location = response['location']
                     accuracy = min(response.get('accuracy', 1000), 1000)  # Cap accuracy at 1000m
                     
                     # Get detailed address using reverse geocoding
-                    reverse_geocode = gmaps.reverse_geocode((location['lat'], location['lng']))
+                    reverse_geocode = call_with_quota('reverse_geocode', gmaps.reverse_geocode,
+                                                      (location['lat'], location['lng']))
                     
                     if reverse_geocode and len(reverse_geocode) > 0:
                         address_components = reverse_geocode[0]['address_components']
@@ -92,7 +91,10 @@ def get_precise_location():
                             'timestamp': time.time(),
                             'source': 'google_maps'
                         }
+            except QuotaExceeded as e:
+                st.warning(f"Google Maps geolocation skipped: {str(e)}")
             except Exception as e:
+                registry.record_error('gmaps', e)
                 st.warning(f"Google Maps geolocation failed: {str(e)}")
 
         # # Fallback to IP-based geolocation
@@ -123,93 +125,107 @@ def get_precise_location():
         return get_default_location()
 
 # Rest of the functions remain unchanged
-def get_nearby_support_locations(location):
+def fetch_support_locations(location):
     """
-    Get real nearby emergency services using Google Places API
+    Nearby emergency services from the Google Places API, as Place records
+    Free of st.*, so it can run off the script thread; raises QuotaExceeded when
+    the nearby searches are refused and other errors as they happen
     """
-    try:
-        if not location:
-            return []
-            
-        nearby_places = []
-        
-        # Search types for emergency services
-        place_types = [
-            ('hospital', 'Hospital'),
-            ('police', 'Police Station'),
-            ('fire_station', 'Fire Station'),
-            ('local_government_office', 'Emergency Shelter')
-        ]
+    nearby_places = []
+    gmaps = get_gmaps()
 
-        for place_type, label in place_types:
-            results = gmaps.places_nearby(
+    # Search types for emergency services
+    place_types = [
+        ('hospital', 'Hospital'),
+        ('police', 'Police Station'),
+        ('fire_station', 'Fire Station'),
+        ('local_government_office', 'Emergency Shelter')
+    ]
+
+    for place_type, label in place_types:
+        results = fetch_source(
+            'google_places',
+            (place_type,) + location_key(location),
+            # Bind the type now: a stale entry is revalidated on a background thread after the loop moved on
+            lambda place_type=place_type: call_with_quota(
+                'places_nearby',
+                gmaps.places_nearby,
                 location=(location['lat'], location['lng']),
                 radius=5000,  # 5km radius
                 type=place_type
-            )
+            ),
+            fresh_for=3600
+        )
 
-            for place in results.get('results', [])[:3]:  # Limit to 3 places per type
-                # Get place details
-                place_details = gmaps.place(place['place_id'], fields=['formatted_address', 'name', 'geometry', 'rating'])
-                
-                nearby_places.append({
-                    'name': place['name'],
-                    'type': place_type,
-                    'lat': place['geometry']['location']['lat'],
-                    'lng': place['geometry']['location']['lng'],
-                    'address': place_details['result'].get('formatted_address', 'Address not available'),
-                    'rating': place_details['result'].get('rating', 'N/A'),
-                    'place_id': place['place_id']
-                })
+        for place in results.get('results', [])[:3]:  # Limit to 3 places per type
+            # Get place details, falling back to the nearby search fields when the quota is used up
+            try:
+                place_details = fetch_source(
+                    'google_places',
+                    ('details', place['place_id']),
+                    lambda place_id=place['place_id']: call_with_quota(
+                        'place', gmaps.place, place_id,
+                        fields=['formatted_address', 'name', 'geometry', 'rating']
+                    ),
+                    fresh_for=24 * 3600
+                )['result']
+            except QuotaExceeded:
+                place_details = {'formatted_address': place.get('vicinity'), 'rating': place.get('rating')}
+
+            nearby_places.append(Place.from_places_result(place, place_type, place_details))
 
-        return nearby_places
+    return nearby_places
 
+def get_nearby_support_locations(location):
+    """
+    Get real nearby emergency services using Google Places API
+    """
+    try:
+        if not location:
+            return []
+        return fetch_support_locations(location)
+
+    except QuotaExceeded as e:
+        # None lets the location cache fall back to the last support locations it has
+        st.warning(f"Support locations not refreshed: {str(e)}")
+        return None
     except Exception as e:
+        registry.record_error('gmaps', e)
         st.error(f"Error fetching support locations: {str(e)}")
         return []
 
-def get_route_to_location(origin, destination):
+def fetch_route(origin, destination):
     """
-    Get route information between two points with traffic and risk considerations
+    Driving route from a location to a support location (Place), or None if there is none
+    Free of st.*; raises QuotaExceeded or SourceUnavailable like fetch_source
     """
-    try:
-        directions = gmaps.directions(
+    directions = fetch_source(
+        'google_directions',
+        location_key(origin) + (destination.place_id,),
+        lambda: call_with_quota(
+            'directions',
+            get_gmaps().directions,
             origin=(origin['lat'], origin['lng']),
-            destination=(destination['lat'], destination['lng']),
+            destination=(destination.lat, destination.lng),
             mode="driving",
             alternatives=True,
             departure_time=datetime.now()  # For real-time traffic
         )
-        
-        if directions:
-            route = directions[0]
-            coordinates = []
-            
-            # Extract route coordinates
-            for step in route['legs'][0]['steps']:
-                coordinates.append([
-                    step['start_location']['lat'],
-                    step['start_location']['lng']
-                ])
-            coordinates.append([
-                route['legs'][0]['steps'][-1]['end_location']['lat'],
-                route['legs'][0]['steps'][-1]['end_location']['lng']
-            ])
-            
-            return {
-                'distance': route['legs'][0]['distance']['text'],
-                'duration': route['legs'][0]['duration']['text'],
-                'coordinates': coordinates,
-                'steps': [
-                    {
-                        'instruction': step['html_instructions'],
-                        'distance': step['distance']['text'],
-                        'duration': step['duration']['text']
-                    }
-                    for step in route['legs'][0]['steps']
-                ]
-            }
+    )
+    return Route.from_directions(directions[0]) if directions else None
+
+def get_route_to_location(origin, destination):
+    """
+    Get route information from a location to a support location (Place)
+    with traffic and risk considerations
+    Returns: Route or None
+    """
+    try:
+        return fetch_route(origin, destination)
+    except QuotaExceeded as e:
+        st.warning(f"Route not refreshed: {str(e)}")
     except Exception as e:
+        registry.record_error('gmaps', e)
         st.error(f"Error getting directions: {str(e)}")
     return None
 
@@ -250,23 +266,13 @@ def get_weather(location):
     Get current weather conditions using OpenWeatherMap API
     """
     try:
-        api_key = os.getenv('OPENWEATHER_API_KEY')
-        url = f"http://api.openweathermap.org/data/2.5/weather?lat={location['lat']}&lon={location['lng']}&appid={api_key}&units=metric"
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                'temperature': data['main']['temp'],
-                'humidity': data['main']['humidity'],
-                'description': data['weather'][0]['description'],
-                'wind_speed': data['wind']['speed']
-            }
+        return conditions(get_weather_report(location)['weather'])
     except Exception as e:
+        registry.record_error('http', e)
         st.error(f"Error fetching weather data: {str(e)}")
     return None
 
-def track_location_changes(previous_location, current_location, threshold_meters=50):
+def track_location_changes(previous_location, current_location, threshold_meters=50, max_age_seconds=300):
     """
     Track significant location changes
     Returns True if location has changed significantly
@@ -277,11 +283,11 @@ def track_location_changes(previous_location, current_location, threshold_meters
     prev_coords = (previous_location['lat'], previous_location['lng'])
     curr_coords = (current_location['lat'], current_location['lng'])
     
-    distance = geodesic(prev_coords, curr_coords).meters
+    distance = geopy_distance.geodesic(prev_coords, curr_coords).meters
     time_diff = current_location.get('timestamp', 0) - previous_location.get('timestamp', 0)
     
-    # Return True if moved more than threshold meters or more than 5 minutes passed
-    return distance > threshold_meters or time_diff > 300
+    # Return True if moved more than threshold meters or more than max_age_seconds passed
+    return distance > threshold_meters or time_diff > max_age_seconds
 
 def calculate_movement_metrics(previous_location, current_location):
     """
@@ -294,7 +300,7 @@ def calculate_movement_metrics(previous_location, current_location):
         prev_coords = (previous_location['lat'], previous_location['lng'])
         curr_coords = (current_location['lat'], current_location['lng'])
         
-        distance = geodesic(prev_coords, curr_coords).meters
+        distance = geopy_distance.geodesic(prev_coords, curr_coords).meters
         time_diff = current_location.get('timestamp', 0) - previous_location.get('timestamp', 0)
         
         if time_diff > 0:
@@ -336,6 +342,8 @@ def initialize_session_state():
         st.session_state.emergency_mode = False
     if 'selected_emergency_service' not in st.session_state:
         st.session_state.selected_emergency_service = None
+    if 'location_history' not in st.session_state:
+        st.session_state.location_history = Trajectory()
 
 def main():
     """
@@ -383,16 +391,14 @@ def main():
                 if st.session_state.current_location:
                     st.session_state.previous_location = st.session_state.current_location
                 st.session_state.current_location = current_location
+                st.session_state.location_history.append_location(current_location)
                 
-                # Show movement metrics if available
-                if st.session_state.previous_location:
-                    metrics = calculate_movement_metrics(
-                        st.session_state.previous_location,
-                        st.session_state.current_location
-                    )
-                    if metrics:
-                        st.info(f"Speed: {metrics['speed']:.2f} m/s\n"
-                               f"Distance: {metrics['distance']:.2f} m")
+                # Show movement metrics over the last minute of fixes if available
+                metrics = st.session_state.location_history.movement_metrics(window_seconds=60)
+                if metrics:
+                    st.info(f"Speed: {metrics['current_speed']:.2f} m/s "
+                           f"(avg {metrics['speed']:.2f} m/s), heading {metrics['heading']:.0f}°\n"
+                           f"Distance: {metrics['distance']:.2f} m")
             else:
                 st.error("Could not get location. Using default location.")
                 current_location = get_default_location()
@@ -416,22 +422,19 @@ def main():
         
         if nearby_services:
             for service in nearby_services:
-                with st.expander(f"{service['name']} ({service['type'].replace('_', ' ').title()})"):
-                    st.write(f"Address: {service['address']}")
-                    st.write(f"Rating: {service['rating']}")
-                    if st.button(f"Get Directions to {service['name']}", key=service['place_id']):
-                        route = get_route_to_location(
-                            st.session_state.current_location,
-                            {'lat': service['lat'], 'lng': service['lng']}
-                        )
+                with st.expander(f"{service.name} ({service.type.replace('_', ' ').title()})"):
+                    st.write(f"Address: {service.address}")
+                    st.write(f"Rating: {service.rating}")
+                    if st.button(f"Get Directions to {service.name}", key=service.place_id):
+                        route = get_route_to_location(st.session_state.current_location, service)
                         if route:
-                            st.write(f"Distance: {route['distance']}")
-                            st.write(f"Duration: {route['duration']}")
-                            for step in route['steps']:
-                                st.write(f"- {step['instruction']}")
+                            st.write(f"Distance: {route.distance}")
+                            st.write(f"Duration: {route.duration}")
+                            for step in route.steps:
+                                st.write(f"- {step.instruction}")
                             
                             # Show risk zones along route
-                            risk_zones = get_risk_zones(route['coordinates'])
+                            risk_zones = get_risk_zones(route.coordinates)
                             if risk_zones:
                                 st.warning("Risk Zones Detected:")
                                 for zone in risk_zones:
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from records import Notification
+
+COALESCE_WINDOW = 2.0  # seconds matches are collected before they are delivered
+BATCH_SIZE = 500  # notifications handed to a sink per call
+DEDUP_WINDOW = 3600  # seconds a hazard is not notified to the same user again
+MAX_PENDING_USERS = 50000  # users with undelivered notifications before new ones are shed
+MAX_HAZARDS_PER_USER = 20  # hazards coalesced into one user's pending notification
+INBOX_SIZE = 50  # in-app notifications kept per user
+INBOX_TIMEOUT = 600  # seconds before an undrained in-app inbox is dropped
+
+SEVERITY_RANK = {'low': 0, 'medium': 1, 'high': 2}
+
+class InAppSink:
+    """Per-user inboxes drained by the user's session on its next rerun"""
+
+    def __init__(self, size=INBOX_SIZE, timeout=INBOX_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._inboxes = {}
+        self._lock = threading.Lock()
+
+    def deliver(self, batch):
+        now = time.time()
+        with self._lock:
+            for notification in batch:
+                inbox = self._inboxes.get(notification.user_id)
+                if inbox is None:
+                    inbox = self._inboxes[notification.user_id] = {'queue': deque(maxlen=self.size)}
+                    inbox['drained'] = now
+                inbox['queue'].append(notification)
+            for user_id in [user_id for user_id, inbox in self._inboxes.items()
+                            if now - inbox['drained'] > self.timeout]:
+                del self._inboxes[user_id]
+
+    def drain(self, user_id):
+        """Return and clear a user's notifications"""
+        with self._lock:
+            inbox = self._inboxes.get(user_id)
+            if inbox is None:
+                return []
+            inbox['drained'] = time.time()
+            notifications = list(inbox['queue'])
+            inbox['queue'].clear()
+        return notifications
+
+class WebhookSink:
+    """POSTs every batch as JSON to a webhook (e.g. a local relay standing in for push/SMS)"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, batch):
+        from clients import get_http_session
+
+        response = get_http_session().post(
+            self.url,
+            json={'notifications': [notification.to_dict() for notification in batch]},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+
+class FileSink:
+    """Appends every notification as a JSON line to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, batch):
+        lines = ''.join(json.dumps(notification.to_dict()) + '\n' for notification in batch)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as log:
+            log.write(lines)
+
+def _coalesce(user_id, matches, now):
+    """One notification for all hazards that matched a user in a window"""
+    hazards = [match.hazard for match in matches if match.hazard is not None]
+    severity = max((getattr(hazard, 'severity', 'medium') for hazard in hazards),
+                   key=lambda level: SEVERITY_RANK.get(level, 1), default='medium')
+    if len(matches) == 1:
+        hazard = hazards[0] if hazards else None
+        title = f"{hazard.type.upper()} alert near you" if hazard else "Hazard near you"
+        message = hazard.message if hazard else "You are inside the impact zone of a hazard."
+    else:
+        types = sorted({hazard.type for hazard in hazards})
+        title = f"{len(matches)} alerts near you"
+        message = f"New {', '.join(types) or 'hazard'} alerts affect your area."
+    return Notification(user_id, title, message, severity, tuple(match.hazard_id for match in matches), now)
+
+class NotificationDispatcher:
+    """
+    Batched notification dispatcher
+    Geofence matches are de-duplicated per (user, hazard) and coalesced per user
+    over COALESCE_WINDOW, then delivered to every sink in batches. Intake is O(1)
+    and bounded: when too many users are pending, new users' matches are shed and
+    counted, so a city-wide burst degrades instead of exhausting the server.
+    """
+
+    def __init__(self, sinks=None, window=COALESCE_WINDOW, batch_size=BATCH_SIZE):
+        self.sinks = list(sinks or [])
+        self.window = window
+        self.batch_size = batch_size
+        self._pending = {}
+        self._recent = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self.stats = {
+            'submitted': 0, 'duplicates': 0, 'shed': 0, 'coalesced': 0,
+            'delivered': 0, 'batches': 0, 'sink_errors': 0, 'last_flush_ms': 0.0
+        }
+
+    def add_sink(self, sink):
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def submit(self, matches):
+        """Queue HazardMatch records for delivery; returns how many were accepted"""
+        now = time.time()
+        accepted = 0
+        with self._condition:
+            for match in matches:
+                self.stats['submitted'] += 1
+                key = (match.user_id, match.hazard_id)
+                if now - self._recent.get(key, 0) < DEDUP_WINDOW:
+                    self.stats['duplicates'] += 1
+                    continue
+                pending = self._pending.get(match.user_id)
+                if pending is None:
+                    if len(self._pending) >= MAX_PENDING_USERS:
+                        self.stats['shed'] += 1
+                        continue
+                    pending = self._pending[match.user_id] = {}
+                if match.hazard_id in pending or len(pending) >= MAX_HAZARDS_PER_USER:
+                    self.stats['coalesced'] += 1
+                    continue
+                pending[match.hazard_id] = match
+                self._recent[key] = now
+                accepted += 1
+            if accepted:
+                self._condition.notify_all()
+        if accepted:
+            self._ensure_running()
+        return accepted
+
+    def flush(self):
+        """Coalesce everything pending and deliver it now; returns the number of notifications"""
+        start = time.perf_counter()
+        now = time.time()
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            # Forget old de-duplication entries
+            if len(self._recent) > 2 * MAX_PENDING_USERS:
+                self._recent = {key: seen for key, seen in self._recent.items() if now - seen < DEDUP_WINDOW}
+        if not pending:
+            return 0
+
+        notifications = [_coalesce(user_id, list(matches.values()), now) for user_id, matches in pending.items()]
+        for offset in range(0, len(notifications), self.batch_size):
+            batch = notifications[offset:offset + self.batch_size]
+            for sink in self.sinks:
+                try:
+                    sink.deliver(batch)
+                except Exception:
+                    self.stats['sink_errors'] += 1
+            self.stats['batches'] += 1
+        self.stats['delivered'] += len(notifications)
+        self.stats['last_flush_ms'] = (time.perf_counter() - start) * 1000
+        return len(notifications)
+
+    def pending_users(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+            # Let the burst accumulate so each user gets one notification for it
+            time.sleep(self.window)
+            self.flush()
+
+    def _ensure_running(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+_dispatcher = None
+_in_app_sink = InAppSink()
+_dispatcher_lock = threading.Lock()
+
+def get_in_app_sink():
+    """Process-wide in-app inbox sink"""
+    return _in_app_sink
+
+def get_dispatcher():
+    """
+    Process-wide dispatcher delivering to the in-app inboxes, plus a webhook
+    (NOTIFY_WEBHOOK_URL) and a JSON lines file (NOTIFY_LOG_PATH) when configured
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            sinks = [_in_app_sink]
+            if os.getenv('NOTIFY_WEBHOOK_URL'):
+                sinks.append(WebhookSink(os.getenv('NOTIFY_WEBHOOK_URL')))
+            if os.getenv('NOTIFY_LOG_PATH'):
+                sinks.append(FileSink(os.getenv('NOTIFY_LOG_PATH')))
+            _dispatcher = NotificationDispatcher(sinks)
+        return _dispatcher
@@ -0,0 +1,59 @@
+import streamlit as st
+from location_cache import invalidate_products
+from resilience import request_refresh
+
+# st.fragment is stable since Streamlit 1.37; older releases only ship the experimental name
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+
+# Data products behind each independently refreshable panel
+PANEL_PRODUCTS = {
+    'weather': ['weather', 'weather_alerts'],
+    'support_map': ['support_locations', 'route'],
+    'alerts': ['alerts'],
+    'heatmap': ['current_weather', 'weather_alerts', 'traffic_incidents', 'seismic_activity'],
+}
+
+# Upstream sources behind each panel's products, refetched when its refresh button is pressed
+PANEL_SOURCES = {
+    'weather': ['openweather', 'openweather_air'],
+    'support_map': ['google_places', 'google_directions'],
+    'alerts': ['openweather', 'openweather_air', 'usgs', 'google_places'],
+    'heatmap': ['openweather', 'usgs', 'google_places'],
+}
+
+def refresh_panel(graph, name):
+    """Force a refetch of a panel's products from upstream; only that panel is re-rendered"""
+    request_refresh(PANEL_SOURCES[name])
+    invalidate_products(PANEL_PRODUCTS[name])
+    graph.forget(PANEL_PRODUCTS[name])
+
+def panel(name, run_every=None, refresh_label="🔄 Refresh"):
+    """
+    Turn a render function taking (graph, location) into an independently refreshable panel
+    The panel re-runs on its own on the run_every timer or its refresh button,
+    without re-executing the rest of the page
+    Args:
+        name (str): Panel name, one of PANEL_PRODUCTS
+        run_every (int): Optional auto-refresh interval in seconds
+        refresh_label (str): Label of the panel's refresh button
+    """
+    def decorator(render):
+        def body(graph, location):
+            # A panel rerun reuses the graph of the last full run, so drop its memoised
+            # products and let the location cache decide whether they are still valid
+            graph.forget(PANEL_PRODUCTS[name])
+            render(graph, location)
+            st.button(refresh_label, key=f"refresh_{name}", on_click=refresh_panel, args=(graph, name))
+
+        if _fragment is None:
+            return body
+        return _fragment(body, run_every=run_every)
+    return decorator
+
+def auto_refresh(run_every):
+    """Re-run a render function on its own every run_every seconds, without a full page rerun"""
+    def decorator(render):
+        if _fragment is None:
+            return render
+        return _fragment(render, run_every=run_every)
+    return decorator
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from groq_api import warm_disaster_alerts
+from maps import fetch_support_locations
+from quota import quota_priority, PRIORITY_BACKGROUND
+from resilience import location_key
+from risk_surface import haversine_m
+
+WARM_INTERVAL = 90  # seconds between warming rounds; below FRESH_FOR so hot cells never go stale
+HOT_CELLS = 20  # most visited cells kept warm
+SUPPORT_CELLS = 5  # hottest cells whose support locations are kept warm as well (Google quota)
+HALF_LIFE = 3600  # seconds after which a visit counts half when ranking cells
+MIN_SCORE = 0.1  # cells whose decayed score falls below this are forgotten
+ROUTE_SPACING = 1000  # meters between route points prefetched
+MAX_ROUTE_CELLS = 20  # route points prefetched per route
+
+def _cell_location(cell):
+    """Location dict at a cell, which the source caches key exactly like the users in it"""
+    return {'lat': cell[0], 'lng': cell[1], 'timestamp': time.time()}
+
+# Warmers use the st.*-free fetchers and raise, so failures reach the prefetcher's stats
+
+def _warm_conditions(location):
+    # The weather report fetched for the alerts (with air quality) also serves every weather view
+    warm_disaster_alerts(location)
+
+def _warm_support(location):
+    # Without a key the Maps client reports the missing key with st.error
+    if os.getenv('GOOGLE_MAPS_API_KEY'):
+        fetch_support_locations(location)
+
+def route_cells(coordinates, spacing=ROUTE_SPACING, limit=MAX_ROUTE_CELLS):
+    """Cells of points along a route, about spacing meters apart, at most limit of them"""
+    cells = []
+    last = None
+    for lat, lng in coordinates:
+        if last is not None and haversine_m(last[0], last[1], lat, lng) < spacing:
+            continue
+        cell = location_key({'lat': lat, 'lng': lng})
+        if cell not in cells:
+            cells.append(cell)
+        last = (lat, lng)
+    if coordinates:
+        # Always warm the destination
+        destination = location_key({'lat': coordinates[-1][0], 'lng': coordinates[-1][1]})
+        if destination not in cells:
+            cells.append(destination)
+    if len(cells) > limit:
+        step = len(cells) / limit
+        cells = [cells[int(index * step)] for index in range(limit - 1)] + [cells[-1]]
+    return cells
+
+class Prefetcher:
+    """
+    Keeps the source caches warm for the places users are
+    Session locations are counted per cell with exponential decay; every
+    WARM_INTERVAL the hottest cells have their weather and alerts (and for the
+    very hottest, support locations) refreshed in the background, so the first
+    user in a busy area is served from cache. Computed routes get the cells
+    along them prefetched once. All calls use the background quota class.
+    """
+
+    def __init__(self, workers=4, interval=WARM_INTERVAL):
+        self.interval = interval
+        self._scores = {}
+        self._scored_at = time.time()
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._thread = None
+        self.stats = {'visits': 0, 'rounds': 0, 'warmed': 0, 'route_cells': 0, 'errors': 0}
+
+    def _decay(self, now):
+        factor = 0.5 ** ((now - self._scored_at) / HALF_LIFE)
+        self._scored_at = now
+        self._scores = {cell: score * factor for cell, score in self._scores.items()
+                        if score * factor >= MIN_SCORE}
+
+    def record(self, location):
+        """Count a session arriving at a location"""
+        cell = location_key(location)
+        with self._lock:
+            self._scores[cell] = self._scores.get(cell, 0) + 1
+            self.stats['visits'] += 1
+        self._ensure_running()
+        return cell
+
+    def hot_cells(self, limit=HOT_CELLS):
+        """The most visited cells, hottest first"""
+        with self._lock:
+            self._decay(time.time())
+            return sorted(self._scores, key=self._scores.get, reverse=True)[:limit]
+
+    def _submit(self, kind, cell, warm):
+        with self._lock:
+            if (kind, cell) in self._inflight:
+                return False
+            self._inflight.add((kind, cell))
+        self._executor.submit(self._run, kind, cell, warm)
+        return True
+
+    def _run(self, kind, cell, warm):
+        try:
+            with quota_priority(PRIORITY_BACKGROUND):
+                warm(_cell_location(cell))
+            self.stats['warmed'] += 1
+        except Exception:
+            self.stats['errors'] += 1
+        finally:
+            with self._lock:
+                self._inflight.discard((kind, cell))
+
+    def warm(self):
+        """Queue one warming round; returns the cells it covers"""
+        cells = self.hot_cells()
+        for rank, cell in enumerate(cells):
+            self._submit('conditions', cell, _warm_conditions)
+            if rank < SUPPORT_CELLS:
+                self._submit('support', cell, _warm_support)
+        self.stats['rounds'] += 1
+        return cells
+
+    def prefetch_route(self, route):
+        """Fetch weather and alerts for the cells along a route"""
+        if not route or not route.coordinates:
+            return []
+        cells = route_cells(route.coordinates)
+        for cell in cells:
+            if self._submit('conditions', cell, _warm_conditions):
+                self.stats['route_cells'] += 1
+        return cells
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.warm()
+            except Exception:
+                self.stats['errors'] += 1
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+                self._thread.start()
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher():
+    """Process-wide prefetcher"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
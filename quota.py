@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Priority classes, most important first
+PRIORITY_EMERGENCY = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_EMERGENCY: 'emergency',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+# Per-API rate (requests per second), burst size and daily request budget
+API_LIMITS = {
+    'places_nearby': {'rate': 5, 'burst': 10, 'daily_budget': 3000},
+    'place': {'rate': 10, 'burst': 20, 'daily_budget': 5000},
+    'directions': {'rate': 5, 'burst': 10, 'daily_budget': 2000},
+    'geolocate': {'rate': 5, 'burst': 10, 'daily_budget': 2000},
+    'reverse_geocode': {'rate': 5, 'burst': 10, 'daily_budget': 2000},
+}
+
+# Share of the daily budget a priority class may use; the rest is kept for more important requests
+BUDGET_SHARE = {
+    PRIORITY_EMERGENCY: 1.0,
+    PRIORITY_INTERACTIVE: 0.9,
+    PRIORITY_BACKGROUND: 0.6,
+}
+
+# How long (seconds) a request of each class may queue for a token before it is refused
+MAX_WAIT = {
+    PRIORITY_EMERGENCY: 10.0,
+    PRIORITY_INTERACTIVE: 2.0,
+    PRIORITY_BACKGROUND: 0.0,
+}
+
+_priority = ContextVar('quota_priority', default=PRIORITY_INTERACTIVE)
+
+class QuotaExceeded(Exception):
+    """Raised when an API call is refused by its rate limit or daily budget"""
+
+@contextmanager
+def quota_priority(priority):
+    """Run the enclosed API calls with the given priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    """Priority class of the API calls made in the current context"""
+    return _priority.get()
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        """Seconds until the next token is available"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class QuotaManager:
+    """
+    Cross-session quota manager for the Google APIs
+    Every call takes a token from its API's bucket and counts against the daily
+    budget. Lower priority classes get a smaller share of the budget and give
+    way to queued higher priority requests.
+    """
+
+    def __init__(self, limits=API_LIMITS):
+        self.limits = limits
+        self._buckets = {api: TokenBucket(limit['rate'], limit['burst']) for api, limit in limits.items()}
+        self._condition = threading.Condition()
+        # Queued requests per (api, priority); a request only gives way to higher priority ones for the same API
+        self._waiting = {(api, priority): 0 for api in limits for priority in PRIORITY_NAMES}
+        self._day = self._today()
+        self._counters = {
+            api: {'granted': 0, 'denied_rate': 0, 'denied_budget': 0, 'queued': 0, 'used_today': 0}
+            for api in limits
+        }
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _reset_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            for counters in self._counters.values():
+                counters['used_today'] = 0
+
+    def _higher_priority_waiting(self, api, priority):
+        return any(self._waiting[(api, other)] for other in PRIORITY_NAMES if other < priority)
+
+    def acquire(self, api, priority=None):
+        """
+        Reserve one call of an API, queueing up to the priority's MAX_WAIT
+        Raises QuotaExceeded when the budget share is used up or no token becomes available in time
+        """
+        if api not in self.limits:
+            return
+        priority = current_priority() if priority is None else priority
+        counters = self._counters[api]
+        deadline = time.monotonic() + MAX_WAIT[priority]
+
+        with self._condition:
+            self._reset_day()
+            if counters['used_today'] >= self.limits[api]['daily_budget'] * BUDGET_SHARE[priority]:
+                counters['denied_budget'] += 1
+                raise QuotaExceeded(f"Daily {api} budget for {PRIORITY_NAMES[priority]} requests is used up")
+
+            bucket = self._buckets[api]
+            queued = False
+            self._waiting[(api, priority)] += 1
+            try:
+                while self._higher_priority_waiting(api, priority) or not bucket.try_acquire():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        counters['denied_rate'] += 1
+                        raise QuotaExceeded(f"{api} rate limit reached")
+                    if not queued:
+                        counters['queued'] += 1
+                        queued = True
+                    self._condition.wait(min(remaining, max(bucket.wait_time(), 0.01)))
+            finally:
+                self._waiting[(api, priority)] -= 1
+                self._condition.notify_all()
+
+            counters['granted'] += 1
+            counters['used_today'] += 1
+
+    def call(self, api, fn, *args, **kwargs):
+        """Call fn once a token for api is granted"""
+        self.acquire(api)
+        return fn(*args, **kwargs)
+
+    def stats(self):
+        """Counters per API for dashboards"""
+        with self._condition:
+            self._reset_day()
+            return {
+                api: dict(counters, daily_budget=self.limits[api]['daily_budget'])
+                for api, counters in self._counters.items()
+            }
+
+quota_manager = QuotaManager()
+
+def call_with_quota(api, fn, *args, **kwargs):
+    """Call a Google API function through the process-wide quota manager"""
+    return quota_manager.call(api, fn, *args, **kwargs)
@@ -0,0 +1,182 @@
+import time
+from dataclasses import dataclass
+
+class Record:
+    """
+    Base of the compact record types
+    Records are slotted dataclasses: no per-instance __dict__ and attribute access
+    instead of string keys, converted to and from plain dicts at the JSON and
+    storage boundaries
+    """
+    __slots__ = ()
+
+    def to_dict(self):
+        """Plain dict of the record's fields"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict, ignoring keys that are not fields"""
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    @classmethod
+    def coerce(cls, value):
+        """Return value as a record, converting dicts (e.g. data saved by older versions)"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls.from_dict(value)
+
+@dataclass(slots=True)
+class LocationSnapshot(Record):
+    """Position of the user at a point in time"""
+    lat: float
+    lng: float
+    timestamp: float
+    accuracy: float = None
+
+    @classmethod
+    def from_location(cls, location, timestamp=None):
+        """Snapshot a location dict, stamping it with timestamp (or its own, or now)"""
+        if timestamp is None:
+            timestamp = location.get('timestamp') or time.time()
+        return cls(location['lat'], location['lng'], timestamp, location.get('accuracy'))
+
+@dataclass(slots=True)
+class Alert(Record):
+    """A disaster, weather, air quality or traffic alert"""
+    id: str
+    type: str
+    severity: str
+    message: str
+    lat: float = None
+    lng: float = None
+    timestamp: str = None
+    event: str = None
+    first_seen: float = None
+    last_seen: float = None
+    expires_at: float = None
+
+@dataclass(slots=True)
+class Place(Record):
+    """An emergency service near the user"""
+    place_id: str
+    name: str
+    type: str
+    lat: float
+    lng: float
+    address: str = 'Address not available'
+    rating: object = 'N/A'
+    distance: float = None
+    status: str = None
+
+    @classmethod
+    def from_places_result(cls, place, place_type, details=None):
+        """Build a place from a Places nearby search result and optional place details"""
+        details = details or {}
+        location = place['geometry']['location']
+        return cls(
+            place_id=place['place_id'],
+            name=place['name'],
+            type=place_type,
+            lat=location['lat'],
+            lng=location['lng'],
+            address=details.get('formatted_address') or 'Address not available',
+            rating=details.get('rating') or 'N/A'
+        )
+
+@dataclass(slots=True)
+class RouteStep(Record):
+    """One instruction of a route"""
+    instruction: str
+    distance: str
+    duration: str
+
+    @classmethod
+    def from_directions_step(cls, step):
+        """Build a step from a Directions API step"""
+        return cls(step['html_instructions'], step['distance']['text'], step['duration']['text'])
+
+@dataclass(slots=True)
+class Route(Record):
+    """Route to a destination with its polyline and steps"""
+    distance: str
+    duration: str
+    coordinates: list
+    steps: list
+
+    @classmethod
+    def from_directions(cls, route):
+        """Build a route from the first leg of a Directions API route"""
+        leg = route['legs'][0]
+        coordinates = [(step['start_location']['lat'], step['start_location']['lng']) for step in leg['steps']]
+        coordinates.append((leg['steps'][-1]['end_location']['lat'], leg['steps'][-1]['end_location']['lng']))
+        return cls(
+            distance=leg['distance']['text'],
+            duration=leg['duration']['text'],
+            coordinates=coordinates,
+            steps=[RouteStep.from_directions_step(step) for step in leg['steps']]
+        )
+
+    def to_dict(self):
+        return {
+            'distance': self.distance,
+            'duration': self.duration,
+            'coordinates': [list(point) for point in self.coordinates],
+            'steps': [step.to_dict() for step in self.steps]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            distance=data['distance'],
+            duration=data['duration'],
+            coordinates=[tuple(point) for point in data['coordinates']],
+            steps=[RouteStep.coerce(step) for step in data['steps']]
+        )
+
+@dataclass(slots=True)
+class Incident(Record):
+    """A located incident feeding the risk surface"""
+    lat: float
+    lng: float
+    type: str = None
+    severity: str = 'medium'
+    timestamp: object = None
+    id: str = None
+    label: str = None
+    description: str = None
+    precautions: str = None
+    distance: float = None
+
+    @classmethod
+    def from_alert(cls, alert, location):
+        """Incident of an alert; alerts without their own coordinates are placed at location"""
+        return cls(
+            lat=alert.lat if alert.lat is not None else location['lat'],
+            lng=alert.lng if alert.lng is not None else location['lng'],
+            type=alert.type,
+            severity=alert.severity or 'medium',
+            timestamp=alert.timestamp,
+            id=alert.id
+        )
+
+@dataclass(slots=True)
+class HazardMatch(Record):
+    """A user found inside the impact zone of a hazard"""
+    hazard_id: str
+    user_id: str
+    lat: float
+    lng: float
+    matched_at: float
+    distance: float = None
+    hazard: object = None
+
+@dataclass(slots=True)
+class Notification(Record):
+    """One coalesced notification to a user covering one or more hazards"""
+    user_id: str
+    title: str
+    message: str
+    severity: str
+    hazard_ids: tuple
+    created_at: float
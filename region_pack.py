@@ -0,0 +1,407 @@
+import argparse
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+import polyline
+from startup import lazy_import
+from records import Place, Route, RouteStep, Incident
+from alert_store import make_alert_id
+from risk_surface import METERS_PER_DEGREE, haversine_m, incident_time, incidents_from_alerts
+from risk_tiles import TILE_ZOOM, TILE_RESOLUTION, lat_lng_to_tile, tile_bounds, render_tile_values, risk_colormap
+
+folium = lazy_import('folium')
+folium_utilities = lazy_import('folium.utilities')
+
+PACK_DIR = os.path.join('offline_data', 'packs')
+PACK_SUFFIX = '.sspack'
+MAGIC = b'SSRP'
+VERSION = 1
+SUPPORT_SPACING = 7000  # meters between the points support locations are searched around (5 km search radius)
+ROUTE_MATCH = 2000  # meters an offline user may be from a packed route's origin for it to be offered
+NEARBY_SUPPORT = 5000  # meters around the user support locations are listed from a pack
+
+# Header: magic, version, tile resolution, created at, south, west, north, east, name, section count
+HEADER = struct.Struct('<4sHHddddd64sI')
+# Section table entry: tag, offset, length in bytes, item count
+SECTION = struct.Struct('<4sQQI')
+
+# Strings live in one UTF-8 blob and are referenced by (offset, length)
+STRING = ('<u4', 2)
+PLACE_DTYPE = np.dtype([
+    ('lat', '<f8'), ('lng', '<f8'), ('rating', '<f4'),
+    ('place_id', STRING), ('name', STRING), ('type', STRING), ('address', STRING)
+])
+ROUTE_DTYPE = np.dtype([
+    ('origin_lat', '<f8'), ('origin_lng', '<f8'),
+    ('place_id', STRING), ('distance', STRING), ('duration', STRING), ('polyline', STRING), ('steps', STRING)
+])
+INCIDENT_DTYPE = np.dtype([
+    ('lat', '<f8'), ('lng', '<f8'), ('timestamp', '<f8'),
+    ('type', STRING), ('severity', STRING), ('id', STRING), ('label', STRING), ('description', STRING)
+])
+# Tiles are sorted by key so a lookup is a binary search; rasters are float16
+TILE_KEY_DTYPE = np.dtype('<u8')
+
+def tile_key(zoom, x, y):
+    return (zoom << 56) | (x << 28) | y
+
+class _Strings:
+    """De-duplicating UTF-8 string blob under construction"""
+
+    def __init__(self):
+        self._offsets = {}
+        self._blob = bytearray()
+
+    def add(self, value):
+        value = '' if value is None else str(value)
+        if value not in self._offsets:
+            encoded = value.encode('utf-8')
+            self._offsets[value] = (len(self._blob), len(encoded))
+            self._blob.extend(encoded)
+        return self._offsets[value]
+
+    def tobytes(self):
+        return bytes(self._blob)
+
+def write_pack(path, name, bounds, places=(), routes=(), incidents=(), tiles=None):
+    """
+    Write a region pack
+    Args:
+        bounds (tuple): (south, west, north, east) the pack covers
+        places: Place records
+        routes: (origin (lat, lng), place_id, Route) tuples
+        incidents: Incident records
+        tiles (dict): (zoom, x, y) -> TILE_RESOLUTION square risk raster
+    """
+    strings = _Strings()
+    place_rows = np.zeros(len(places), dtype=PLACE_DTYPE)
+    for row, place in zip(place_rows, places):
+        rating = place.rating if isinstance(place.rating, (int, float)) else math.nan
+        row['lat'], row['lng'], row['rating'] = place.lat, place.lng, rating
+        for field in ('place_id', 'name', 'type', 'address'):
+            row[field] = strings.add(getattr(place, field))
+
+    route_rows = np.zeros(len(routes), dtype=ROUTE_DTYPE)
+    for row, (origin, place_id, route) in zip(route_rows, routes):
+        row['origin_lat'], row['origin_lng'] = origin
+        row['place_id'] = strings.add(place_id)
+        row['distance'] = strings.add(route.distance)
+        row['duration'] = strings.add(route.duration)
+        row['polyline'] = strings.add(polyline.encode(route.coordinates))
+        row['steps'] = strings.add(json.dumps([[step.instruction, step.distance, step.duration]
+                                               for step in route.steps]))
+
+    incident_rows = np.zeros(len(incidents), dtype=INCIDENT_DTYPE)
+    for row, incident in zip(incident_rows, incidents):
+        timestamp = math.nan if incident.timestamp is None else incident_time(incident.timestamp)
+        row['lat'], row['lng'], row['timestamp'] = incident.lat, incident.lng, timestamp
+        for field in ('type', 'severity', 'id', 'label', 'description'):
+            row[field] = strings.add(getattr(incident, field))
+
+    tiles = tiles or {}
+    keys = sorted(tiles, key=lambda tile: tile_key(*tile))
+    tile_keys = np.array([tile_key(*tile) for tile in keys], dtype=TILE_KEY_DTYPE)
+    tile_values = np.zeros((len(keys), TILE_RESOLUTION, TILE_RESOLUTION), dtype='<f2')
+    for index, tile in enumerate(keys):
+        tile_values[index] = tiles[tile]
+
+    sections = [
+        (b'PLAC', place_rows.tobytes(), len(place_rows)),
+        (b'ROUT', route_rows.tobytes(), len(route_rows)),
+        (b'INCI', incident_rows.tobytes(), len(incident_rows)),
+        (b'TKEY', tile_keys.tobytes(), len(tile_keys)),
+        (b'TVAL', tile_values.tobytes(), len(tile_values)),
+        (b'STRS', strings.tobytes(), 0),
+    ]
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for tag, payload, count in sections:
+        offset += -offset % 8  # keep every array 8-byte aligned
+        table.append((tag, offset, len(payload), count))
+        offset += len(payload)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write next to the target and rename, so readers never map a half-written pack
+    partial = path + '.partial'
+    with open(partial, 'wb') as pack:
+        pack.write(HEADER.pack(MAGIC, VERSION, TILE_RESOLUTION, time.time(), *bounds,
+                               name.encode('utf-8')[:64], len(sections)))
+        for entry in table:
+            pack.write(SECTION.pack(*entry))
+        for (tag, payload, count), (_, section_offset, _, _) in zip(sections, table):
+            pack.write(b'\0' * (section_offset - pack.tell()))
+            pack.write(payload)
+    os.replace(partial, path)
+    return path
+
+class RegionPack:
+    """
+    Read-only, memory-mapped region pack
+    Opening a pack only parses its header; sections are NumPy views straight into
+    the mapping, so lookups page in just the bytes they touch and any number of
+    sessions and processes share the same page cache
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as pack:
+            self._mmap = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, resolution, self.created_at, south, west, north, east,
+         name, count) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or resolution != TILE_RESOLUTION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} region pack")
+        self.bounds = (south, west, north, east)
+        self.name = name.rstrip(b'\0').decode('utf-8')
+        self._sections = {}
+        for index in range(count):
+            tag, offset, length, items = SECTION.unpack_from(self._mmap, HEADER.size + index * SECTION.size)
+            self._sections[tag] = (offset, length, items)
+
+        self.places = self._array(b'PLAC', PLACE_DTYPE)
+        self.routes = self._array(b'ROUT', ROUTE_DTYPE)
+        self.incident_rows = self._array(b'INCI', INCIDENT_DTYPE)
+        self.tile_keys = self._array(b'TKEY', TILE_KEY_DTYPE)
+        self.tile_values = self._array(b'TVAL', np.dtype('<f2')).reshape(-1, TILE_RESOLUTION, TILE_RESOLUTION)
+        offset, length, _ = self._sections[b'STRS']
+        self._strings = memoryview(self._mmap)[offset:offset + length]
+
+    def _array(self, tag, dtype):
+        offset, length, _ = self._sections[tag]
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def _string(self, ref):
+        offset, length = int(ref[0]), int(ref[1])
+        return str(self._strings[offset:offset + length], 'utf-8')
+
+    def contains(self, lat, lng):
+        south, west, north, east = self.bounds
+        return south <= lat <= north and west <= lng <= east
+
+    def _place(self, index, distance=None):
+        row = self.places[index]
+        return Place(
+            place_id=self._string(row['place_id']),
+            name=self._string(row['name']),
+            type=self._string(row['type']),
+            lat=float(row['lat']),
+            lng=float(row['lng']),
+            address=self._string(row['address']),
+            rating='N/A' if math.isnan(row['rating']) else float(row['rating']),
+            distance=distance
+        )
+
+    def support_locations(self, location, radius=NEARBY_SUPPORT):
+        """Places within radius meters of a location, nearest first"""
+        if not len(self.places):
+            return []
+        distances = haversine_m(location['lat'], location['lng'], self.places['lat'], self.places['lng'])
+        nearby = np.flatnonzero(distances <= radius)
+        return [self._place(index, round(float(distances[index])))
+                for index in nearby[np.argsort(distances[nearby])]]
+
+    def route_from(self, location, place_id=None, radius=ROUTE_MATCH):
+        """Packed route starting nearest to a location (optionally to a given place), or None"""
+        if not len(self.routes):
+            return None
+        distances = haversine_m(location['lat'], location['lng'], self.routes['origin_lat'], self.routes['origin_lng'])
+        if place_id is not None:
+            ids = [self._string(ref) for ref in self.routes['place_id']]
+            distances = np.where([route_place == place_id for route_place in ids], distances, np.inf)
+        index = int(np.argmin(distances))
+        if distances[index] > radius:
+            return None
+        row = self.routes[index]
+        return Route(
+            distance=self._string(row['distance']),
+            duration=self._string(row['duration']),
+            coordinates=polyline.decode(self._string(row['polyline'])),
+            steps=[RouteStep(*step) for step in json.loads(self._string(row['steps']))]
+        )
+
+    def incidents(self):
+        """Incidents recorded when the pack was built"""
+        return [
+            Incident(
+                lat=float(row['lat']),
+                lng=float(row['lng']),
+                type=self._string(row['type']) or None,
+                severity=self._string(row['severity']) or 'medium',
+                timestamp=None if math.isnan(row['timestamp']) else float(row['timestamp']),
+                id=self._string(row['id']) or None,
+                label=self._string(row['label']) or None,
+                description=self._string(row['description']) or None
+            )
+            for row in self.incident_rows
+        ]
+
+    def tile(self, zoom, x, y):
+        """Risk raster of a tile (a float16 view into the pack), or None"""
+        # A plain int would be compared as float64 and lose the low bits of the key
+        key = np.uint64(tile_key(zoom, x, y))
+        index = int(np.searchsorted(self.tile_keys, key))
+        if index < len(self.tile_keys) and self.tile_keys[index] == key:
+            return self.tile_values[index]
+        return None
+
+    def add_risk_layer(self, folium_map, location, radius_tiles=1, name="Risk Tiles (offline)"):
+        """Overlay the packed risk tiles around a location on a folium map"""
+        layer = folium.FeatureGroup(name=name)
+        cx, cy = lat_lng_to_tile(location['lat'], location['lng'], TILE_ZOOM)
+        for dy in range(-radius_tiles, radius_tiles + 1):
+            for dx in range(-radius_tiles, radius_tiles + 1):
+                values = self.tile(TILE_ZOOM, cx + dx, cy + dy)
+                if values is None:
+                    continue
+                south, west, north, east = tile_bounds(TILE_ZOOM, cx + dx, cy + dy)
+                folium.raster_layers.ImageOverlay(
+                    image=folium_utilities.image_to_url(risk_colormap(values.astype(np.float32))),
+                    bounds=[[south, west], [north, east]],
+                    opacity=0.6
+                ).add_to(layer)
+        layer.add_to(folium_map)
+        return folium_map
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'bounds': self.bounds,
+            'created_at': self.created_at,
+            'places': len(self.places),
+            'routes': len(self.routes),
+            'incidents': len(self.incident_rows),
+            'tiles': len(self.tile_keys),
+            'bytes': len(self._mmap)
+        }
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+def open_pack(path):
+    """Process-wide mapping of a pack, reopened when the file was rebuilt"""
+    mtime = os.path.getmtime(path)
+    with _packs_lock:
+        cached = _packs.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _packs[path] = (mtime, RegionPack(path))
+        return cached[1]
+
+def find_pack(location, pack_dir=PACK_DIR):
+    """Newest pack covering a location, or None"""
+    if not location:
+        return None
+    paths = sorted(glob.glob(os.path.join(pack_dir, '*' + PACK_SUFFIX)), key=os.path.getmtime, reverse=True)
+    for path in paths:
+        try:
+            pack = open_pack(path)
+        except (OSError, ValueError, struct.error):
+            continue
+        if pack.contains(location['lat'], location['lng']):
+            return pack
+    return None
+
+def pack_path(name, pack_dir=PACK_DIR):
+    return os.path.join(pack_dir, name + PACK_SUFFIX)
+
+def region_bounds(location, radius_km):
+    dlat = radius_km * 1000 / METERS_PER_DEGREE
+    dlng = dlat / max(math.cos(math.radians(location['lat'])), 0.01)
+    return location['lat'] - dlat, location['lng'] - dlng, location['lat'] + dlat, location['lng'] + dlng
+
+def build_pack(name, location, radius_km=10, pack_dir=PACK_DIR, progress=print, tile_zooms=range(10, 15)):
+    """
+    Fetch everything offline mode needs for a region and write it as a pack
+    Support locations are searched on a grid over the region, each grid point gets
+    a route to its nearest support location, and risk tiles are rendered from the
+    current incidents. The region's base map tiles at tile_zooms are seeded into
+    the tile cache. Runs at background quota priority. Returns the pack path.
+    """
+    from maps import get_nearby_support_locations, get_route_to_location
+    from groq_api import get_disaster_alerts, get_seismic_activity
+    from risk_tiles import get_risk_tile_service
+    from quota import quota_priority, PRIORITY_BACKGROUND
+
+    bounds = region_bounds(location, radius_km)
+    south, west, north, east = bounds
+    rows = max(int(math.ceil((north - south) * METERS_PER_DEGREE / SUPPORT_SPACING)), 1)
+    cols = max(int(math.ceil(radius_km * 2000 / SUPPORT_SPACING)), 1)
+    points = [{'lat': south + (north - south) * (row + 0.5) / rows, 'lng': west + (east - west) * (col + 0.5) / cols}
+              for row in range(rows) for col in range(cols)]
+
+    with quota_priority(PRIORITY_BACKGROUND):
+        places = {}
+        for index, point in enumerate(points):
+            progress(f"Support locations {index + 1}/{len(points)}")
+            for place in get_nearby_support_locations(point) or []:
+                places.setdefault(place.place_id, place)
+        places = list(places.values())
+
+        routes = []
+        if places:
+            lats = np.array([place.lat for place in places])
+            lngs = np.array([place.lng for place in places])
+            for index, point in enumerate(points):
+                progress(f"Routes {index + 1}/{len(points)}")
+                nearest = places[int(np.argmin(haversine_m(point['lat'], point['lng'], lats, lngs)))]
+                route = get_route_to_location(point, nearest)
+                if route:
+                    routes.append(((point['lat'], point['lng']), nearest.place_id, route))
+
+        progress("Incidents")
+        incidents = incidents_from_alerts(get_disaster_alerts(location), location)
+        for feature in get_seismic_activity():
+            lng, lat = feature['geometry']['coordinates'][:2]
+            incidents.append(Incident(lat, lng, type='earthquake', severity='high',
+                                      timestamp=feature['properties']['time'] / 1000,
+                                      id=make_alert_id('usgs', feature['id']), label=feature['properties'].get('place')))
+        live, _ = get_risk_tile_service().store.snapshot()
+        incidents.extend(live)
+
+    progress("Risk tiles")
+    (x0, y0), (x1, y1) = lat_lng_to_tile(north, west, TILE_ZOOM), lat_lng_to_tile(south, east, TILE_ZOOM)
+    tiles = {(TILE_ZOOM, x, y): render_tile_values(TILE_ZOOM, x, y, incidents)
+             for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)}
+
+    # Keep the incidents inside the region (with a margin for the risk they spread)
+    margin = 0.5
+    incidents = [incident for incident in incidents
+                 if south - margin <= incident.lat <= north + margin and west - margin <= incident.lng <= east + margin]
+    path = write_pack(pack_path(name, pack_dir), name, bounds, places, routes, incidents, tiles)
+
+    if tile_zooms:
+        from tile_cache import get_tile_store, seed
+
+        try:
+            seed(get_tile_store(), *bounds, tile_zooms, progress=progress)
+        except ValueError as e:
+            progress(f"Map tiles not seeded: {str(e)}")
+    progress(f"Wrote {path}")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and inspect SafeSphere offline region packs")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="fetch a region while online and write its pack")
+    build.add_argument('name')
+    build.add_argument('--lat', type=float, required=True)
+    build.add_argument('--lng', type=float, required=True)
+    build.add_argument('--radius-km', type=float, default=10)
+    build.add_argument('--dir', default=PACK_DIR)
+    info = commands.add_parser('info', help="print the contents of a pack")
+    info.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from dotenv import load_dotenv
+        load_dotenv()
+        build_pack(args.name, {'lat': args.lat, 'lng': args.lng}, args.radius_km, args.dir)
+    else:
+        print(json.dumps(RegionPack(args.path).summary(), indent=2))
@@ -0,0 +1,258 @@
+import threading
+import time
+from clients import get_http_session
+from quota import QuotaExceeded
+from shared_cache import get_shared_cache, LEASE_SECONDS, LEASE_WAIT
+from codec import project
+
+FAILURE_THRESHOLD = 3  # consecutive failures before a source's circuit opens
+RESET_TIMEOUT = 60  # seconds an open circuit waits before a half-open probe
+FRESH_FOR = 120  # seconds a value is served without revalidation
+MAX_STALE = 24 * 3600  # seconds after which a last good value is no longer served
+INFLIGHT_WAIT = 15  # seconds a caller waits for a concurrent inline fetch of the same key
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class SourceUnavailable(Exception):
+    """Raised when a source fails and there is no last good value to serve"""
+
+class CircuitBreaker:
+    """
+    Per-source circuit breaker
+    Opens after FAILURE_THRESHOLD consecutive failures, lets a single probe
+    through after RESET_TIMEOUT and closes again once a probe succeeds
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go to the source now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                # Let exactly one probe through
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def release(self):
+        """Hand back a half-open probe that never reached the source, so the next call can probe"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # opened_at is kept, so the reset timeout has already passed
+                self.state = OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+
+_breakers = {}
+_last_good = {}
+_revalidating = set()
+_fetching = {}
+_refresh_requested = {}  # source -> time of the last user-requested refresh
+_lock = threading.RLock()
+
+def get_breaker(source):
+    """Circuit breaker of a source"""
+    with _lock:
+        if source not in _breakers:
+            _breakers[source] = CircuitBreaker()
+        return _breakers[source]
+
+def location_key(location):
+    """Cache key of a location (about 100m precision)"""
+    return (round(location['lat'], 3), round(location['lng'], 3))
+
+def _call(source, key, fetch):
+    breaker = get_breaker(source)
+    try:
+        value = fetch()
+    except QuotaExceeded:
+        # Our own rate limiting says nothing about the health of the source
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    # Only the fields SafeSphere reads are kept, in memory and in the shared cache
+    value = project(source, value)
+    fetched_at = time.time()
+    with _lock:
+        _last_good[(source, key)] = (value, fetched_at)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.put(source, key, value, fetched_at)
+    return value
+
+def _adopt_shared(source, key, cached):
+    """Newer value of a key fetched by another process, or the local one"""
+    shared = get_shared_cache()
+    if shared is None:
+        return cached
+    entry = shared.get(source, key)
+    if entry is None or (cached and entry[1] <= cached[1]):
+        return cached
+    with _lock:
+        _last_good[(source, key)] = entry
+    return entry
+
+def request_refresh(sources):
+    """
+    Refetch the sources' values on their next use, however fresh they are (user-initiated refresh)
+    Values fetched before the request are fetched again inline and only served if that fails.
+    """
+    now = time.time()
+    with _lock:
+        for source in sources:
+            _refresh_requested[source] = now
+
+def _revalidate(source, key, fetch):
+    shared = get_shared_cache()
+    try:
+        # Another process holding the lease is already refreshing this key for everyone
+        if shared is None or shared.acquire_lease(source, key):
+            _call(source, key, fetch)
+        else:
+            get_breaker(source).release()
+    except Exception:
+        if shared is not None:
+            shared.release_lease(source, key)
+    finally:
+        with _lock:
+            _revalidating.discard((source, key))
+
+def fetch_source(source, key, fetch, fresh_for=FRESH_FOR):
+    """
+    Fetch from an upstream source with a circuit breaker and stale-while-revalidate
+    A fresh last good value is returned as is; an older one is returned immediately
+    while a background thread revalidates it; a value is only fetched inline when
+    there is none yet, or after request_refresh. Values are shared with the other processes on the host
+    through the shared cache, whose leases make fetches single-flight across them.
+    fetch must raise on failure and must not call st.*.
+    Raises SourceUnavailable when the source fails and nothing can be served.
+    """
+    with _lock:
+        cached = _last_good.get((source, key))
+        refresh_after = _refresh_requested.get(source, 0)
+    now = time.time()
+    if not cached or now - cached[1] > fresh_for or cached[1] < refresh_after:
+        cached = _adopt_shared(source, key, cached)
+    if cached and now - cached[1] > MAX_STALE:
+        cached = None
+
+    if cached and cached[1] < refresh_after:
+        # A refresh was requested since this value was fetched
+        try:
+            return _fetch_single_flight(source, key, fetch, newer_than=refresh_after)
+        except (QuotaExceeded, SourceUnavailable):
+            return cached[0]
+
+    if cached:
+        value, fetched_at = cached
+        if now - fetched_at > fresh_for:
+            with _lock:
+                # Single-flight: one revalidation per key, and only if the circuit lets it through
+                start = (source, key) not in _revalidating and get_breaker(source).allow()
+                if start:
+                    _revalidating.add((source, key))
+            if start:
+                threading.Thread(target=_revalidate, args=(source, key, fetch), daemon=True).start()
+        return value
+
+    return _fetch_single_flight(source, key, fetch)
+
+def _fetch_single_flight(source, key, fetch, newer_than=0):
+    # Single-flight within the process: concurrent callers share the first caller's fetch
+    with _lock:
+        flight = _fetching.get((source, key))
+        leader = flight is None
+        if leader:
+            flight = _fetching[(source, key)] = {'done': threading.Event(), 'error': None}
+    if not leader:
+        flight['done'].wait(INFLIGHT_WAIT)
+        with _lock:
+            cached = _last_good.get((source, key))
+        if cached:
+            return cached[0]
+        if isinstance(flight['error'], (QuotaExceeded, SourceUnavailable)):
+            raise flight['error']
+        raise SourceUnavailable(f"{source} request failed")
+    try:
+        return _fetch_inline(source, key, fetch, newer_than)
+    except Exception as e:
+        flight['error'] = e
+        raise
+    finally:
+        with _lock:
+            _fetching.pop((source, key), None)
+        flight['done'].set()
+
+def _fetch_inline(source, key, fetch, newer_than=0):
+    if not get_breaker(source).allow():
+        raise SourceUnavailable(f"{source} is unavailable (circuit open)")
+    shared = get_shared_cache()
+    # A stuck holder's lease expires after LEASE_SECONDS, so one waiter can take over by then
+    deadline = time.time() + LEASE_SECONDS + LEASE_WAIT
+    while shared is not None and not shared.acquire_lease(source, key):
+        # Another worker is fetching this key; use its result, or take the lease
+        # over once it is released or expires, so waiters never fetch side by side
+        entry = shared.wait_for(
+            source, key, newer_than=newer_than,
+            timeout=max(min(LEASE_WAIT, deadline - time.time()), 0)
+        )
+        if entry is not None:
+            get_breaker(source).release()
+            with _lock:
+                _last_good[(source, key)] = entry
+            return entry[0]
+        if time.time() >= deadline:
+            get_breaker(source).release()
+            raise SourceUnavailable(f"{source} request failed: another worker holds the fetch lease")
+    try:
+        return _call(source, key, fetch)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        raise SourceUnavailable(f"{source} request failed: {str(e)}") from e
+    finally:
+        if shared is not None:
+            shared.release_lease(source, key)
+
+def fetch_json(url, timeout=10):
+    """GET a JSON document through the shared HTTP session, raising on HTTP errors"""
+    response = get_http_session().get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def data_age(entries):
+    """Age in seconds of the oldest value served for the given (source, key) pairs, or None"""
+    with _lock:
+        fetched = [_last_good[entry][1] for entry in entries if entry in _last_good]
+    if not fetched:
+        return None
+    return time.time() - min(fetched)
+
+def breaker_states():
+    """State and failure count of every source's circuit breaker"""
+    with _lock:
+        return {source: {'state': breaker.state, 'failures': breaker.failures}
+                for source, breaker in _breakers.items()}
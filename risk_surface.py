@@ -0,0 +1,207 @@
+import math
+import time
+from datetime import datetime
+import numpy as np
+from records import Incident
+
+METERS_PER_DEGREE = 111320.0
+EARTH_RADIUS_M = 6371000.0
+
+# Relative weight of each incident type in the risk surface
+TYPE_WEIGHTS = {
+    'earthquake': 1.0,
+    'weather': 0.8,
+    'air_quality': 0.6,
+    'traffic': 0.5,
+}
+
+# Kernel bandwidth (meters): how far the risk of an incident type reaches
+TYPE_BANDWIDTHS = {
+    'earthquake': 30000,
+    'weather': 5000,
+    'air_quality': 5000,
+    'traffic': 400,
+}
+
+SEVERITY_WEIGHTS = {
+    'high': 1.0,
+    'medium': 0.6,
+    'low': 0.3,
+}
+
+DEFAULT_WEIGHT = 0.5
+DEFAULT_BANDWIDTH = 1000
+HALF_LIFE = 3 * 3600  # seconds until an incident's contribution halves
+
+# Surface values at or above these thresholds map to the risk labels
+RISK_THRESHOLDS = [
+    (0.6, 'high'),
+    (0.25, 'medium'),
+]
+
+def haversine_m(lat, lng, lats, lngs):
+    """Vectorized great-circle distance in meters from one point to arrays of points"""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def incident_time(value):
+    """Convert an ISO string, epoch seconds or epoch milliseconds to epoch seconds"""
+    if value is None:
+        return time.time()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return time.time()
+    # USGS reports milliseconds since the epoch
+    return value / 1000.0 if value > 1e11 else float(value)
+
+def incidents_from_alerts(alerts, location):
+    """
+    Turn disaster alerts into incidents for the risk surface
+    Alerts without their own coordinates are placed at the user's location
+    """
+    return [Incident.from_alert(alert, location) for alert in alerts]
+
+class RiskSurface:
+    """
+    Risk raster around a center point
+    Incidents are rasterised with a Gaussian kernel per type, weighted by type
+    and severity and decayed by age. The grid is stored relative to a reference
+    time so adding incidents is incremental and decay is a single scale factor.
+    """
+
+    def __init__(self, center, radius_m=10000, cell_m=250, half_life=HALF_LIFE, reference_time=None):
+        self.center = (center['lat'], center['lng'])
+        self.cell_m = cell_m
+        self.half_life = half_life
+        self.reference_time = reference_time or time.time()
+
+        n = int(math.ceil(radius_m / cell_m))
+        offsets = np.arange(-n, n + 1) * float(cell_m)
+        self._y_m = offsets
+        self._x_m = offsets
+        self._m_per_deg_lng = METERS_PER_DEGREE * max(math.cos(math.radians(self.center[0])), 1e-6)
+        self.lats = self.center[0] + offsets / METERS_PER_DEGREE
+        self.lngs = self.center[1] + offsets / self._m_per_deg_lng
+        self._grid = np.zeros((len(self.lats), len(self.lngs)))
+        self._incident_ids = set()
+        self.incident_count = 0
+
+    @classmethod
+    def from_bounds(cls, south, west, north, east, cell_m=250, **kwargs):
+        """Create a surface covering at least the given bounding box"""
+        center = {'lat': (south + north) / 2, 'lng': (west + east) / 2}
+        half_height = (north - south) / 2 * METERS_PER_DEGREE
+        half_width = (east - west) / 2 * METERS_PER_DEGREE * math.cos(math.radians(center['lat']))
+        return cls(center, radius_m=max(half_height, half_width, cell_m), cell_m=cell_m, **kwargs)
+
+    def add_incidents(self, incidents):
+        """
+        Rasterise incidents onto the grid in one vectorized pass
+        Incidents already on the grid (same id) are skipped, so every poll's
+        incidents can be added as they arrive without counting repeats twice
+        Returns: number of incidents added
+        """
+        new = []
+        for incident in incidents:
+            if incident.id:
+                if incident.id in self._incident_ids:
+                    continue
+                self._incident_ids.add(incident.id)
+            new.append(incident)
+        incidents = new
+        if not incidents:
+            return 0
+
+        lats = np.array([incident.lat for incident in incidents], dtype=float)
+        lngs = np.array([incident.lng for incident in incidents], dtype=float)
+        weights = np.array([
+            TYPE_WEIGHTS.get(incident.type, DEFAULT_WEIGHT)
+            * SEVERITY_WEIGHTS.get(incident.severity, SEVERITY_WEIGHTS['medium'])
+            for incident in incidents
+        ])
+        bandwidths = np.array([
+            TYPE_BANDWIDTHS.get(incident.type, DEFAULT_BANDWIDTH) for incident in incidents
+        ], dtype=float)
+        ages = self.reference_time - np.array([incident_time(incident.timestamp) for incident in incidents])
+        weights = weights * np.exp2(-np.maximum(ages, 0) / self.half_life)
+
+        # The Gaussian kernel is separable, so every incident is an outer product
+        # of a row and a column profile and all of them sum up in one matmul
+        dy = (lats - self.center[0]) * METERS_PER_DEGREE
+        dx = (lngs - self.center[1]) * self._m_per_deg_lng
+        inv = 1.0 / (2 * bandwidths ** 2)
+        rows = np.exp(-((self._y_m[None, :] - dy[:, None]) ** 2) * inv[:, None])
+        cols = np.exp(-((self._x_m[None, :] - dx[:, None]) ** 2) * inv[:, None])
+        self._grid += (weights[:, None] * rows).T @ cols
+        self.incident_count += len(incidents)
+        return len(incidents)
+
+    def values(self, now=None):
+        """Decayed risk grid (rows follow self.lats, columns self.lngs)"""
+        now = now or time.time()
+        return self._grid * 2.0 ** (-(now - self.reference_time) / self.half_life)
+
+    def _index(self, lats, lngs):
+        rows = np.rint((np.asarray(lats) - self.center[0]) * METERS_PER_DEGREE / self.cell_m) + len(self.lats) // 2
+        cols = np.rint((np.asarray(lngs) - self.center[1]) * self._m_per_deg_lng / self.cell_m) + len(self.lngs) // 2
+        inside = (rows >= 0) & (rows < len(self.lats)) & (cols >= 0) & (cols < len(self.lngs))
+        return rows.astype(int), cols.astype(int), inside
+
+    def query_point(self, lat, lng, now=None):
+        """Risk value at a point (0 outside the raster)"""
+        rows, cols, inside = self._index([lat], [lng])
+        if not inside[0]:
+            return 0.0
+        return float(self.values(now)[rows[0], cols[0]])
+
+    def query_points(self, lats, lngs, now=None):
+        """Risk values at arrays of points (0 outside the raster)"""
+        rows, cols, inside = self._index(lats, lngs)
+        values = np.zeros(len(rows))
+        values[inside] = self.values(now)[rows[inside], cols[inside]]
+        return values
+
+    def query_route(self, coordinates, now=None):
+        """
+        Risk along a route given as [[lat, lng], ...]
+        Returns: dict with the per-point values and their maximum and mean
+        """
+        if not coordinates:
+            return {'values': [], 'max': 0.0, 'mean': 0.0}
+        points = np.asarray(coordinates, dtype=float)
+        values = self.query_points(points[:, 0], points[:, 1], now)
+        return {'values': values.tolist(), 'max': float(values.max()), 'mean': float(values.mean())}
+
+    def query_bbox(self, south, west, north, east, now=None):
+        """
+        Risk sub-raster inside a bounding box
+        Returns: (lats, lngs, values) arrays
+        """
+        row_mask = (self.lats >= south) & (self.lats <= north)
+        col_mask = (self.lngs >= west) & (self.lngs <= east)
+        return self.lats[row_mask], self.lngs[col_mask], self.values(now)[np.ix_(row_mask, col_mask)]
+
+    def risk_level(self, lat, lng, now=None):
+        """Risk label ('low', 'medium' or 'high') at a point"""
+        value = self.query_point(lat, lng, now)
+        for threshold, label in RISK_THRESHOLDS:
+            if value >= threshold:
+                return label
+        return 'low'
+
+    def heatmap_points(self, threshold=0.05, max_points=500, now=None):
+        """
+        Raster cells worth drawing as [lat, lng, intensity] heatmap points
+        Intensities are clipped to 1.0; the weakest cells are dropped beyond max_points
+        """
+        values = self.values(now)
+        rows, cols = np.nonzero(values >= threshold)
+        if len(rows) > max_points:
+            keep = np.argsort(values[rows, cols])[-max_points:]
+            rows, cols = rows[keep], cols[keep]
+        intensities = np.minimum(values[rows, cols], 1.0)
+        return np.column_stack([self.lats[rows], self.lngs[cols], intensities]).tolist()
@@ -0,0 +1,269 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from startup import lazy_import
+from risk_surface import RiskSurface, incidents_from_alerts, incident_time
+from records import Incident
+from alert_bus import cell_center
+
+folium = lazy_import('folium')
+folium_utilities = lazy_import('folium.utilities')
+
+TILE_ZOOM = 12  # roughly 10km wide tiles, about one city district each
+TILE_RESOLUTION = 32  # raster cells per tile side
+CACHE_SIZE = 512  # tiles kept in the LRU cache
+INCIDENT_MAX_AGE = 24 * 3600  # seconds before an incident leaves the store
+REGION_MAX_AGE = 3600  # seconds before an unvisited region stops being regenerated
+
+def lat_lng_to_tile(lat, lng, zoom):
+    """Slippy map (z/x/y) tile containing a point"""
+    n = 2 ** zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(max(min(lat, 85.0511), -85.0511))
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bounds(zoom, x, y):
+    """Bounds of a tile as (south, west, north, east)"""
+    n = 2 ** zoom
+
+    def tile_lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return tile_lat(y + 1), x / n * 360.0 - 180.0, tile_lat(y), (x + 1) / n * 360.0 - 180.0
+
+def incident_key(incident):
+    """Identity of an incident in the store"""
+    return incident.id or (incident.type, round(incident.lat, 5), round(incident.lng, 5))
+
+def canonical_incident(incident):
+    """
+    The fields of an incident the risk tiles render, in one form
+    The alert bus and the heatmap panel report the same event with different
+    labels and timestamp formats; both map to the same canonical incident
+    """
+    return Incident(
+        lat=float(incident.lat),
+        lng=float(incident.lng),
+        type=incident.type,
+        severity=incident.severity,
+        timestamp=None if incident.timestamp is None else incident_time(incident.timestamp),
+        id=incident.id
+    )
+
+def incident_signature(incident):
+    """What makes a stored incident change the tiles: id, position, severity and type"""
+    return (incident.id, round(incident.lat, 5), round(incident.lng, 5), incident.severity, incident.type)
+
+class IncidentStore:
+    """Process-wide store of live incidents with a version bumped on every change"""
+
+    def __init__(self, max_age=INCIDENT_MAX_AGE):
+        self.max_age = max_age
+        self.version = 0
+        self._incidents = {}
+        self._changed = threading.Condition()
+
+    def add(self, incidents):
+        """Add or refresh incidents; returns True if the store changed"""
+        now = time.time()
+        changed = False
+        with self._changed:
+            for incident in incidents:
+                incident = canonical_incident(incident)
+                key = incident_key(incident)
+                previous = self._incidents.get(key)
+                if previous is None or incident_signature(previous['incident']) != incident_signature(incident):
+                    changed = True
+                else:
+                    # Unchanged: keep the stored incident so the rendered tiles stay valid
+                    incident = previous['incident']
+                self._incidents[key] = {'incident': incident, 'seen': now}
+            for key, entry in list(self._incidents.items()):
+                if now - entry['seen'] > self.max_age:
+                    del self._incidents[key]
+                    changed = True
+            if changed:
+                self.version += 1
+                self._changed.notify_all()
+        return changed
+
+    def snapshot(self):
+        """Current incidents and the store version they belong to"""
+        with self._changed:
+            return [entry['incident'] for entry in self._incidents.values()], self.version
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until the store version differs from version (or timeout)"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+class TileCache:
+    """Thread-safe LRU cache of rendered tiles"""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.stats['misses'] += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.stats['hits'] += 1
+            return tile
+
+    def put(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_size:
+                self._tiles.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def __len__(self):
+        return len(self._tiles)
+
+def risk_colormap(values):
+    """Map risk values to RGBA pixels: transparent green for no risk up to opaque red"""
+    v = np.clip(values, 0.0, 1.0)
+    rgba = np.zeros(v.shape + (4,))
+    rgba[..., 0] = np.clip(2 * v, 0, 1)
+    rgba[..., 1] = np.clip(2 * (1 - v), 0, 1)
+    rgba[..., 3] = np.where(v < 0.05, 0.0, np.clip(v * 1.5, 0.2, 0.7))
+    return rgba
+
+def render_tile_values(zoom, x, y, incidents):
+    """Risk raster of one tile, TILE_RESOLUTION square with the north row first"""
+    south, west, north, east = tile_bounds(zoom, x, y)
+    cell_m = (north - south) * 111320.0 / TILE_RESOLUTION
+    surface = RiskSurface.from_bounds(south, west, north, east, cell_m=cell_m)
+    surface.add_incidents(incidents)
+
+    # Sample the surface at the tile's pixel centers
+    lats = np.linspace(north, south, TILE_RESOLUTION)
+    lngs = np.linspace(west, east, TILE_RESOLUTION)
+    grid_lat, grid_lng = np.meshgrid(lats, lngs, indexing='ij')
+    values = surface.query_points(grid_lat.ravel(), grid_lng.ravel()).reshape(TILE_RESOLUTION, TILE_RESOLUTION)
+    return values.astype(np.float32)
+
+def render_tile(zoom, x, y, incidents):
+    """
+    Render one risk tile
+    Returns: dict with the tile bounds, its risk raster and a PNG data URL for map overlays
+    """
+    values = render_tile_values(zoom, x, y, incidents)
+    return {
+        'bounds': tile_bounds(zoom, x, y),
+        'values': values,
+        'image': folium_utilities.image_to_url(risk_colormap(values))
+    }
+
+class RiskTileService:
+    """
+    Precomputed risk tiles for the regions users are active in
+    Sessions register their region; a background job regenerates the tiles of
+    active regions whenever the incident store changes and keeps them in an LRU
+    cache, so overlaying them on a map costs a cache lookup per tile
+    """
+
+    def __init__(self, store=None, cache=None, zoom=TILE_ZOOM):
+        self.store = store or IncidentStore()
+        self.cache = cache or TileCache()
+        self.zoom = zoom
+        self._regions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def region_tiles(self, location, radius_tiles=1):
+        """Tiles covering a location and its neighbourhood"""
+        cx, cy = lat_lng_to_tile(location['lat'], location['lng'], self.zoom)
+        return [
+            (self.zoom, cx + dx, cy + dy)
+            for dy in range(-radius_tiles, radius_tiles + 1)
+            for dx in range(-radius_tiles, radius_tiles + 1)
+        ]
+
+    def register_region(self, location):
+        """Mark the tiles around a location as active and start the regeneration job"""
+        now = time.time()
+        with self._lock:
+            for tile in self.region_tiles(location):
+                self._regions[tile] = now
+        self._ensure_running()
+
+    def active_tiles(self):
+        now = time.time()
+        with self._lock:
+            for tile, seen in list(self._regions.items()):
+                if now - seen > REGION_MAX_AGE:
+                    del self._regions[tile]
+            return list(self._regions)
+
+    def get_tile(self, zoom, x, y):
+        """Cached tile for the current incident version, rendered on a miss"""
+        incidents, version = self.store.snapshot()
+        tile = self.cache.get((zoom, x, y, version))
+        if tile is None:
+            tile = render_tile(zoom, x, y, incidents)
+            self.cache.put((zoom, x, y, version), tile)
+        return tile
+
+    def regenerate(self):
+        """Render every active tile for the current incident version"""
+        for zoom, x, y in self.active_tiles():
+            self.get_tile(zoom, x, y)
+
+    def _run(self):
+        version = None
+        while True:
+            self.regenerate()
+            version = self.store.wait_for_change(self.store.version if version is None else version,
+                                                 timeout=REGION_MAX_AGE)
+            if not self.active_tiles():
+                with self._lock:
+                    self._thread = None
+                return
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="risk-tiles", daemon=True)
+                self._thread.start()
+
+    def add_layer(self, folium_map, location, name="Risk Tiles"):
+        """Overlay the cached risk tiles around a location on a folium map"""
+        self.register_region(location)
+        layer = folium.FeatureGroup(name=name)
+        for zoom, x, y in self.region_tiles(location):
+            tile = self.get_tile(zoom, x, y)
+            south, west, north, east = tile['bounds']
+            folium.raster_layers.ImageOverlay(
+                image=tile['image'],
+                bounds=[[south, west], [north, east]],
+                opacity=0.6
+            ).add_to(layer)
+        layer.add_to(folium_map)
+        return folium_map
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_risk_tile_service():
+    """Process-wide risk tile service"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RiskTileService()
+        return _service
+
+def store_alert_incidents(cell, alerts, changed):
+    """Alert bus listener feeding polled alerts into the incident store"""
+    get_risk_tile_service().store.add(incidents_from_alerts(alerts, cell_center(cell)))
@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+import types
+from collections import deque
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Memory budget (bytes) of one session's state; override with SESSION_MEMORY_BUDGET
+SESSION_BUDGET = int(os.getenv('SESSION_MEMORY_BUDGET', 2 * 1024 * 1024))
+REPORT_TIMEOUT = 600  # seconds before a session that stopped rerunning leaves the report
+
+# Bounds applied to list entries when a session is over its budget
+ALERTS_KEPT = 20
+
+def deep_sizeof(obj):
+    """
+    Deep size in bytes of an object and everything it references
+    Follows containers, instance dicts and __slots__; shared objects are counted once
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        # Code and modules are shared by the whole process, not owned by the session
+        if isinstance(current, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            # NumPy arrays report their buffer in getsizeof and have nothing else to follow
+            if hasattr(current, 'nbytes'):
+                continue
+            if hasattr(current, '__dict__'):
+                stack.append(vars(current))
+            for cls in type(current).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(current, name):
+                        stack.append(getattr(current, name))
+    return size
+
+def _keep_newest(limit):
+    """Compactor for lists kept newest first"""
+    def compact(state, key, excess):
+        state[key] = state[key][:limit]
+    return compact
+
+def _evict_products(state, key, excess):
+    """Drop the least recently computed products until excess bytes are freed"""
+    cache = state[key]
+    entries = sorted(cache.items(), key=lambda item: item[1]['location'].timestamp)
+    freed = 0
+    for cache_key, entry in entries:
+        if freed >= excess:
+            break
+        freed += deep_sizeof(entry)
+        del cache[cache_key]
+
+def _drop(state, key, excess):
+    state[key] = None
+
+# Entries compacted when a session is over its budget, cheapest to rebuild first
+# (location_history is a fixed-capacity trajectory and needs no compaction)
+COMPACTORS = [
+    ('alerts', _keep_newest(ALERTS_KEPT)),
+    ('product_cache', _evict_products),
+    ('route_info', _drop),
+]
+
+_reports = {}
+_reports_lock = threading.Lock()
+
+def measure_state(state):
+    """Deep size in bytes of every entry of a session state"""
+    return {key: deep_sizeof(state[key]) for key in list(state.keys())}
+
+def enforce_budget(state, budget=SESSION_BUDGET):
+    """
+    Compact entries of an over-budget session state in COMPACTORS order
+    Returns: (entry sizes after compaction, names of the compacted entries)
+    """
+    sizes = measure_state(state)
+    compacted = []
+    for key, compact in COMPACTORS:
+        excess = sum(sizes.values()) - budget
+        if excess <= 0:
+            break
+        if state.get(key) is None:
+            continue
+        compact(state, key, excess)
+        sizes[key] = deep_sizeof(state[key])
+        compacted.append(key)
+    return sizes, compacted
+
+def account_session(budget=SESSION_BUDGET):
+    """Measure the current session's state, enforce its budget and record it in the process report"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    sizes, compacted = enforce_budget(st.session_state, budget)
+    now = time.time()
+    with _reports_lock:
+        previous = _reports.get(ctx.session_id)
+        report = {
+            'total': sum(sizes.values()),
+            'entries': sizes,
+            'budget': budget,
+            'compactions': (previous['compactions'] if previous else 0) + len(compacted),
+            'updated': now
+        }
+        _reports[ctx.session_id] = report
+        for session_id in [session_id for session_id, other in _reports.items()
+                           if now - other['updated'] > REPORT_TIMEOUT]:
+            del _reports[session_id]
+    return report
+
+def memory_report(top=5):
+    """Aggregate footprint of all live sessions, with the heaviest sessions and entries"""
+    with _reports_lock:
+        reports = dict(_reports)
+    entries = {}
+    for report in reports.values():
+        for key, size in report['entries'].items():
+            entries[key] = entries.get(key, 0) + size
+    return {
+        'sessions': len(reports),
+        'total': sum(report['total'] for report in reports.values()),
+        'compactions': sum(report['compactions'] for report in reports.values()),
+        'largest_sessions': sorted(((session_id, report['total']) for session_id, report in reports.items()),
+                                   key=lambda item: item[1], reverse=True)[:top],
+        'largest_entries': sorted(entries.items(), key=lambda item: item[1], reverse=True)[:top]
+    }
@@ -0,0 +1,186 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from codec import encode, decode
+
+# SQLite file shared by all SafeSphere processes on the host; set SAFESPHERE_SHARED_CACHE=off to disable
+CACHE_PATH = os.getenv('SAFESPHERE_SHARED_CACHE', os.path.join('offline_data', 'shared_cache.sqlite3'))
+LEASE_SECONDS = 15  # how long a fetch lease is held before another process may take over
+LEASE_WAIT = 5  # seconds a process waits for another one's inline fetch before fetching itself
+PRUNE_INTERVAL = 600  # seconds between sweeps of entries older than max_age
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (source, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (source, key)
+) WITHOUT ROWID;
+"""
+
+class SharedCache:
+    """
+    Cross-process cache of upstream source values in SQLite (WAL mode)
+    Every worker on the host reads and writes the same file, so a value fetched by
+    one process is a hit in all others. Leases give single-flight fetches across
+    processes and threads: only the lease owner fetches a key, others wait for
+    its result. Values must be JSON-like; they are stored compactly encoded (codec.encode).
+    """
+
+    def __init__(self, path=CACHE_PATH, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        self._next_prune = 0
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'lease_waits': 0, 'errors': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One connection per thread; sqlite3 connections must not be shared between threads"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    @staticmethod
+    def _owner():
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def get(self, source, key):
+        """(value, fetched_at) of a key, or None"""
+        try:
+            row = self._connection().execute(
+                "SELECT value, fetched_at FROM entries WHERE source = ? AND key = ?",
+                (source, self._key(key))
+            ).fetchone()
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+            return None
+        if row is None or time.time() - row[1] > self.max_age:
+            self.stats['misses'] += 1
+            return None
+        try:
+            value = decode(row[0])
+        except (ValueError, zlib.error):
+            # Written by a process with a codec this one lacks
+            self.stats['errors'] += 1
+            return None
+        self.stats['hits'] += 1
+        return value, row[1]
+
+    def put(self, source, key, value, fetched_at=None):
+        """Store a value for every process and release the caller's lease on it"""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        try:
+            payload = encode(value)
+        except (TypeError, ValueError):
+            # Values that are not JSON stay in the process-local cache only
+            return False
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (source, key) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at "
+                "WHERE excluded.fetched_at > entries.fetched_at",
+                (source, self._key(key), payload, fetched_at)
+            )
+            connection.execute(
+                "DELETE FROM leases WHERE source = ? AND key = ? AND owner = ?",
+                (source, self._key(key), self._owner())
+            )
+            self.stats['writes'] += 1
+            self._prune()
+            return True
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+            return False
+
+    def acquire_lease(self, source, key, seconds=LEASE_SECONDS):
+        """Try to become the only fetcher of a key; True if this thread holds the lease"""
+        now = time.time()
+        owner = self._owner()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT INTO leases VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (source, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                (source, self._key(key), owner, now + seconds, now)
+            )
+            row = connection.execute(
+                "SELECT owner FROM leases WHERE source = ? AND key = ?", (source, self._key(key))
+            ).fetchone()
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+            # Without the database every thread fetches for itself
+            return True
+        return row is not None and row[0] == owner
+
+    def release_lease(self, source, key):
+        """Give up a lease without storing a value (e.g. the fetch failed)"""
+        try:
+            self._connection().execute(
+                "DELETE FROM leases WHERE source = ? AND key = ? AND owner = ?",
+                (source, self._key(key), self._owner())
+            )
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+
+    def wait_for(self, source, key, newer_than=0, timeout=LEASE_WAIT, poll=0.1):
+        """Wait for another process's fetch of a key; (value, fetched_at) or None on timeout"""
+        self.stats['lease_waits'] += 1
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            entry = self.get(source, key)
+            if entry is not None and entry[1] > newer_than:
+                return entry
+            time.sleep(poll)
+        return None
+
+    def _prune(self):
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        connection = self._connection()
+        connection.execute("DELETE FROM entries WHERE fetched_at < ?", (now - self.max_age,))
+        connection.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+
+_cache = None
+_cache_lock = threading.Lock()
+_disabled = False
+
+def get_shared_cache():
+    """Process-wide handle on the shared cache, or None if it is disabled or unavailable"""
+    global _cache, _disabled
+    with _cache_lock:
+        if _cache is None and not _disabled:
+            if CACHE_PATH.lower() in ('', 'off', '0', 'false'):
+                _disabled = True
+            else:
+                try:
+                    _cache = SharedCache(CACHE_PATH)
+                except (sqlite3.Error, OSError):
+                    _disabled = True
+        return _cache
@@ -0,0 +1,87 @@
+import importlib
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Heavy third-party modules SafeSphere defers until first use
+HEAVY_MODULES = [
+    'folium',
+    'folium.plugins',
+    'streamlit_folium',
+    'googlemaps',
+    'groq',
+    'geopy.geocoders',
+    'vaderSentiment.vaderSentiment',
+]
+# numpy is not listed: risk_surface, trajectory, geofence and others use it at import time
+
+# Time (seconds) spent on deferred imports and client construction in this process
+STARTUP_COSTS = {}
+_costs_lock = threading.Lock()
+
+def record_startup_cost(name, seconds):
+    """Record how long a deferred import or client construction took"""
+    with _costs_lock:
+        STARTUP_COSTS[name] = seconds
+
+class LazyModule:
+    """
+    Module proxy that imports the real module on first attribute access
+    Works for submodules such as folium.plugins without importing the parent early
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            record_startup_cost(f"import {self._name}", time.perf_counter() - start)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    """Return the module if it is already imported, otherwise a proxy importing it on first use"""
+    return sys.modules.get(name) or LazyModule(name)
+
+def measure_import_time(module):
+    """
+    Cumulative import time of a module in a fresh interpreter, like `python -X importtime`
+    Returns: seconds, or None if the module cannot be imported
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        return None
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    pattern = re.compile(r'import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)')
+    for line in reversed(result.stderr.splitlines()):
+        match = pattern.search(line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1e6
+    return None
+
+def import_time_report(modules=None):
+    """Cold import cost of each module, slowest first"""
+    report = [(module, measure_import_time(module)) for module in (modules or HEAVY_MODULES)]
+    return sorted(report, key=lambda item: item[1] or 0, reverse=True)
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or HEAVY_MODULES + ['groq_api', 'maps']
+    print(f"{'module':<32} {'cold import (ms)':>16}")
+    for module, seconds in import_time_report(modules):
+        cost = f"{seconds * 1000:.1f}" if seconds is not None else "failed"
+        print(f"{module:<32} {cost:>16}")
@@ -0,0 +1,235 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from risk_tiles import lat_lng_to_tile
+
+TILE_CACHE_PATH = os.getenv('TILE_CACHE_PATH', os.path.join('offline_data', 'tiles.mbtiles'))
+TILE_SERVER_HOST = os.getenv('TILE_SERVER_HOST', '127.0.0.1')
+TILE_SERVER_PORT = int(os.getenv('TILE_SERVER_PORT', '8765'))
+# Base URL the browser loads tiles from; set it when the app is not viewed on the server itself
+TILE_SERVER_URL = os.getenv('TILE_SERVER_URL', f"http://{TILE_SERVER_HOST}:{TILE_SERVER_PORT}")
+UPSTREAM_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+ATTRIBUTION = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+# The OSM tile usage policy requires an identifying User-Agent and modest parallelism
+USER_AGENT = "SafeSphere/1.0 (offline tile cache)"
+SEED_WORKERS = 2
+MAX_SEED_TILES = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+) WITHOUT ROWID;
+"""
+
+class TileStore:
+    """
+    Map tiles in an MBTiles (SQLite) file keyed by z/x/y
+    Lookups are a primary key read, well under a millisecond. Misses can be
+    fetched from OpenStreetMap and stored (read-through) unless offline.
+    """
+
+    def __init__(self, path=TILE_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.stats = {'hits': 0, 'misses': 0, 'fetched': 0, 'fetch_errors': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT OR IGNORE INTO metadata VALUES (?, ?)", [
+            ('name', 'SafeSphere base map'), ('format', 'png'), ('type', 'baselayer'),
+            ('version', '1'), ('attribution', ATTRIBUTION)
+        ])
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row(zoom, y):
+        # MBTiles rows count from the south (TMS), slippy map y from the north
+        return (1 << zoom) - 1 - y
+
+    def get(self, zoom, x, y):
+        """PNG bytes of a tile, or None"""
+        row = self._connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, self._row(zoom, y))
+        ).fetchone()
+        self.stats['hits' if row else 'misses'] += 1
+        return row[0] if row else None
+
+    def has(self, zoom, x, y):
+        return self._connection().execute(
+            "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, self._row(zoom, y))
+        ).fetchone() is not None
+
+    def put(self, zoom, x, y, data):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, self._row(zoom, y), data)
+        )
+
+    def fetch(self, zoom, x, y):
+        """Fetch a tile from upstream and store it; returns its bytes or None"""
+        from clients import get_http_session
+
+        try:
+            response = get_http_session().get(UPSTREAM_URL.format(z=zoom, x=x, y=y),
+                                              headers={'User-Agent': USER_AGENT}, timeout=10)
+            response.raise_for_status()
+        except Exception:
+            self.stats['fetch_errors'] += 1
+            return None
+        self.put(zoom, x, y, response.content)
+        self.stats['fetched'] += 1
+        return response.content
+
+    def get_or_fetch(self, zoom, x, y, offline=False):
+        data = self.get(zoom, x, y)
+        if data is None and not offline:
+            data = self.fetch(zoom, x, y)
+        return data
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+def bbox_tiles(south, west, north, east, zooms):
+    """(zoom, x, y) of every tile covering a bounding box at the given zoom levels"""
+    for zoom in zooms:
+        x0, y0 = lat_lng_to_tile(north, west, zoom)
+        x1, y1 = lat_lng_to_tile(south, east, zoom)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield zoom, x, y
+
+def seed(store, south, west, north, east, zooms, max_tiles=MAX_SEED_TILES, progress=None):
+    """
+    Download the tiles of a bounding box that are not cached yet
+    Returns: (tiles fetched, tiles already cached); raises ValueError above max_tiles
+    """
+    tiles = list(bbox_tiles(south, west, north, east, zooms))
+    if len(tiles) > max_tiles:
+        raise ValueError(f"{len(tiles)} tiles requested, more than the {max_tiles} allowed; use fewer zoom levels")
+    missing = [tile for tile in tiles if not store.has(*tile)]
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=SEED_WORKERS, thread_name_prefix="tile-seed") as executor:
+        for index, data in enumerate(executor.map(lambda tile: store.fetch(*tile), missing)):
+            fetched += data is not None
+            if progress and index % 50 == 0:
+                progress(f"Map tiles {index + 1}/{len(missing)}")
+    return fetched, len(tiles) - len(missing)
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    server_version = "SafeSphereTiles/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        try:
+            if len(parts) != 4 or parts[0] != 'tiles' or not parts[3].endswith('.png'):
+                raise ValueError
+            zoom, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+        except ValueError:
+            self._send(404, b'', 'text/plain')
+            return
+        offline = parse_qs(url.query).get('offline', ['0'])[0] == '1'
+        data = self.server.store.get_or_fetch(zoom, x, y, offline=offline)
+        if data is None:
+            self._send(404, b'', 'text/plain')
+        else:
+            self._send(200, data, 'image/png')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'public, max-age=86400' if status == 200 else 'no-store')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TileServer(ThreadingHTTPServer):
+    """Local tile endpoint: GET /tiles/{z}/{x}/{y}.png[?offline=1]"""
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        super().__init__(address, TileRequestHandler)
+        self.store = store
+
+_store = None
+_server = None
+_tiles_lock = threading.Lock()
+
+def get_tile_store():
+    """Process-wide tile store"""
+    global _store
+    with _tiles_lock:
+        if _store is None:
+            _store = TileStore()
+        return _store
+
+def ensure_tile_server():
+    """
+    Start the local tile server in a background thread, once per process
+    Returns False if it could not start; when another worker already serves
+    the port it uses the same MBTiles file, so the maps work either way
+    """
+    global _server
+    store = get_tile_store()
+    with _tiles_lock:
+        if _server is None:
+            try:
+                _server = TileServer((TILE_SERVER_HOST, TILE_SERVER_PORT), store)
+            except OSError:
+                return False
+            threading.Thread(target=_server.serve_forever, name="tile-server", daemon=True).start()
+        return True
+
+def tile_url(offline=False):
+    """Leaflet URL template of the local tile endpoint"""
+    return f"{TILE_SERVER_URL}/tiles/{{z}}/{{x}}/{{y}}.png" + ("?offline=1" if offline else "")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafeSphere map tile cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_command = commands.add_parser('seed', help="download the tiles of a bounding box")
+    seed_command.add_argument('--bbox', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'), required=True)
+    seed_command.add_argument('--zooms', default='10-14', help="zoom levels, e.g. 10-14")
+    commands.add_parser('serve', help="run the local tile server in the foreground")
+    args = parser.parse_args()
+
+    tile_store = get_tile_store()
+    if args.command == 'seed':
+        first, _, last = args.zooms.partition('-')
+        start = time.time()
+        fetched, cached = seed(tile_store, *args.bbox, range(int(first), int(last or first) + 1), progress=print)
+        print(f"Fetched {fetched} tiles ({cached} already cached) in {time.time() - start:.1f}s")
+    else:
+        server = TileServer((TILE_SERVER_HOST, TILE_SERVER_PORT), tile_store)
+        print(f"Serving {TILE_CACHE_PATH} on {tile_url()}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,151 @@
+import math
+import numpy as np
+from risk_surface import EARTH_RADIUS_M
+
+TRAJECTORY_CAPACITY = 3600  # fixes kept per session, one hour at one fix per second
+
+def pairwise_haversine_m(lats, lngs):
+    """Great-circle distance in meters between consecutive points"""
+    lat, lng = np.radians(lats), np.radians(lngs)
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def pairwise_bearing(lats, lngs):
+    """Initial bearing in degrees (0 = north, clockwise) between consecutive points"""
+    lat, lng = np.radians(lats), np.radians(lngs)
+    dlng = np.diff(lng)
+    y = np.sin(dlng) * np.cos(lat[1:])
+    x = np.cos(lat[:-1]) * np.sin(lat[1:]) - np.sin(lat[:-1]) * np.cos(lat[1:]) * np.cos(dlng)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+class Trajectory:
+    """
+    Fixed-capacity ring buffer of location fixes
+    Columns (t, lat, lng, accuracy) live in preallocated NumPy arrays, so appending
+    is O(1) and memory stays constant however long tracking runs; once full the
+    oldest fixes are overwritten
+    """
+
+    def __init__(self, capacity=TRAJECTORY_CAPACITY):
+        self.capacity = capacity
+        self._t = np.zeros(capacity)
+        self._lat = np.zeros(capacity)
+        self._lng = np.zeros(capacity)
+        self._accuracy = np.full(capacity, np.nan)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, t, lat, lng, accuracy=None):
+        """Add a fix; fixes must arrive in time order"""
+        i = self._next
+        self._t[i] = t
+        self._lat[i] = lat
+        self._lng[i] = lng
+        self._accuracy[i] = np.nan if accuracy is None else accuracy
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def append_location(self, location):
+        """Add a location dict, skipping it if it repeats the latest fix"""
+        t = location.get('timestamp')
+        if t is None or (self._size and t <= self._t[self._next - 1]):
+            return False
+        self.append(t, location['lat'], location['lng'], location.get('accuracy'))
+        return True
+
+    def _order(self, last=None):
+        """Buffer indices of the last n fixes (all by default), oldest first"""
+        n = self._size if last is None else min(last, self._size)
+        return (np.arange(self._next - n, self._next)) % self.capacity
+
+    def columns(self, last=None, since=None):
+        """
+        Fixes oldest first as a dict of arrays t, lat, lng, accuracy
+        Limited to the last `last` fixes and/or those at or after time `since`
+        """
+        order = self._order(last)
+        if since is not None:
+            order = order[self._t[order] >= since]
+        return {
+            't': self._t[order],
+            'lat': self._lat[order],
+            'lng': self._lng[order],
+            'accuracy': self._accuracy[order]
+        }
+
+    def latest(self):
+        """Most recent fix as a location dict, or None"""
+        if not self._size:
+            return None
+        i = self._next - 1
+        return {'timestamp': float(self._t[i]), 'lat': float(self._lat[i]), 'lng': float(self._lng[i]),
+                'accuracy': None if math.isnan(self._accuracy[i]) else float(self._accuracy[i])}
+
+    def speeds(self, last=None, since=None):
+        """Speed in m/s of every segment of the window"""
+        fixes = self.columns(last, since)
+        if len(fixes['t']) < 2:
+            return np.zeros(0)
+        dt = np.diff(fixes['t'])
+        distances = pairwise_haversine_m(fixes['lat'], fixes['lng'])
+        return np.divide(distances, dt, out=np.zeros_like(distances), where=dt > 0)
+
+    def headings(self, last=None, since=None):
+        """Heading in degrees of every segment of the window"""
+        fixes = self.columns(last, since)
+        if len(fixes['t']) < 2:
+            return np.zeros(0)
+        return pairwise_bearing(fixes['lat'], fixes['lng'])
+
+    def smoothed(self, window=5, last=None, since=None):
+        """Positions smoothed with a centered moving average over `window` fixes"""
+        fixes = self.columns(last, since)
+        if len(fixes['t']) < window or window < 2:
+            return fixes
+        kernel = np.ones(window) / window
+        # Pad with the edge values so the ends are not pulled towards zero
+        pad = (window // 2, window - 1 - window // 2)
+        return dict(
+            fixes,
+            lat=np.convolve(np.pad(fixes['lat'], pad, mode='edge'), kernel, mode='valid'),
+            lng=np.convolve(np.pad(fixes['lng'], pad, mode='edge'), kernel, mode='valid')
+        )
+
+    def downsample(self, max_points=200, last=None, since=None):
+        """At most max_points fixes evenly spread over the window, always keeping the latest"""
+        fixes = self.columns(last, since)
+        n = len(fixes['t'])
+        if n <= max_points:
+            return fixes
+        keep = np.unique(np.linspace(0, n - 1, max_points).round().astype(int))
+        return {name: column[keep] for name, column in fixes.items()}
+
+    def movement_metrics(self, window_seconds=60):
+        """
+        Distance, elapsed time, average and current speed and heading over the last window_seconds
+        Returns: dict, or None with fewer than two fixes in the window
+        """
+        if not self._size:
+            return None
+        fixes = self.columns(since=self._t[self._next - 1] - window_seconds)
+        if len(fixes['t']) < 2:
+            return None
+        distances = pairwise_haversine_m(fixes['lat'], fixes['lng'])
+        elapsed = fixes['t'][-1] - fixes['t'][0]
+        last_dt = fixes['t'][-1] - fixes['t'][-2]
+        return {
+            'distance': float(distances.sum()),
+            'time_elapsed': float(elapsed),
+            'speed': float(distances.sum() / elapsed) if elapsed > 0 else 0.0,
+            'current_speed': float(distances[-1] / last_dt) if last_dt > 0 else 0.0,
+            'heading': float(pairwise_bearing(fixes['lat'][-2:], fixes['lng'][-2:])[0])
+        }
+
+    def to_coordinates(self, max_points=200):
+        """Downsampled [lat, lng] pairs for drawing the track on a map"""
+        fixes = self.downsample(max_points)
+        return np.column_stack((fixes['lat'], fixes['lng'])).tolist()
@@ -0,0 +1,110 @@
+import os
+import threading
+from datetime import datetime
+from resilience import fetch_source, fetch_json, location_key, FRESH_FOR
+from alert_store import make_alert_id
+from records import Alert
+from clients import registry
+
+WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lng}&appid={key}&units=metric"
+AIR_URL = "http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lng}&appid={key}"
+WEATHER_TTL = FRESH_FOR  # seconds a cell's payload is served before it is revalidated
+
+weather_stats = {'views': 0, 'fetches': 0}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        weather_stats[name] += 1
+
+def _fetch(url_template, cell):
+    """Fetch a payload for a cell, counting the upstream request"""
+    _count('fetches')
+    return fetch_json(url_template.format(lat=cell[0], lng=cell[1], key=os.getenv('OPENWEATHER_API_KEY')))
+
+def get_weather_report(location, include_air=False, fresh_for=WEATHER_TTL):
+    """
+    Raw OpenWeather payloads of a location's ~100m cell, fetched once per cell and TTL
+    Every weather view is derived from this, so a rerun showing all of them makes at
+    most one weather (and one air pollution) request. Raises like fetch_source.
+    Returns: {'weather': current weather payload, 'air': air pollution payload or None}
+    ('air' is also None when it was requested but could not be fetched)
+    """
+    _count('views')
+    cell = location_key(location)
+    report = {
+        'weather': fetch_source('openweather', cell, lambda: _fetch(WEATHER_URL, cell), fresh_for=fresh_for),
+        'air': None
+    }
+    if include_air:
+        try:
+            report['air'] = fetch_source('openweather_air', cell, lambda: _fetch(AIR_URL, cell), fresh_for=fresh_for)
+        except Exception as e:
+            # Air quality is an extra; the weather views do not depend on it
+            registry.record_error('http', e)
+    return report
+
+def conditions(payload):
+    """Sidebar summary of a current weather payload"""
+    return {
+        'temperature': payload['main']['temp'],
+        'humidity': payload['main']['humidity'],
+        'description': payload['weather'][0]['description'],
+        'wind_speed': payload['wind']['speed']
+    }
+
+def official_alerts(payload):
+    """Alerts issued by OpenWeather, identified by their event and start time"""
+    return [
+        Alert(
+            id=make_alert_id('openweather', alert.get('event'), alert.get('start')),
+            type='weather',
+            severity='medium',
+            message=alert.get('description', ''),
+            event=alert.get('event', ''),
+            timestamp=datetime.fromtimestamp(alert['start']).isoformat() if alert.get('start') else None,
+            expires_at=alert.get('end')
+        )
+        for alert in payload.get('alerts', [])
+    ]
+
+def threshold_alerts(report, location):
+    """Heat, freeze, humidity and air quality alerts derived from a report"""
+    alerts = []
+    # Location-derived alerts are identified by their ~100m cell so repeated polls map to the same alert
+    cell = location_key(location)
+
+    def alert(kind, source, message, severity, alert_type='weather'):
+        alerts.append(Alert(
+            message=message,
+            severity=severity,
+            type=alert_type,
+            lat=location['lat'],
+            lng=location['lng'],
+            id=make_alert_id(source, kind, *cell)
+        ))
+
+    weather = report.get('weather') or {}
+    if 'main' in weather:
+        temp = weather['main']['temp']
+        humidity = weather['main']['humidity']
+        if temp > 35:
+            alert('heat', 'openweather',
+                  f'Extreme heat warning: {temp}°C. Stay hydrated and avoid outdoor activities.', 'high')
+        elif temp < 0:
+            alert('freeze', 'openweather',
+                  f'Freezing temperature alert: {temp}°C. Take precautions against cold.', 'high')
+        if humidity > 85:
+            alert('humidity', 'openweather',
+                  f'High humidity warning: {humidity}%. Air quality may be affected.', 'medium')
+
+    air = report.get('air') or {}
+    if air.get('list'):
+        aqi = air['list'][0]['main']['aqi']
+        if aqi >= 4:
+            alert('aqi', 'openweather_air',
+                  'Poor air quality detected. Sensitive groups should stay indoors.', 'high', 'air_quality')
+        elif aqi == 3:
+            alert('aqi', 'openweather_air',
+                  'Moderate air quality. Consider reducing outdoor activities.', 'medium', 'air_quality')
+    return alerts